@@ -0,0 +1,215 @@
+"""
+MongoDB Index Manager
+Declares the indexes each collection needs, creates the missing ones and
+reports indexes that are declared but missing or present but never used.
+"""
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+
+# Indexes for collections with a fixed name
+COLLECTION_INDEXES = {
+    'students': [
+        {'keys': [('student_id', ASCENDING)], 'name': 'student_id_1'},
+        # Duplicate registration checks rely on these two unique indexes (REGISTRATION_UNIQUE_INDEXES)
+        {'keys': [('email', ASCENDING)], 'name': 'email_1', 'unique': True},
+        {'keys': [('juApplication', ASCENDING)], 'name': 'juApplication_1', 'unique': True,
+         'partialFilterExpression': {'juApplicationConfirmed': True}},
+        {'keys': [('department', ASCENDING), ('created_at', DESCENDING)], 'name': 'department_1_created_at_-1'},
+        # Finds the student owning a local storage folder before serving its files
+        {'keys': [('documentsFolder', ASCENDING)], 'name': 'documentsFolder_1'},
+    ],
+    'documents': [
+        {'keys': [('student_id', ASCENDING)], 'name': 'student_id_1'},
+    ],
+    'otp': [
+        {'keys': [('phone', ASCENDING), ('otp', ASCENDING)], 'name': 'phone_1_otp_1'},
+    ],
+    'admins': [
+        {'keys': [('email', ASCENDING)], 'name': 'email_1'},
+        {'keys': [('role', ASCENDING)], 'name': 'role_1'},
+    ],
+    'id_card_generation_logs': [
+        {'keys': [('student_id', ASCENDING), ('generated_at', DESCENDING)], 'name': 'student_id_1_generated_at_-1'},
+    ],
+    'student_list_view': [
+        {'keys': [('studentId', ASCENDING)], 'name': 'studentId_1', 'unique': True},
+        {'keys': [('createdAt', DESCENDING), ('studentId', DESCENDING)], 'name': 'createdAt_-1_studentId_-1'},
+        {'keys': [('department', ASCENDING), ('createdAt', DESCENDING), ('studentId', DESCENDING)], 'name': 'department_1_createdAt_-1_studentId_-1'},
+        {'keys': [('status', ASCENDING), ('hasPhoto', ASCENDING), ('createdAt', DESCENDING), ('studentId', DESCENDING)], 'name': 'status_1_hasPhoto_1_createdAt_-1_studentId_-1'},
+    ],
+    'jobs': [
+        {'keys': [('status', ASCENDING), ('run_at', ASCENDING)], 'name': 'status_1_run_at_1'},
+        {'keys': [('status', ASCENDING), ('lease_expires_at', ASCENDING)], 'name': 'status_1_lease_expires_at_1'},
+        {'keys': [('type', ASCENDING), ('payload.student_id', ASCENDING), ('status', ASCENDING)], 'name': 'type_1_payload.student_id_1_status_1'},
+        {'keys': [('updated_at', DESCENDING)], 'name': 'updated_at_-1'},
+    ],
+    'document_hashes': [
+        {'keys': [('student_id', ASCENDING), ('storage', ASCENDING), ('sha256', ASCENDING), ('document_type', ASCENDING)],
+         'name': 'student_id_1_storage_1_sha256_1_document_type_1', 'unique': True},
+    ],
+    'upload_sessions': [
+        # Removes abandoned sessions; their spool files are removed by 'flask --app main uploads cleanup'
+        {'keys': [('expires_at', ASCENDING)], 'name': 'expires_at_1', 'expireAfterSeconds': 0},
+    ],
+    'drive_folder_locks': [
+        # Removes locks left behind by crashed processes
+        {'keys': [('expires_at', ASCENDING)], 'name': 'expires_at_1', 'expireAfterSeconds': 0},
+    ],
+    'department_registry': [
+        {'keys': [('aliases', ASCENDING)], 'name': 'aliases_1'},
+    ],
+    'student_records': [
+        {'keys': [('department_key', ASCENDING), ('student_id', ASCENDING)], 'name': 'department_key_1_student_id_1', 'unique': True},
+        {'keys': [('student_id', ASCENDING)], 'name': 'student_id_1'},
+        {'keys': [('department_key', ASCENDING), ('email', ASCENDING)], 'name': 'department_key_1_email_1'},
+        {'keys': [('department_key', ASCENDING), ('juApplication', ASCENDING)], 'name': 'department_key_1_juApplication_1'},
+        {'keys': [('department_key', ASCENDING), ('status', ASCENDING), ('updated_at', DESCENDING)], 'name': 'department_key_1_status_1_updated_at_-1'},
+        {'keys': [('department_key', ASCENDING), ('created_at', ASCENDING), ('student_id', ASCENDING)], 'name': 'department_key_1_created_at_1_student_id_1'},
+    ],
+}
+
+# Unique indexes on the students collection that reject duplicate registrations
+REGISTRATION_UNIQUE_INDEXES = ('email_1', 'juApplication_1')
+
+# Indexes shared by every per-department student collection
+DEPARTMENT_INDEXES = [
+    {'keys': [('student_id', ASCENDING)], 'name': 'student_id_1'},
+    {'keys': [('email', ASCENDING)], 'name': 'email_1'},
+    {'keys': [('juApplication', ASCENDING)], 'name': 'juApplication_1'},
+    {'keys': [('status', ASCENDING), ('updated_at', DESCENDING)], 'name': 'status_1_updated_at_-1'},
+    {'keys': [('created_at', ASCENDING), ('student_id', ASCENDING)], 'name': 'created_at_1_student_id_1'},
+]
+
+
+def _index_model(spec):
+    """Build a pymongo IndexModel from an index declaration"""
+    options = {key: value for key, value in spec.items() if key != 'keys'}
+    return IndexModel(spec['keys'], **options)
+
+
+def declared_indexes(department_collections=()):
+    """
+    Get the declared indexes for every managed collection.
+
+    Args:
+        department_collections (iterable): Names of the per-department collections
+
+    Returns:
+        dict: Collection name to list of index declarations
+    """
+    declarations = dict(COLLECTION_INDEXES)
+    for collection_name in department_collections:
+        declarations[collection_name] = DEPARTMENT_INDEXES
+    return declarations
+
+
+def ensure_collection_indexes(db, collection_name, specs):
+    """
+    Create the declared indexes on one collection.
+
+    Args:
+        db: pymongo Database
+        collection_name (str): Collection to index
+        specs (list): Index declarations
+
+    Returns:
+        dict: Created index names and per-index errors
+    """
+    created = []
+    errors = {}
+    collection = db[collection_name]
+    for spec in specs:
+        try:
+            created.extend(collection.create_indexes([_index_model(spec)]))
+        except OperationFailure as e:
+            # Usually an index with the same name but different options, or
+            # existing duplicates blocking a unique index
+            errors[spec['name']] = str(e)
+            print(f"[WARNING] Could not create index {spec['name']} on {collection_name}: {e}")
+    return {'created': created, 'errors': errors}
+
+
+def ensure_indexes(db, department_collections=()):
+    """
+    Create all declared indexes.
+
+    Args:
+        db: pymongo Database
+        department_collections (iterable): Names of the per-department collections
+
+    Returns:
+        dict: Per-collection results from ensure_collection_indexes
+    """
+    results = {}
+    for collection_name, specs in declared_indexes(department_collections).items():
+        results[collection_name] = ensure_collection_indexes(db, collection_name, specs)
+    return results
+
+
+def missing_unique_indexes(collection, index_names):
+    """
+    Check that indexes exist on a collection and are unique.
+
+    Args:
+        collection: pymongo Collection
+        index_names (iterable): Names of the unique indexes to check
+
+    Returns:
+        list: Names of the indexes that are missing or not unique
+    """
+    existing = collection.index_information()
+    return [name for name in index_names if not existing.get(name, {}).get('unique')]
+
+
+def _index_usage(collection):
+    """Get operation counts per index name, or None if $indexStats is unavailable"""
+    try:
+        return {
+            stat['name']: stat.get('accesses', {}).get('ops', 0)
+            for stat in collection.aggregate([{'$indexStats': {}}])
+        }
+    except OperationFailure as e:
+        print(f"[WARNING] $indexStats unavailable for {collection.name}: {e}")
+        return None
+
+
+def report_indexes(db, department_collections=()):
+    """
+    Report missing, unused and undeclared indexes.
+
+    Index usage counters reset when mongod restarts, so an index reported as
+    unused has had no operations since the last restart.
+
+    Args:
+        db: pymongo Database
+        department_collections (iterable): Names of the per-department collections
+
+    Returns:
+        dict: Per-collection report
+    """
+    report = {}
+    existing_collections = set(db.list_collection_names())
+    for collection_name, specs in declared_indexes(department_collections).items():
+        declared_names = [spec['name'] for spec in specs]
+        if collection_name not in existing_collections:
+            report[collection_name] = {
+                'exists': False,
+                'missing': declared_names,
+                'unused': [],
+                'undeclared': []
+            }
+            continue
+
+        collection = db[collection_name]
+        existing_names = [name for name in collection.index_information() if name != '_id_']
+        usage = _index_usage(collection)
+
+        report[collection_name] = {
+            'exists': True,
+            'missing': [name for name in declared_names if name not in existing_names],
+            'unused': [name for name in existing_names if usage is not None and usage.get(name, 0) == 0],
+            'undeclared': [name for name in existing_names if name not in declared_names]
+        }
+    return report
@@ -0,0 +1,268 @@
+"""
+Materialized Department Statistics
+Keeps per-department student counters and per-role admin counters in a
+small collection, so dashboards read one document instead of counting.
+
+Counters are updated with $inc as records change status. Each $inc is
+atomic, but a status change and its counter update are separate writes,
+so reconcile_* recounts from the source collections to correct any drift.
+
+Counter documents are only created by reconciliation, which stamps them
+with reconciled_at. The $inc writes never upsert, so changes made before a
+department's first reconciliation are picked up by its recount instead of
+starting a partial document; read_* treat documents without the stamp
+(left by older versions) as missing so they are recounted too.
+"""
+
+from datetime import datetime, timedelta
+
+
+STATS_COLLECTION = 'department_stats'
+
+# Department keys are normalized names, which never contain underscores
+ADMIN_STATS_KEY = '_admins'
+
+# Days of verification history kept by reconciliation
+VERIFIED_HISTORY_DAYS = 30
+
+
+def _day_key(moment):
+    return moment.strftime('%Y-%m-%d')
+
+
+def record_student_registered(stats_collection, department_key, status='pending', count=1):
+    """
+    Count newly registered students.
+
+    Args:
+        stats_collection: Stats collection
+        department_key (str): Normalized department name
+        status (str): Initial status of the new records
+        count (int): Number of students registered
+    """
+    stats_collection.update_one(
+        {'_id': department_key},
+        {
+            '$inc': {'total': count, f'status_counts.{status}': count},
+            '$set': {'updated_at': datetime.utcnow()}
+        }
+    )
+
+
+def record_status_change(stats_collection, department_key, old_status, new_status, changed_at=None,
+                         previous_changed_at=None):
+    """
+    Move one student between status counters.
+
+    Args:
+        stats_collection: Stats collection
+        department_key (str): Normalized department name
+        old_status (str): Status before the change (None if unknown)
+        new_status (str): Status after the change
+        changed_at (datetime): Time of the change, used for the verified-per-day counter
+        previous_changed_at (datetime): Time of the previous change; when a student leaves
+            'verified', that day's verified counter is decremented
+    """
+    if old_status == new_status:
+        return
+
+    changed_at = changed_at or datetime.utcnow()
+    increments = {f'status_counts.{new_status}': 1}
+    if old_status:
+        increments[f'status_counts.{old_status}'] = -1
+    if new_status == 'verified':
+        increments[f'verified_by_day.{_day_key(changed_at)}'] = 1
+    elif old_status == 'verified' and previous_changed_at:
+        increments[f'verified_by_day.{_day_key(previous_changed_at)}'] = -1
+
+    stats_collection.update_one(
+        {'_id': department_key},
+        {'$inc': increments, '$set': {'updated_at': datetime.utcnow()}}
+    )
+
+
+def record_admin_role_change(stats_collection, old_role, new_role):
+    """
+    Move one admin between role counters.
+
+    Args:
+        stats_collection: Stats collection
+        old_role (str): Role before the change (None for a new admin)
+        new_role (str): Role after the change (None for a deleted admin)
+    """
+    if old_role == new_role:
+        return
+
+    increments = {}
+    if new_role:
+        increments[f'role_counts.{new_role}'] = 1
+    if old_role:
+        increments[f'role_counts.{old_role}'] = -1
+    if not old_role:
+        increments['total'] = 1
+    elif not new_role:
+        increments['total'] = -1
+
+    stats_collection.update_one(
+        {'_id': ADMIN_STATS_KEY},
+        {'$inc': increments, '$set': {'updated_at': datetime.utcnow()}}
+    )
+
+
+def read_department_stats(stats_collection, department_key, now=None):
+    """
+    Read a department's counters.
+
+    Returns:
+        dict: totalStudents, pendingVerification, completedVerification and
+              todayCompleted, or None if the department's counters have not been seeded
+    """
+    document = stats_collection.find_one({'_id': department_key})
+    if not document or 'reconciled_at' not in document:
+        return None
+
+    now = now or datetime.utcnow()
+    status_counts = document.get('status_counts', {})
+    return {
+        'totalStudents': document.get('total', 0),
+        'pendingVerification': status_counts.get('photo_uploaded', 0),
+        'completedVerification': status_counts.get('verified', 0),
+        'todayCompleted': document.get('verified_by_day', {}).get(_day_key(now), 0)
+    }
+
+
+def read_admin_stats(stats_collection):
+    """
+    Read the admin role counters.
+
+    Returns:
+        dict: totalAdmins, superAdmins, departmentAdmins and photoAdmins,
+              or None if the counters have not been seeded
+    """
+    document = stats_collection.find_one({'_id': ADMIN_STATS_KEY})
+    if not document or 'reconciled_at' not in document:
+        return None
+
+    role_counts = document.get('role_counts', {})
+    return {
+        'totalAdmins': document.get('total', 0),
+        'superAdmins': role_counts.get('super_admin', 0),
+        'departmentAdmins': role_counts.get('department_admin', 0),
+        'photoAdmins': role_counts.get('photo_admin', 0)
+    }
+
+
+def _facet_count(result, facet):
+    rows = result.get(facet, [])
+    return rows[0]['count'] if rows else 0
+
+
+def aggregate_department_stats(department_collection, now=None):
+    """
+    Count a department's statistics from its student records in one $facet aggregation.
+
+    Returns:
+        dict: Same shape as read_department_stats
+    """
+    now = now or datetime.utcnow()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    result = next(department_collection.aggregate([
+        {'$facet': {
+            'total': [{'$count': 'count'}],
+            'pending': [{'$match': {'status': 'photo_uploaded'}}, {'$count': 'count'}],
+            'completed': [{'$match': {'status': 'verified'}}, {'$count': 'count'}],
+            'today': [
+                {'$match': {'status': 'verified', 'updated_at': {'$gte': today_start}}},
+                {'$count': 'count'}
+            ]
+        }}
+    ]), {})
+    return {
+        'totalStudents': _facet_count(result, 'total'),
+        'pendingVerification': _facet_count(result, 'pending'),
+        'completedVerification': _facet_count(result, 'completed'),
+        'todayCompleted': _facet_count(result, 'today')
+    }
+
+
+def aggregate_admin_stats(admins_collection):
+    """
+    Count admins per role in one aggregation.
+
+    Returns:
+        dict: Same shape as read_admin_stats
+    """
+    role_rows = list(admins_collection.aggregate([
+        {'$group': {'_id': '$role', 'count': {'$sum': 1}}}
+    ]))
+    role_counts = {row['_id']: row['count'] for row in role_rows if row['_id']}
+    return {
+        'totalAdmins': sum(row['count'] for row in role_rows),
+        'superAdmins': role_counts.get('super_admin', 0),
+        'departmentAdmins': role_counts.get('department_admin', 0),
+        'photoAdmins': role_counts.get('photo_admin', 0)
+    }
+
+
+def reconcile_department_stats(stats_collection, department_key, department_collection, now=None):
+    """
+    Recount a department's counters from its student records.
+
+    Args:
+        stats_collection: Stats collection
+        department_key (str): Normalized department name
+        department_collection: The department's student collection
+
+    Returns:
+        dict: The stored counters
+    """
+    now = now or datetime.utcnow()
+    history_start = (now - timedelta(days=VERIFIED_HISTORY_DAYS)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    result = next(department_collection.aggregate([
+        {'$facet': {
+            'by_status': [{'$group': {'_id': '$status', 'count': {'$sum': 1}}}],
+            'verified_by_day': [
+                {'$match': {'status': 'verified', 'updated_at': {'$gte': history_start}}},
+                {'$group': {
+                    '_id': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$updated_at'}},
+                    'count': {'$sum': 1}
+                }}
+            ]
+        }}
+    ]), {})
+    status_rows = result.get('by_status', [])
+    status_counts = {row['_id']: row['count'] for row in status_rows if row['_id']}
+    verified_by_day = {row['_id']: row['count'] for row in result.get('verified_by_day', [])}
+
+    document = {
+        'total': sum(row['count'] for row in status_rows),
+        'status_counts': status_counts,
+        'verified_by_day': verified_by_day,
+        'updated_at': now,
+        'reconciled_at': now
+    }
+    stats_collection.replace_one({'_id': department_key}, document, upsert=True)
+    return document
+
+
+def reconcile_admin_stats(stats_collection, admins_collection):
+    """
+    Recount the admin role counters.
+
+    Returns:
+        dict: The stored counters
+    """
+    now = datetime.utcnow()
+    role_rows = list(admins_collection.aggregate([
+        {'$group': {'_id': '$role', 'count': {'$sum': 1}}}
+    ]))
+    role_counts = {row['_id']: row['count'] for row in role_rows if row['_id']}
+    document = {
+        'total': sum(row['count'] for row in role_rows),
+        'role_counts': role_counts,
+        'updated_at': now,
+        'reconciled_at': now
+    }
+    stats_collection.replace_one({'_id': ADMIN_STATS_KEY}, document, upsert=True)
+    return document
@@ -0,0 +1,114 @@
+"""
+Document Content Index
+SHA-256 digests of stored documents per student, so a resubmitted file
+with identical bytes reuses the stored copy instead of being uploaded
+again. Multipart uploads are hashed as the request body is parsed.
+"""
+
+import hashlib
+import io
+import tempfile
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+
+DOCUMENT_HASHES_COLLECTION = 'document_hashes'
+
+# Stored file fields kept in the index and returned on a match
+STORED_FILE_FIELDS = ('file_id', 'file_name', 'web_view_link', 'download_link', 'file_size', 'permission_granted')
+
+
+class HashingSpooledFile(tempfile.SpooledTemporaryFile):
+    """SpooledTemporaryFile that keeps a SHA-256 digest of everything written to it"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return super().write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+
+def stream_digest(stream):
+    """
+    Get the SHA-256 hex digest of a document stream if it is known without reading the stream again.
+
+    Returns:
+        str: Digest for hashing spool files and in-memory buffers, otherwise None
+    """
+    if isinstance(stream, HashingSpooledFile):
+        return stream.sha256.hexdigest()
+    if isinstance(stream, io.BytesIO):
+        return hashlib.sha256(stream.getbuffer()).hexdigest()
+    return None
+
+
+def find_stored_documents(hashes_collection, student_id, storage_name, digests):
+    """
+    Look up a student's stored documents by content, in one query.
+
+    Args:
+        hashes_collection: Document hashes collection
+        student_id (str): Student ID
+        storage_name (str): Storage backend the files live in
+        digests (iterable): SHA-256 hex digests
+
+    Returns:
+        dict: (document type, digest) to stored file fields
+    """
+    digests = list(set(digests))
+    if not digests:
+        return {}
+    return {
+        (entry['document_type'], entry['sha256']): {field: entry.get(field) for field in STORED_FILE_FIELDS}
+        for entry in hashes_collection.find({
+            'student_id': student_id,
+            'storage': storage_name,
+            'sha256': {'$in': digests}
+        })
+    }
+
+
+def record_stored_documents(hashes_collection, student_id, storage_name, stored_documents):
+    """
+    Index newly stored documents by content.
+
+    Args:
+        hashes_collection: Document hashes collection
+        student_id (str): Student ID
+        storage_name (str): Storage backend the files live in
+        stored_documents (list): (document type, digest, stored file fields) tuples
+    """
+    now = datetime.utcnow()
+    entries = [
+        {
+            'student_id': student_id,
+            'storage': storage_name,
+            'document_type': document_type,
+            'sha256': digest,
+            **{field: stored_file.get(field) for field in STORED_FILE_FIELDS},
+            'created_at': now
+        }
+        for document_type, digest, stored_file in stored_documents
+    ]
+    if not entries:
+        return
+
+    # Backends that store by name overwrite the previous file, whose entry is now wrong
+    hashes_collection.delete_many({
+        'student_id': student_id,
+        'storage': storage_name,
+        'file_id': {'$in': [entry['file_id'] for entry in entries]}
+    })
+    try:
+        hashes_collection.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        # A concurrent upload of the same file indexed it first; keep that entry
+        if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+            raise
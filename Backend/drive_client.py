@@ -0,0 +1,150 @@
+"""
+Google Drive Client Factory
+Loads the service account credentials once per process and hands out one
+Drive service per thread, built from the packaged static discovery
+document, so requests share a warm access token without rebuilding clients.
+"""
+
+import json
+import os
+import threading
+
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from google.oauth2.service_account import Credentials
+
+
+DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive']
+
+# Drive accepts at most 100 calls per batch request
+DRIVE_BATCH_LIMIT = 100
+
+# Permission making a file viewable by anyone with the link
+ANYONE_READER = {'role': 'reader', 'type': 'anyone'}
+
+
+class DriveClientFactory:
+    """
+    Process-wide source of Drive services.
+
+    Credentials are shared by every service, so an access token fetched by
+    one thread is reused by all of them until it expires. Services are
+    thread-local because the httplib2 transport behind each one is not
+    thread-safe. Everything is rebuilt after a fork.
+    """
+
+    def __init__(self, service_account_file, scopes=None):
+        """
+        Args:
+            service_account_file (str): Path to Google service account credentials
+            scopes (list): OAuth scopes (default: full Drive access)
+        """
+        self.service_account_file = service_account_file
+        self.scopes = scopes or DRIVE_SCOPES
+        self._lock = threading.Lock()
+        self._pid = None
+        self._credentials = None
+        self._discovery_document = None
+        self._local = threading.local()
+
+    def _check_process(self):
+        # Caller holds self._lock
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._credentials = None
+            self._local = threading.local()
+
+    def credentials(self):
+        """Get the shared service account credentials, loading them on first use"""
+        with self._lock:
+            self._check_process()
+            if self._credentials is None:
+                self._credentials = Credentials.from_service_account_file(
+                    self.service_account_file, scopes=self.scopes
+                )
+                print("Loaded service account:", self._credentials.service_account_email)
+            return self._credentials
+
+    def discovery_document(self):
+        """Get the Drive v3 discovery document packaged with google-api-python-client, parsed once"""
+        with self._lock:
+            if self._discovery_document is None:
+                self._discovery_document = json.loads(discovery_cache.get_static_doc('drive', 'v3'))
+            return self._discovery_document
+
+    def service(self):
+        """Get this thread's Drive service, building it on first use"""
+        credentials = self.credentials()
+        local = self._local
+        service = getattr(local, 'service', None)
+        if service is None:
+            service = build_from_document(self.discovery_document(), credentials=credentials)
+            local.service = service
+        return service
+
+    def reset(self):
+        """Forget the credentials and every thread's service, e.g. after rotating the key file"""
+        with self._lock:
+            self._credentials = None
+            self._local = threading.local()
+
+
+_factories = {}
+_factories_lock = threading.Lock()
+
+
+def get_drive_client_factory(service_account_file, scopes=None):
+    """Get the shared factory for a service account file"""
+    key = (os.path.abspath(service_account_file), tuple(scopes or DRIVE_SCOPES))
+    with _factories_lock:
+        if key not in _factories:
+            _factories[key] = DriveClientFactory(service_account_file, scopes)
+        return _factories[key]
+
+
+def execute_batch(service, requests):
+    """
+    Send Drive API requests through the batch endpoint, up to 100 per HTTP call.
+
+    Media uploads cannot be batched; everything else (permissions, metadata
+    reads, deletes) can.
+
+    Args:
+        service: Drive service
+        requests (list): Unexecuted requests, e.g. service.permissions().create(...)
+
+    Returns:
+        list: (response, error) per request, in order; error is None on success
+    """
+    results = [None] * len(requests)
+
+    def record(request_id, response, exception):
+        results[int(request_id)] = (response, exception)
+
+    for start in range(0, len(requests), DRIVE_BATCH_LIMIT):
+        end = min(start + DRIVE_BATCH_LIMIT, len(requests))
+        batch = service.new_batch_http_request(callback=record)
+        for index in range(start, end):
+            batch.add(requests[index], request_id=str(index))
+        try:
+            batch.execute()
+        except Exception as e:
+            # The whole call failed; items that did not report back share the error
+            for index in range(start, end):
+                if results[index] is None:
+                    results[index] = (None, e)
+    return results
+
+
+def grant_public_read(service, file_ids):
+    """
+    Make files viewable by anyone with the link, in one batched call.
+
+    Returns:
+        list: Error message per file ID, in order; None where the grant succeeded
+    """
+    requests = [
+        service.permissions().create(fileId=file_id, body=ANYONE_READER, fields='id')
+        for file_id in file_ids
+    ]
+    return [None if error is None else str(error) for _, error in execute_batch(service, requests)]
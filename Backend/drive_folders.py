@@ -0,0 +1,116 @@
+"""
+Drive Folder Registry
+Remembers the Drive folder created for each JU application so repeat
+uploads skip the Drive name search, and serialises folder creation across
+processes with a lock document in MongoDB so concurrent requests for the
+same application do not create duplicate folders.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+
+FOLDER_LOCKS_COLLECTION = 'drive_folder_locks'
+
+
+class FolderIdCache:
+    """
+    Process-local LRU map of folder name to Drive folder ID.
+
+    Folder names start with the JU application number, so this is in
+    effect keyed by application. Thread-safe.
+    """
+
+    def __init__(self, max_entries=1024):
+        """
+        Args:
+            max_entries (int): Least recently used entries are evicted beyond this size
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, folder_name):
+        """Get the cached folder ID, or None"""
+        with self._lock:
+            folder_id = self._entries.get(folder_name)
+            if folder_id is not None:
+                self._entries.move_to_end(folder_name)
+            return folder_id
+
+    def put(self, folder_name, folder_id):
+        """Remember a folder ID"""
+        with self._lock:
+            self._entries[folder_name] = folder_id
+            self._entries.move_to_end(folder_name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, folder_name):
+        """Forget a folder ID, e.g. after the folder was deleted in Drive"""
+        with self._lock:
+            self._entries.pop(folder_name, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def acquire_folder_lock(locks_collection, folder_name, owner, ttl_seconds=30):
+    """
+    Try once to take the creation lock for a folder name.
+
+    A lock whose holder died is taken over once it expires; the TTL index
+    on expires_at only removes it eventually.
+
+    Returns:
+        bool: True if the lock is now held by owner
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    try:
+        locks_collection.insert_one({'_id': folder_name, 'owner': owner, 'expires_at': expires_at, 'created_at': now})
+        return True
+    except DuplicateKeyError:
+        pass
+
+    taken = locks_collection.find_one_and_update(
+        {'_id': folder_name, 'expires_at': {'$lt': now}},
+        {'$set': {'owner': owner, 'expires_at': expires_at, 'created_at': now}}
+    )
+    return taken is not None
+
+
+def release_folder_lock(locks_collection, folder_name, owner):
+    """Release a lock, unless it already expired and was taken over"""
+    locks_collection.delete_one({'_id': folder_name, 'owner': owner})
+
+
+@contextmanager
+def folder_lock(locks_collection, folder_name, ttl_seconds=30, wait_seconds=15, poll_interval=0.2):
+    """
+    Hold the creation lock for a folder name while the block runs.
+
+    Yields:
+        bool: True if the lock was acquired, False if waiting timed out
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    deadline = time.monotonic() + wait_seconds
+    acquired = acquire_folder_lock(locks_collection, folder_name, owner, ttl_seconds)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        acquired = acquire_folder_lock(locks_collection, folder_name, owner, ttl_seconds)
+
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            release_folder_lock(locks_collection, folder_name, owner)
@@ -0,0 +1,194 @@
+"""
+Batch ID Card Generation
+Generates ID cards for many students at once, e.g. a whole department
+after verification day. Each card passes through three stages:
+
+    fetch  - read the student's photo from storage (I/O threads)
+    render - fill the template and convert it (worker processes)
+    upload - store the finished files in the student's folder (I/O threads)
+
+Rendering is CPU-bound python-pptx work (reportlab with the pdf renderer),
+so it is spread over worker processes that each compile the template once
+at startup. PDF conversion happens in the same workers, each keeping one
+LibreOffice listener of its own (see pdf_conversion.py). Fetching and
+uploading wait on the network and share one bounded thread pool, so the
+storage backend never sees more than io_concurrency requests at a time.
+Stages overlap: a card is uploaded as soon as it is rendered. Photos are
+fetched for a bounded window of cards ahead of the renderers, so memory
+stays flat and uploads do not queue behind the rest of the batch's fetches.
+A card succeeds only once its files are stored.
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from idcard import StudentIDCardGenerator
+from pdf_conversion import get_pdf_converter
+
+# Stages timed for every card, in pipeline order
+CARD_STAGES = ('fetch', 'render', 'convert', 'upload')
+
+# Render generator of the current worker process, set by _init_render_worker
+_worker_generator = None
+
+
+def _init_render_worker(template_path, output_folder, soffice_settings, renderer, font_dir):
+    """Process pool initializer: build the worker's generator and compile the template"""
+    global _worker_generator
+    pdf_converter = None
+    if soffice_settings:
+        soffice_path, timeout = soffice_settings
+        pdf_converter = get_pdf_converter(soffice_path, max_workers=1, timeout=timeout)
+    _worker_generator = StudentIDCardGenerator(
+        template_path, output_folder, render_only=True, pdf_converter=pdf_converter, renderer=renderer, font_dir=font_dir
+    )
+    template = _worker_generator.compiled_template()
+    if renderer == 'pdf':
+        template.pdf_layout()
+
+
+def _render_in_worker(student_data, photo_data, file_stem):
+    return _worker_generator.render_id_card(student_data, photo_data, file_stem)
+
+
+def _fetch_photo(generator, student_data):
+    started = time.perf_counter()
+    photo_data = generator.fetch_photo(student_data) or b''
+    return photo_data, time.perf_counter() - started
+
+
+def _upload_error(google_drive):
+    if not google_drive.get('success'):
+        return google_drive.get('error', 'upload failed')
+    if not google_drive.get('total_uploaded'):
+        return 'no files were uploaded'
+    return None
+
+
+def generate_id_cards_batch(students, generator, processes=None, io_concurrency=4, on_card=None):
+    """
+    Generate and upload ID cards for a list of students.
+
+    Args:
+        students (list): Student records, as passed to generate_id_card
+        generator (StudentIDCardGenerator): Supplies the template, output folder, storage, renderer and
+            PDF converter settings; photos are read and cards uploaded through its storage in this process
+        processes (int): Render worker processes (default: CPU count)
+        io_concurrency (int): Photo reads and uploads in flight at once
+        on_card (callable): Called with (student_id, result) as each card finishes
+
+    Returns:
+        dict: Totals, wall time, summed stage timings and per-card results with timings in seconds
+    """
+    started = time.perf_counter()
+    cards = []
+    if not os.path.exists(generator.template_path):
+        for student_data in students:
+            cards.append({
+                'student_id': student_data.get('student_id'),
+                'success': False,
+                'error': f"ID card template not found: {generator.template_path}"
+            })
+        return _summarize(cards, started)
+
+    processes = max(1, min(processes or os.cpu_count() or 1, len(students) or 1))
+    converter = generator.pdf_converter
+    render_pool = ProcessPoolExecutor(
+        max_workers=processes,
+        # Fresh interpreters: workers must not inherit the parent's MongoClient or Drive connections
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_render_worker,
+        initargs=(
+            generator.template_path,
+            generator.output_folder,
+            (converter.soffice_path, converter.timeout) if converter else None,
+            generator.renderer,
+            generator.font_dir
+        )
+    )
+    io_pool = ThreadPoolExecutor(max_workers=max(1, io_concurrency), thread_name_prefix='id-card-io')
+
+    def finish(student_data, card, card_started):
+        card['student_id'] = student_data.get('student_id')
+        card['timings']['total'] = time.perf_counter() - card_started
+        cards.append(card)
+        if on_card:
+            on_card(card['student_id'], card)
+
+    # Cards between fetch and upload at once: enough to keep renderers and uploads busy
+    window = processes * 2 + io_concurrency
+    remaining = iter(students)
+
+    try:
+        # future -> (stage, student record, card start time, card result so far)
+        pending = {}
+
+        def fetch_next():
+            student_data = next(remaining, None)
+            if student_data is not None:
+                future = io_pool.submit(_fetch_photo, generator, student_data)
+                pending[future] = ('fetch', student_data, time.perf_counter(), {'timings': {}})
+
+        for _ in range(window):
+            fetch_next()
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, student_data, card_started, card = pending.pop(future)
+                error = future.exception()
+                if error is not None:
+                    card.update({'success': False, 'error': f"ID card {stage} failed: {error}"})
+                    finish(student_data, card, card_started)
+                    fetch_next()
+                    continue
+
+                if stage == 'fetch':
+                    photo_data, card['timings']['fetch'] = future.result()
+                    render_future = render_pool.submit(
+                        _render_in_worker,
+                        student_data,
+                        photo_data,
+                        f"ID_Card_{student_data.get('student_id')}"
+                    )
+                    pending[render_future] = ('render', student_data, card_started, card)
+
+                elif stage == 'render':
+                    rendered = future.result()
+                    card = {**rendered, 'timings': {**card['timings'], **rendered.get('timings', {})}}
+                    if not card['success']:
+                        finish(student_data, card, card_started)
+                        fetch_next()
+                        continue
+                    upload_future = io_pool.submit(generator.upload_id_card, student_data, card)
+                    pending[upload_future] = ('upload', student_data, card_started, card)
+
+                else:
+                    card['google_drive'] = future.result()
+                    upload_error = _upload_error(card['google_drive'])
+                    if upload_error:
+                        card.update({'success': False, 'error': f"ID card upload failed: {upload_error}"})
+                    finish(student_data, card, card_started)
+                    fetch_next()
+    finally:
+        io_pool.shutdown(wait=True)
+        render_pool.shutdown(wait=True)
+
+    return _summarize(cards, started)
+
+
+def _summarize(cards, started):
+    succeeded = sum(1 for card in cards if card.get('success'))
+    return {
+        'total': len(cards),
+        'succeeded': succeeded,
+        'failed': len(cards) - succeeded,
+        'elapsed': time.perf_counter() - started,
+        'stage_seconds': {
+            stage: sum(card.get('timings', {}).get(stage, 0) for card in cards)
+            for stage in CARD_STAGES
+        },
+        'cards': cards
+    }
@@ -1,21 +1,32 @@
 """
-Updated Student ID Card Generator Module with Google Drive Upload Support
-Generates ID cards and uploads them to the student's Google Drive folder.
+Updated Student ID Card Generator Module with Document Storage Upload Support
+Generates ID cards and uploads them to the student's document storage folder
+(Google Drive unless another storage backend is passed in).
 """
 
 import os
 import io
+import re
+import copy
+import threading
+import time
 import requests
+from collections import namedtuple
 from pptx import Presentation
 from pptx.util import Pt, Inches
 from pptx.dml.color import RGBColor
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
+from pptx.text.text import _Run
 from datetime import datetime
 from PIL import Image
 
-# Google Drive imports
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from google.oauth2.service_account import Credentials
+# Document storage imports
+from drive_client import get_drive_client_factory
+from storage import DriveStorage
+
+# Direct-to-PDF renderer
+from idcard_pdf import CardLayout, EMU_PER_POINT, render_card_pdf
 
 # Windows-specific imports for PDF conversion
 try:
@@ -23,7 +34,176 @@ try:
     WINDOWS_AVAILABLE = True
 except ImportError:
     WINDOWS_AVAILABLE = False
-    print("Warning: PDF conversion requires Windows + PowerPoint")
+    print("Warning: PowerPoint PDF conversion unavailable; LibreOffice is used if installed")
+
+
+# Font applied to every run of a filled-in placeholder: Red Hat Display Bold, size 8, black
+CARD_TEXT_STYLE = {
+    'font_name': 'Red Hat Display Bold',
+    'size': Pt(8),
+    'bold': True,
+    'color': RGBColor(0, 0, 0)
+}
+
+# Photo position (left, top, width, height) when the template has no photo placeholder
+DEFAULT_PHOTO_POSITION = (Inches(0.3), Inches(2.35), Inches(0.7), Inches(0.9))
+
+# Card renderers: 'pptx' fills the PowerPoint template (converted to PDF where possible),
+# 'pdf' draws the template's layout straight to PDF with reportlab (see idcard_pdf.py)
+ID_CARD_RENDERERS = ('pptx', 'pdf')
+
+# A text frame holding placeholders: a shape, or a table cell when row and column are set
+PlaceholderLocation = namedtuple('PlaceholderLocation', 'slide_index shape_index row column text placeholders')
+
+
+class CompiledTemplate:
+    """
+    ID card template parsed once.
+    
+    Keeps the template package bytes and indexes every shape and table cell
+    whose text contains placeholders, plus the photo placeholder on the front
+    slide. Each card is a fresh Presentation loaded from the in-memory bytes
+    in which only the indexed locations are patched. Placeholders are
+    substituted in one pass with a precompiled alternation regex, and the
+    run style is built once and copied onto each filled-in run.
+    """
+    
+    def __init__(self, template_path, placeholders, text_style=None):
+        """
+        Args:
+            template_path (str): Path to PowerPoint template
+            placeholders (iterable): Placeholder strings to index, e.g. '{{NAME}}'
+            text_style (dict): Run style for filled-in text (default CARD_TEXT_STYLE)
+        """
+        self.template_path = template_path
+        with open(template_path, 'rb') as template_file:
+            self.package_bytes = template_file.read()
+        
+        presentation = Presentation(io.BytesIO(self.package_bytes))
+        placeholders = list(placeholders)
+        # Longest first, so a placeholder that prefixes another cannot shadow it
+        self.placeholder_pattern = re.compile(
+            '|'.join(re.escape(placeholder) for placeholder in sorted(placeholders, key=len, reverse=True))
+        )
+        self.text_style = text_style or CARD_TEXT_STYLE
+        self.run_properties = self._build_run_properties(self.text_style)
+        self._pdf_layout = None
+        self._pdf_layout_lock = threading.Lock()
+        self.text_locations = []
+        self.photo_shape_index = None
+        
+        for slide_index, slide in enumerate(presentation.slides):
+            for shape_index, shape in enumerate(slide.shapes):
+                if hasattr(shape, 'text'):
+                    self._index_text(slide_index, shape_index, None, None, shape.text, placeholders)
+                
+                if shape.has_table:
+                    for row_index, row in enumerate(shape.table.rows):
+                        for column_index, cell in enumerate(row.cells):
+                            self._index_text(slide_index, shape_index, row_index, column_index, cell.text, placeholders)
+                
+                # Photo goes on the front of the card
+                if slide_index == 0 and self.photo_shape_index is None and self._is_photo_placeholder(shape, placeholders):
+                    self.photo_shape_index = shape_index
+    
+    def _index_text(self, slide_index, shape_index, row, column, text, placeholders):
+        present = tuple(placeholder for placeholder in placeholders if placeholder in text)
+        if present:
+            self.text_locations.append(PlaceholderLocation(slide_index, shape_index, row, column, text, present))
+    
+    @staticmethod
+    def _build_run_properties(text_style):
+        """Build the <a:rPr> element for a text style through python-pptx's font API"""
+        run = _Run(parse_xml(f'<a:r {nsdecls("a")}><a:t/></a:r>'), None)
+        run.font.name = text_style['font_name']
+        run.font.size = text_style['size']
+        run.font.bold = text_style['bold']
+        run.font.color.rgb = text_style['color']
+        return run._r.rPr
+    
+    def fill(self, text, replacements):
+        """Substitute every placeholder in text in a single pass"""
+        return self.placeholder_pattern.sub(lambda match: replacements.get(match.group(0), match.group(0)), text)
+    
+    def apply_run_style(self, text_frame):
+        """Give every run in a text frame a copy of the cached run properties"""
+        for paragraph in text_frame.paragraphs:
+            for run in paragraph.runs:
+                r = run._r
+                if r.rPr is not None:
+                    r.remove(r.rPr)
+                r.insert(0, copy.deepcopy(self.run_properties))
+    
+    @staticmethod
+    def _is_photo_placeholder(shape, placeholders):
+        """
+        Whether a shape marks the photo position: its name contains "photo",
+        or its text still contains "PHOTO" once the placeholders are filled in
+        (the {{PHOTO}} placeholder itself is filled with an empty string).
+        """
+        if hasattr(shape, 'text'):
+            filled_text = shape.text
+            for placeholder in placeholders:
+                filled_text = filled_text.replace(placeholder, '')
+            if 'PHOTO' in filled_text.upper():
+                return True
+        return hasattr(shape, 'name') and 'photo' in shape.name.lower()
+    
+    def new_presentation(self):
+        """Load a fresh copy of the template from memory"""
+        return Presentation(io.BytesIO(self.package_bytes))
+    
+    @staticmethod
+    def resolve(presentation, location):
+        """Get the shape or table cell a location points at in a fresh presentation"""
+        shape = presentation.slides[location.slide_index].shapes[location.shape_index]
+        if location.row is None:
+            return shape
+        return shape.table.cell(location.row, location.column)
+    
+    def photo_shape(self, presentation):
+        """Get the photo placeholder shape in a fresh presentation, or None"""
+        if self.photo_shape_index is None:
+            return None
+        return presentation.slides[0].shapes[self.photo_shape_index]
+    
+    def pdf_layout(self):
+        """Get the template's layout for the direct PDF renderer, read on first use"""
+        with self._pdf_layout_lock:
+            if self._pdf_layout is None:
+                self._pdf_layout = CardLayout(
+                    self.new_presentation(),
+                    self.text_locations,
+                    self.photo_shape_index,
+                    tuple(value / EMU_PER_POINT for value in DEFAULT_PHOTO_POSITION),
+                    self.text_style
+                )
+            return self._pdf_layout
+
+
+_compiled_templates = {}
+_compiled_templates_lock = threading.Lock()
+
+
+def get_compiled_template(template_path, placeholders):
+    """
+    Get the process-wide compiled template for a path, recompiling it when the file changes.
+    
+    Args:
+        template_path (str): Path to PowerPoint template
+        placeholders (iterable): Placeholder strings to index
+    
+    Returns:
+        CompiledTemplate
+    """
+    key = os.path.abspath(template_path)
+    modified_at = os.path.getmtime(template_path)
+    with _compiled_templates_lock:
+        cached = _compiled_templates.get(key)
+        if cached is None or cached[0] != modified_at:
+            cached = (modified_at, CompiledTemplate(template_path, placeholders))
+            _compiled_templates[key] = cached
+        return cached[1]
 
 
 class StudentIDCardGenerator:
@@ -33,7 +213,12 @@ class StudentIDCardGenerator:
     
     def __init__(self, template_path='./Jain.pptx', 
                  output_folder='./generated_id_cards',
-                 service_account_file='./credentials.json'):
+                 service_account_file='./credentials.json',
+                 storage=None,
+                 render_only=False,
+                 pdf_converter=None,
+                 renderer='pptx',
+                 font_dir=None):
         """
         Initialize the ID card generator.
         
@@ -41,39 +226,85 @@ class StudentIDCardGenerator:
             template_path (str): Path to PowerPoint template
             output_folder (str): Folder to save generated files
             service_account_file (str): Path to Google service account credentials
+            storage: DocumentStorage backend (default: Google Drive with service_account_file)
+            render_only (bool): Only render cards; no storage is connected (batch render workers)
+            pdf_converter: SofficeConverter used where PowerPoint is unavailable (optional)
+            renderer (str): Default card renderer, one of ID_CARD_RENDERERS
+            font_dir (str): Directory of TrueType fonts for the pdf renderer
         """
         self.template_path = template_path
         self.output_folder = output_folder
         self.service_account_file = service_account_file
+        self.pdf_converter = pdf_converter
+        self.renderer = renderer
+        self.font_dir = font_dir
         
         # Create output folder if it doesn't exist
         os.makedirs(self.output_folder, exist_ok=True)
         
-        # Initialize Google Drive service
-        self.drive_service = self._get_drive_service()
+        # Initialize document storage
+        self.storage = storage
+        if self.storage is None and not render_only and self._get_drive_service():
+            self.storage = DriveStorage(self._get_drive_service)
     
     def _get_drive_service(self):
-        """Create and return Google Drive API service"""
+        """Get the calling thread's shared Google Drive API service"""
         try:
-            scopes = ['https://www.googleapis.com/auth/drive']
-            credentials = Credentials.from_service_account_file(
-                self.service_account_file, scopes=scopes
-            )
-            service = build('drive', 'v3', credentials=credentials)
-            return service
+            return get_drive_client_factory(self.service_account_file).service()
         except Exception as e:
             print(f"Error creating Drive service: {e}")
             return None
     
-    def generate_id_card(self, student_data):
+    def generate_id_card(self, student_data, renderer=None):
         """
         Generate ID card for a single student and upload to Google Drive.
         
         Args:
             student_data (dict): Student information dictionary
+            renderer (str): 'pptx' or 'pdf' (default: the generator's renderer)
         
         Returns:
-            dict: Result with success status and file paths (local and Google Drive)
+            dict: Result with success status, file paths (local and Google Drive) and stage timings in seconds
+        """
+        rendered = self.render_id_card(student_data, renderer=renderer)
+        if not rendered['success']:
+            return rendered
+        
+        return {**rendered, "google_drive": self.upload_id_card(student_data, rendered)}
+    
+    def compiled_template(self):
+        """Get the compiled template, compiling it on first use in this process"""
+        return get_compiled_template(self.template_path, self._get_placeholder_mappings({}))
+    
+    def upload_id_card(self, student_data, rendered):
+        """
+        Upload a rendered ID card to the student's folder, adding the upload time to its timings.
+        
+        Args:
+            student_data (dict): Student information dictionary
+            rendered (dict): Successful result from render_id_card
+        
+        Returns:
+            dict: Upload results
+        """
+        upload_started = time.perf_counter()
+        gdrive_result = self._upload_to_google_drive(student_data, rendered['ppt_path'], rendered['pdf_path'])
+        rendered['timings']['upload'] = time.perf_counter() - upload_started
+        return gdrive_result
+    
+    def render_id_card(self, student_data, photo_data=None, file_stem=None, renderer=None):
+        """
+        Render a student's ID card without uploading: to PowerPoint (and PDF where conversion
+        is available) with the pptx renderer, or straight to PDF with the pdf renderer.
+        
+        Args:
+            student_data (dict): Student information dictionary
+            photo_data (bytes): Photo file contents, b'' for none (default: fetch_photo)
+            file_stem (str): Output file name without extension (default: ID_Card_<student name>)
+            renderer (str): 'pptx' or 'pdf' (default: the generator's renderer)
+        
+        Returns:
+            dict: Result with success status, file paths and render/convert timings in seconds
         """
         try:
             # Validate template exists
@@ -83,49 +314,59 @@ class StudentIDCardGenerator:
                     "error": f"ID card template not found: {self.template_path}"
                 }
             
+            renderer = renderer or self.renderer
+            if renderer not in ID_CARD_RENDERERS:
+                raise ValueError(f"Unknown ID card renderer: {renderer}")
+            
+            render_started = time.perf_counter()
             student_name = student_data.get('studentFullName', '') or student_data.get('name', 'Unknown Student')
             print(f"Generating ID card for {student_name}...")
             
-            # Load fresh template
-            ppt = Presentation(self.template_path)
-            
-            # Replace placeholders in ALL slides (front and back pages)
-            for slide_num, slide in enumerate(ppt.slides):
-                print(f"  Processing slide {slide_num + 1}")
-                
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        # Replace text placeholders with formatting
-                        self._replace_text_with_formatting(shape, student_data)
-                    
-                    # Handle text in tables
-                    if shape.has_table:
-                        table = shape.table
-                        for row in table.rows:
-                            for cell in row.cells:
-                                self._replace_text_with_formatting(cell, student_data)
-                
-                # Handle photo insertion for first slide only (front of card)
-                if slide_num == 0:
-                    self._insert_student_photo(slide, student_data)
+            template = self.compiled_template()
+            replacements = self._get_placeholder_mappings(student_data)
             
             # Generate safe filename
-            safe_name = self._sanitize_filename(student_name)
+            file_stem = file_stem or f"ID_Card_{self._sanitize_filename(student_name)}"
+            
+            ppt_file = os.path.join(self.output_folder, f"{file_stem}.pptx")
+            pdf_file = os.path.join(self.output_folder, f"{file_stem}.pdf")
             
-            ppt_file = os.path.join(self.output_folder, f"ID_Card_{safe_name}.pptx")
-            pdf_file = os.path.join(self.output_folder, f"ID_Card_{safe_name}.pdf")
+            if renderer == 'pdf':
+                self._render_pdf_card(template, student_data, replacements, photo_data, pdf_file)
+                print(f"  PDF created: {pdf_file}")
+                return {
+                    "success": True,
+                    "file_path": pdf_file,
+                    "ppt_path": None,
+                    "pdf_path": pdf_file,
+                    "format": "pdf",
+                    "message": f"ID card generated successfully for {student_name}",
+                    "timings": {
+                        "render": time.perf_counter() - render_started,
+                        "convert": 0.0
+                    }
+                }
+            
+            # Load fresh template from the compiled copy
+            ppt = template.new_presentation()
+            
+            # Replace placeholders at the indexed shapes and table cells (front and back pages)
+            for location in template.text_locations:
+                self._fill_placeholders(template, template.resolve(ppt, location), location, replacements)
+            
+            # Handle photo insertion for first slide only (front of card)
+            self._insert_student_photo(ppt.slides[0], student_data, template.photo_shape(ppt), photo_data)
             
             # Save PowerPoint
             ppt.save(ppt_file)
             print(f"  Generated: {ppt_file}")
             
             # Convert to PDF
+            convert_started = time.perf_counter()
             pdf_created = self._convert_to_pdf(ppt_file, pdf_file)
             if pdf_created:
                 print(f"  PDF created: {pdf_file}")
-            
-            # Upload to Google Drive
-            gdrive_result = self._upload_to_google_drive(student_data, ppt_file, pdf_file if pdf_created else None)
+            convert_finished = time.perf_counter()
             
             # Determine primary file
             primary_file = pdf_file if pdf_created else ppt_file
@@ -137,8 +378,11 @@ class StudentIDCardGenerator:
                 "ppt_path": ppt_file,
                 "pdf_path": pdf_file if pdf_created else None,
                 "format": primary_format,
-                "google_drive": gdrive_result,
-                "message": f"ID card generated successfully for {student_name}"
+                "message": f"ID card generated successfully for {student_name}",
+                "timings": {
+                    "render": convert_started - render_started,
+                    "convert": convert_finished - convert_started
+                }
             }
                 
         except Exception as e:
@@ -148,22 +392,45 @@ class StudentIDCardGenerator:
                 "error": f"Error generating ID card: {str(e)}"
             }
     
+    def _render_pdf_card(self, template, student_data, replacements, photo_data, pdf_file):
+        """
+        Draw the card straight to PDF from the template's layout.
+        
+        Args:
+            template (CompiledTemplate): Compiled template
+            student_data (dict): Student information dictionary
+            replacements (dict): Placeholder to value mappings
+            photo_data (bytes): Photo file contents, b'' for none, None to fetch it
+            pdf_file (str): Output file
+        """
+        if photo_data is None:
+            photo_data = self.fetch_photo(student_data)
+        photo_stream = None
+        if photo_data:
+            try:
+                photo_stream = self._prepare_image(photo_data)
+            except Exception as e:
+                print(f"  Error inserting photo: {e}")
+        
+        filled_texts = {location: template.fill(location.text, replacements) for location in template.text_locations}
+        render_card_pdf(template.pdf_layout(), filled_texts, photo_stream, pdf_file, self.font_dir)
+    
     def _upload_to_google_drive(self, student_data, ppt_file, pdf_file=None):
         """
         Upload generated ID card files to student's Google Drive folder.
         
         Args:
             student_data (dict): Student information
-            ppt_file (str): Path to PowerPoint file
+            ppt_file (str): Path to PowerPoint file (None for cards rendered straight to PDF)
             pdf_file (str): Path to PDF file (optional)
             
         Returns:
             dict: Upload results
         """
-        if not self.drive_service:
+        if not self.storage:
             return {
                 "success": False,
-                "error": "Google Drive service not available"
+                "error": "Document storage not available"
             }
         
         try:
@@ -175,33 +442,45 @@ class StudentIDCardGenerator:
                     "error": "Student's Google Drive folder not found"
                 }
             
-            print(f"  Uploading ID card to Google Drive folder: {folder_id}")
+            print(f"  Uploading ID card to storage folder: {folder_id}")
             
-            uploaded_files = {}
+            files_to_upload = []
+            if ppt_file:
+                files_to_upload.append(('powerpoint', ppt_file, "ID_Card.pptx",
+                                        "application/vnd.openxmlformats-officedocument.presentationml.presentation"))
+            if pdf_file:
+                files_to_upload.append(('pdf', pdf_file, "ID_Card.pdf", "application/pdf"))
+            files_to_upload = [item for item in files_to_upload if os.path.exists(item[1])]
             
-            # Upload PowerPoint file
-            if os.path.exists(ppt_file):
-                ppt_result = self._upload_single_file_to_drive(
-                    ppt_file, 
-                    folder_id, 
-                    "ID_Card.pptx",
-                    "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+            # Replace earlier ID cards, including a format this card does not have (on Drive: one lookup
+            # for both names, one batch of deletes)
+            for deleted_name in self.storage.delete_files(folder_id, ["ID_Card.pptx", "ID_Card.pdf"]):
+                print(f"    Deleted existing file: {deleted_name}")
+            
+            uploaded_files = {}
+            for file_kind, file_path, drive_filename, mime_type in files_to_upload:
+                file_result = self._upload_single_file_to_drive(
+                    file_path,
+                    folder_id,
+                    drive_filename,
+                    mime_type,
+                    replace_existing=False,
+                    grant_permission=False
                 )
-                if ppt_result['success']:
-                    uploaded_files['powerpoint'] = ppt_result
-                    print(f"    PowerPoint uploaded: {ppt_result['file_id']}")
-            
-            # Upload PDF file if available
-            if pdf_file and os.path.exists(pdf_file):
-                pdf_result = self._upload_single_file_to_drive(
-                    pdf_file, 
-                    folder_id, 
-                    "ID_Card.pdf",
-                    "application/pdf"
+                if file_result['success']:
+                    uploaded_files[file_kind] = file_result
+                    print(f"    {drive_filename} uploaded: {file_result['file_id']}")
+            
+            # Make the uploaded files publicly viewable in one batch request
+            if uploaded_files:
+                permission_errors = self.storage.grant_public_read(
+                    [file_result['file_id'] for file_result in uploaded_files.values()]
                 )
-                if pdf_result['success']:
-                    uploaded_files['pdf'] = pdf_result
-                    print(f"    PDF uploaded: {pdf_result['file_id']}")
+                for file_result, permission_error in zip(uploaded_files.values(), permission_errors):
+                    file_result['permission_granted'] = permission_error is None
+                    if permission_error:
+                        print(f"    Permission setting warning: {permission_error}")
+                        file_result['permission_error'] = permission_error
             
             return {
                 "success": True,
@@ -217,68 +496,38 @@ class StudentIDCardGenerator:
                 "error": str(e)
             }
     
-    def _upload_single_file_to_drive(self, file_path, folder_id, drive_filename, mime_type):
+    def _upload_single_file_to_drive(self, file_path, folder_id, drive_filename, mime_type,
+                                     replace_existing=True, grant_permission=True):
         """
-        Upload a single file to Google Drive.
+        Upload a single file to document storage.
         
         Args:
             file_path (str): Local file path
-            folder_id (str): Google Drive folder ID
-            drive_filename (str): Filename in Google Drive
+            folder_id (str): Storage folder ID
+            drive_filename (str): Filename in storage
             mime_type (str): MIME type of the file
+            replace_existing (bool): Delete files with the same name first
+            grant_permission (bool): Make the file publicly viewable
             
         Returns:
             dict: Upload result
         """
         try:
             # Check if file already exists and delete it
-            existing_files = self.drive_service.files().list(
-                q=f"name='{drive_filename}' and parents in '{folder_id}'",
-                fields="files(id, name)"
-            ).execute()
-            
-            for existing_file in existing_files.get('files', []):
-                self.drive_service.files().delete(fileId=existing_file['id']).execute()
-                print(f"    Deleted existing file: {existing_file['name']}")
-            
-            # File metadata
-            file_metadata = {
-                'name': drive_filename,
-                'parents': [folder_id],
-                'description': f"Student ID Card generated on {datetime.now().isoformat()}"
-            }
-            
-            # Create media upload object
-            media = MediaFileUpload(file_path, mimetype=mime_type, resumable=True)
-            
-            # Upload file
-            uploaded_file = self.drive_service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id,name,webViewLink,webContentLink,size'
-            ).execute()
+            if replace_existing:
+                self.storage.delete_files(folder_id, [drive_filename])
+            
+            with open(file_path, 'rb') as file_stream:
+                stored_file = self.storage.upload_file(
+                    folder_id,
+                    file_stream,
+                    drive_filename,
+                    mime_type,
+                    description=f"Student ID Card generated on {datetime.now().isoformat()}",
+                    grant_public=grant_permission
+                )
             
-            # Make file publicly viewable
-            try:
-                permission = {
-                    'role': 'reader',
-                    'type': 'anyone'
-                }
-                self.drive_service.permissions().create(
-                    fileId=uploaded_file.get('id'),
-                    body=permission
-                ).execute()
-            except Exception as perm_error:
-                print(f"    Permission setting warning: {perm_error}")
-            
-            return {
-                'success': True,
-                'file_id': uploaded_file.get('id'),
-                'file_name': uploaded_file.get('name'),
-                'web_view_link': uploaded_file.get('webViewLink'),
-                'download_link': uploaded_file.get('webContentLink'),
-                'file_size': uploaded_file.get('size')
-            }
+            return {'success': True, **stored_file}
             
         except Exception as e:
             return {
@@ -331,30 +580,49 @@ class StudentIDCardGenerator:
             print(f"  Error extracting photo URL: {e}")
             return None
     
-    def _insert_student_photo(self, slide, student_data):
+    def fetch_photo(self, student_data):
+        """
+        Get the student's photo, read straight from storage where the backend allows it, otherwise downloaded.
+        
+        Args:
+            student_data (dict): Dictionary with student information
+            
+        Returns:
+            bytes: Photo file contents, or None if unavailable
+        """
+        photo_data = self._read_stored_photo(student_data)
+        if photo_data:
+            return photo_data
+        
+        # Get photo URL from Google Drive data
+        photo_url = self._get_google_drive_photo_url(student_data)
+        if not photo_url:
+            print("  No photo URL available")
+            return None
+        
+        photo_data = self._download_image(photo_url)
+        if not photo_data:
+            print("  Failed to download image")
+        return photo_data
+    
+    def _insert_student_photo(self, slide, student_data, photo_shape=None, photo_data=None):
         """
         Insert student photo into the slide.
         
         Args:
             slide: PowerPoint slide object
             student_data (dict): Dictionary with student information
+            photo_shape: Placeholder shape the photo replaces (default: a fixed position)
+            photo_data (bytes): Photo already fetched, b'' for none (default: fetch_photo)
         """
         try:
-            # Get photo URL from Google Drive data
-            photo_url = self._get_google_drive_photo_url(student_data)
-            
-            if not photo_url:
-                print("  No photo URL available")
+            if photo_data is None:
+                photo_data = self.fetch_photo(student_data)
+            if not photo_data:
                 return
             
-            # Download and process the image
-            image_stream = self._get_image_stream(photo_url)
-            if not image_stream:
-                print("  Failed to download image")
-                return
-            
-            # Look for photo placeholder or shape with "PHOTO" text
-            photo_shape = self._find_photo_placeholder(slide)
+            # Process the image
+            image_stream = self._prepare_image(photo_data)
             
             if photo_shape:
                 # Get position and size of the placeholder
@@ -372,10 +640,7 @@ class StudentIDCardGenerator:
                 print("  Photo inserted successfully")
             else:
                 # If no placeholder found, add photo at default position
-                left = Inches(0.3)
-                top = Inches(2.35)
-                width = Inches(0.7)
-                height = Inches(0.9)
+                left, top, width, height = DEFAULT_PHOTO_POSITION
                 
                 slide.shapes.add_picture(image_stream, left, top, width, height)
                 print("  Photo inserted at default position")
@@ -383,38 +648,15 @@ class StudentIDCardGenerator:
         except Exception as e:
             print(f"  Error inserting photo: {e}")
     
-    def _find_photo_placeholder(self, slide):
-        """
-        Find the photo placeholder shape in the slide.
-        
-        Args:
-            slide: PowerPoint slide object
-            
-        Returns:
-            Shape object or None
-        """
-        for shape in slide.shapes:
-            # Check if shape has text containing "PHOTO" or "{{PHOTO}}"
-            if hasattr(shape, 'text'):
-                text_content = shape.text.upper()
-                if 'PHOTO' in text_content or '{{PHOTO}}' in text_content:
-                    return shape
-            
-            # Check if shape name contains "photo"
-            if hasattr(shape, 'name') and 'photo' in shape.name.lower():
-                return shape
-        
-        return None
-    
-    def _get_image_stream(self, image_url):
+    def _download_image(self, image_url):
         """
-        Download image from Google Drive URL and convert to BytesIO stream.
+        Download image from Google Drive URL.
         
         Args:
             image_url (str): Google Drive download URL
             
         Returns:
-            BytesIO stream or None
+            bytes: Image file contents, or None
         """
         try:
             print(f"  Downloading image from: {image_url}")
@@ -432,72 +674,80 @@ class StudentIDCardGenerator:
             image_data = response.content
             print(f"  Downloaded {len(image_data)} bytes")
             
-            # Process the image
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Resize image if too large (maintain aspect ratio)
-            max_size = (400, 500)  # Maximum width, height
-            image.thumbnail(max_size, Image.Resampling.LANCZOS)
-            print(f"  Resized image to: {image.size}")
-            
-            # Save to BytesIO stream
-            image_stream = io.BytesIO()
-            image.save(image_stream, format='JPEG', quality=85)
-            image_stream.seek(0)
-            
-            return image_stream
+            return image_data
             
         except requests.RequestException as e:
             print(f"  Network error downloading image: {e}")
             return None
+    
+    def _read_stored_photo(self, student_data):
+        """
+        Read the uploaded photograph from document storage.
+        
+        Args:
+            student_data (dict): Student information dictionary
+            
+        Returns:
+            bytes: Photo file contents, or None if the backend only serves files by link
+        """
+        photo_upload = student_data.get('uploadedDocuments', {}).get('photographUpload', {})
+        if not self.storage or not photo_upload.get('file_id'):
+            return None
+        
+        try:
+            image_data = self.storage.read_file(photo_upload['file_id'])
+            if image_data is None:
+                return None
+            print(f"  Read {len(image_data)} bytes of photo from {self.storage.name} storage")
+            return image_data
         except Exception as e:
-            print(f"  Error processing image: {e}")
+            print(f"  Error reading stored photo: {e}")
             return None
     
-    def _replace_text_with_formatting(self, shape_or_cell, student_data):
+    def _prepare_image(self, image_data):
         """
-        Replace placeholders in text with student data and apply formatting.
+        Convert image bytes to a resized JPEG stream.
         
         Args:
-            shape_or_cell: PowerPoint shape or table cell
-            student_data (dict): Dictionary with student information
+            image_data (bytes): Image file contents
+            
+        Returns:
+            BytesIO stream
         """
-        if not hasattr(shape_or_cell, 'text'):
-            return
+        # Process the image
+        image = Image.open(io.BytesIO(image_data))
         
-        original_text = shape_or_cell.text
-        if not original_text:
-            return
+        # Convert to RGB if necessary
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
         
-        # Get placeholder mappings
-        replacements = self._get_placeholder_mappings(student_data)
+        # Resize image if too large (maintain aspect ratio)
+        max_size = (400, 500)  # Maximum width, height
+        image.thumbnail(max_size, Image.Resampling.LANCZOS)
+        print(f"  Resized image to: {image.size}")
         
-        # Check if any placeholder exists in the text
-        has_placeholder = any(placeholder in original_text for placeholder in replacements.keys())
+        # Save to BytesIO stream
+        image_stream = io.BytesIO()
+        image.save(image_stream, format='JPEG', quality=85)
+        image_stream.seek(0)
         
-        if has_placeholder:
-            # Replace all placeholders
-            new_text = original_text
-            for placeholder, value in replacements.items():
-                if placeholder in new_text:
-                    new_text = new_text.replace(placeholder, value)
-            
-            # Update the text
-            shape_or_cell.text = new_text
-            
-            # Apply uniform formatting to all text
-            if hasattr(shape_or_cell, 'text_frame') and shape_or_cell.text_frame:
-                for paragraph in shape_or_cell.text_frame.paragraphs:
-                    for run in paragraph.runs:
-                        # Apply Red Hat Display Bold, size 8 to all runs
-                        run.font.name = 'Red Hat Display Bold'
-                        run.font.size = Pt(8)
-                        run.font.bold = True
-                        run.font.color.rgb = RGBColor(0, 0, 0)  # Black
+        return image_stream
+    
+    def _fill_placeholders(self, template, shape_or_cell, location, replacements):
+        """
+        Replace the placeholders indexed at a location with student data and apply formatting.
+        
+        Args:
+            template (CompiledTemplate): Template the location belongs to
+            shape_or_cell: PowerPoint shape or table cell
+            location (PlaceholderLocation): Template text and the placeholders it contains
+            replacements (dict): Placeholder to value mappings
+        """
+        # Update the text
+        shape_or_cell.text = template.fill(location.text, replacements)
+        
+        # Apply uniform formatting to all text
+        template.apply_run_style(shape_or_cell.text_frame)
     
     def _get_placeholder_mappings(self, student_data):
         """
@@ -609,7 +859,7 @@ class StudentIDCardGenerator:
     
     def _convert_to_pdf(self, ppt_path, pdf_path):
         """
-        Convert PowerPoint to PDF.
+        Convert PowerPoint to PDF, with PowerPoint on Windows or the LibreOffice pool elsewhere.
         
         Args:
             ppt_path (str): Path to PowerPoint file
@@ -619,7 +869,9 @@ class StudentIDCardGenerator:
             bool: True if successful, False otherwise
         """
         if not WINDOWS_AVAILABLE:
-            print("  PDF conversion requires Windows with PowerPoint installed.")
+            if self.pdf_converter:
+                return self.pdf_converter.convert(ppt_path, pdf_path)
+            print("  PDF conversion requires Windows with PowerPoint installed, or LibreOffice.")
             return False
         
         try:
@@ -0,0 +1,423 @@
+"""
+Direct PDF ID Card Renderer
+Draws ID cards straight to PDF with reportlab, without building a PPTX and
+converting it. The layout is read once from the template presentation:
+page size, pictures, text boxes and table cells with their positions,
+insets, fonts, colours, alignment and line spacing, in z-order. Each card
+then only fills in the placeholder text and the photo.
+
+Only what ID card templates use is drawn: pictures and text. Shape fills,
+outlines and table borders are not. Use compare_renderers to check a
+template against the PPTX renderer before switching to this one.
+
+Template fonts are looked up as TrueType files in the font directory
+(ID_CARD_FONT_DIR), matched by name ignoring case, spaces and hyphens, so
+"Red Hat Display Bold" finds RedHatDisplay-Bold.ttf. Fonts that are not
+found fall back to the built-in Helvetica or Times faces.
+"""
+
+import glob
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import namedtuple
+
+from PIL import Image, ImageChops
+from pptx.enum.dml import MSO_COLOR_TYPE
+from pptx.enum.text import MSO_ANCHOR, PP_ALIGN
+from pptx.shapes.picture import Picture
+from reportlab import rl_config
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+# Write binary image streams. ASCII85 only makes PDFs 7-bit clean, and without reportlab's
+# C accelerator encoding the card backgrounds with it takes most of the render time.
+rl_config.useA85 = 0
+
+EMU_PER_POINT = 12700
+
+# PowerPoint's single line spacing as a multiple of the font size
+SINGLE_LINE_SPACING = 1.2
+
+# Share of differing pixels on any page above which compare_renderers fails the pdf renderer
+MAX_DIFFERING_RATIO = 0.02
+
+# Defaults for runs that set nothing (PowerPoint's 18pt black)
+DEFAULT_FONT_SIZE = 18
+DEFAULT_COLOR = (0, 0, 0)
+
+TextRun = namedtuple('TextRun', 'text font_name size bold color')
+# Line spacing is a multiple of single spacing, or exact points when line_points is set
+Paragraph = namedtuple('Paragraph', 'alignment line_multiple line_points runs')
+# A text frame; location is the template PlaceholderLocation whose text replaces the paragraphs, if any
+TextBox = namedtuple('TextBox', 'left top width height insets wrap anchor paragraphs location')
+PictureBox = namedtuple('PictureBox', 'left top width height image')
+
+
+def _points(emu):
+    return emu / EMU_PER_POINT
+
+
+class CardLayout:
+    """
+    Geometry and text of a template, in points from the top-left corner of each page.
+
+    pages is a list with one list of TextBox and PictureBox elements per
+    slide, in drawing order. The photo placeholder shape is left out; the
+    photo is drawn last at photo_box, as the PPTX renderer adds it on top.
+    """
+
+    def __init__(self, presentation, text_locations, photo_shape_index, photo_box, text_style):
+        """
+        Args:
+            presentation: Template presentation
+            text_locations (list): PlaceholderLocation entries of the compiled template
+            photo_shape_index (int): Photo placeholder shape on the first slide, or None
+            photo_box (tuple): (left, top, width, height) in points for the photo when there is no placeholder
+            text_style (dict): Run style for filled-in text (the compiled template's text style)
+        """
+        self.page_width = _points(presentation.slide_width)
+        self.page_height = _points(presentation.slide_height)
+        self.text_style = text_style
+        self.photo_box = photo_box
+        locations = {(location.slide_index, location.shape_index, location.row, location.column): location
+                     for location in text_locations}
+
+        self.pages = []
+        for slide_index, slide in enumerate(presentation.slides):
+            elements = []
+            for shape_index, shape in enumerate(slide.shapes):
+                if slide_index == 0 and shape_index == photo_shape_index:
+                    self.photo_box = (_points(shape.left), _points(shape.top), _points(shape.width), _points(shape.height))
+                    continue
+                if isinstance(shape, Picture):
+                    image = ImageReader(io.BytesIO(shape.image.blob))
+                    # Decode now, so cards rendered from several threads share the decoded pixels
+                    image.getRGBData()
+                    elements.append(PictureBox(
+                        _points(shape.left), _points(shape.top), _points(shape.width), _points(shape.height), image
+                    ))
+                elif shape.has_text_frame:
+                    location = locations.get((slide_index, shape_index, None, None))
+                    elements.append(self._text_box(
+                        shape.text_frame, shape.left, shape.top, shape.width, shape.height, location
+                    ))
+                elif shape.has_table:
+                    elements.extend(self._table_cells(slide_index, shape_index, shape, locations))
+            self.pages.append(elements)
+
+    def _table_cells(self, slide_index, shape_index, shape, locations):
+        top = shape.top
+        for row_index, row in enumerate(shape.table.rows):
+            left = shape.left
+            for column_index, column in enumerate(shape.table.columns):
+                cell = row.cells[column_index]
+                location = locations.get((slide_index, shape_index, row_index, column_index))
+                if cell.text or location:
+                    yield self._text_box(cell.text_frame, left, top, column.width, row.height, location,
+                                         insets=(cell.margin_left, cell.margin_top, cell.margin_right, cell.margin_bottom),
+                                         anchor=cell.vertical_anchor)
+                left += column.width
+            top += row.height
+
+    def _text_box(self, text_frame, left, top, width, height, location, insets=None, anchor=None):
+        if insets is None:
+            insets = (text_frame.margin_left, text_frame.margin_top, text_frame.margin_right, text_frame.margin_bottom)
+        return TextBox(
+            _points(left), _points(top), _points(width), _points(height),
+            tuple(_points(inset) for inset in insets),
+            text_frame.word_wrap is not False,
+            anchor if anchor is not None else text_frame.vertical_anchor,
+            [self._paragraph(paragraph) for paragraph in text_frame.paragraphs],
+            location
+        )
+
+    @staticmethod
+    def _paragraph(paragraph):
+        # Runs inherit what they do not set from the paragraph's end-of-paragraph properties
+        end_properties = paragraph._p.find('{http://schemas.openxmlformats.org/drawingml/2006/main}endParaRPr')
+        default_size = DEFAULT_FONT_SIZE
+        default_font = None
+        if end_properties is not None:
+            if end_properties.get('sz'):
+                default_size = int(end_properties.get('sz')) / 100
+            latin = end_properties.find('{http://schemas.openxmlformats.org/drawingml/2006/main}latin')
+            if latin is not None:
+                default_font = latin.get('typeface')
+
+        runs = []
+        for run in paragraph.runs:
+            font = run.font
+            color = DEFAULT_COLOR
+            if font.color and font.color.type == MSO_COLOR_TYPE.RGB:
+                rgb = font.color.rgb
+                color = (rgb[0] / 255, rgb[1] / 255, rgb[2] / 255)
+            runs.append(TextRun(
+                run.text,
+                font.name or default_font,
+                font.size.pt if font.size else default_size,
+                bool(font.bold),
+                color
+            ))
+
+        line_spacing = paragraph.line_spacing
+        if line_spacing is None or isinstance(line_spacing, float):
+            return Paragraph(paragraph.alignment, line_spacing or 1.0, None, runs)
+        return Paragraph(paragraph.alignment, None, line_spacing.pt, runs)
+
+    def filled_paragraphs(self, text):
+        """Paragraphs of filled-in placeholder text, styled as the PPTX renderer styles them"""
+        style = self.text_style
+        color = style['color']
+        return [
+            Paragraph(None, 1.0, None, [TextRun(
+                line, style['font_name'], style['size'].pt, style['bold'],
+                (color[0] / 255, color[1] / 255, color[2] / 255)
+            )])
+            for line in text.replace('\v', '\n').split('\n')
+        ]
+
+
+_registered_fonts = {}
+_fonts_lock = threading.Lock()
+
+
+def _normalize_font_name(name):
+    return re.sub(r'[\s_-]', '', name).lower()
+
+
+def resolve_font(font_name, bold, font_dir=None):
+    """
+    Get the reportlab font name for a template font, registering its TrueType file on first use.
+
+    Args:
+        font_name (str): Typeface named in the template
+        bold (bool): Whether the run is bold, for the built-in fallback
+        font_dir (str): Directory searched for TrueType files
+
+    Returns:
+        str: Registered or built-in reportlab font name
+    """
+    key = (font_name, bold, font_dir)
+    with _fonts_lock:
+        if key in _registered_fonts:
+            return _registered_fonts[key]
+
+        resolved = None
+        if font_name and font_dir and os.path.isdir(font_dir):
+            wanted = {_normalize_font_name(font_name)}
+            if bold:
+                wanted.add(_normalize_font_name(f"{font_name} Bold"))
+            for path in glob.glob(os.path.join(font_dir, '**', '*.[tT][tT][fF]'), recursive=True):
+                if _normalize_font_name(os.path.splitext(os.path.basename(path))[0]) in wanted:
+                    resolved = f"card-{_normalize_font_name(os.path.basename(path))}"
+                    if resolved not in pdfmetrics.getRegisteredFontNames():
+                        pdfmetrics.registerFont(TTFont(resolved, path))
+                    break
+
+        if resolved is None:
+            lowered = (font_name or '').lower()
+            bold = bold or 'bold' in lowered
+            if 'serif' in lowered and 'sans' not in lowered:
+                resolved = 'Times-Bold' if bold else 'Times-Roman'
+            else:
+                resolved = 'Helvetica-Bold' if bold else 'Helvetica'
+
+        _registered_fonts[key] = resolved
+        return resolved
+
+
+def _wrap_paragraph(paragraph, width, wrap, font_dir):
+    """Split a paragraph's runs into lines of (text, reportlab font, run) fragments that fit the width"""
+    lines = [[]]
+    line_width = 0
+    for run in paragraph.runs:
+        font = resolve_font(run.font_name, run.bold, font_dir)
+        for token in re.findall(r'\S+\s*|\s+', run.text):
+            token_width = pdfmetrics.stringWidth(token, font, run.size)
+            if wrap and lines[-1] and line_width + pdfmetrics.stringWidth(token.rstrip(), font, run.size) > width:
+                lines.append([])
+                line_width = 0
+                token = token.lstrip()
+                token_width = pdfmetrics.stringWidth(token, font, run.size)
+            lines[-1].append((token, font, run))
+            line_width += token_width
+    return lines
+
+
+def _line_height(paragraph, fragments, default_size):
+    size = max((run.size for _, _, run in fragments), default=default_size)
+    if paragraph.line_points is not None:
+        return paragraph.line_points
+    return size * SINGLE_LINE_SPACING * paragraph.line_multiple
+
+
+def _draw_text_box(pdf, box, paragraphs, page_height, font_dir):
+    left_inset, top_inset, right_inset, bottom_inset = box.insets
+    width = box.width - left_inset - right_inset
+
+    # Lay out every line first so the block can be anchored vertically
+    laid_out = []
+    for paragraph in paragraphs:
+        default_size = paragraph.runs[0].size if paragraph.runs else DEFAULT_FONT_SIZE
+        for fragments in _wrap_paragraph(paragraph, width, box.wrap, font_dir):
+            laid_out.append((paragraph, fragments, _line_height(paragraph, fragments, default_size)))
+
+    block_height = sum(line_height for _, _, line_height in laid_out)
+    y = box.top + top_inset
+    if box.anchor == MSO_ANCHOR.MIDDLE:
+        y += max(0, (box.height - top_inset - bottom_inset - block_height) / 2)
+    elif box.anchor == MSO_ANCHOR.BOTTOM:
+        y += max(0, box.height - top_inset - bottom_inset - block_height)
+
+    for paragraph, fragments, line_height in laid_out:
+        y += line_height
+        if not fragments:
+            continue
+        # Baseline sits one descent above the bottom of the line
+        descent = max(-pdfmetrics.getDescent(font, run.size) for _, font, run in fragments)
+        baseline = page_height - (y - descent)
+
+        text_width = sum(pdfmetrics.stringWidth(text, font, run.size) for text, font, run in fragments)
+        trailing = fragments[-1]
+        text_width -= pdfmetrics.stringWidth(trailing[0], trailing[1], trailing[2].size) - \
+            pdfmetrics.stringWidth(trailing[0].rstrip(), trailing[1], trailing[2].size)
+
+        x = box.left + left_inset
+        if paragraph.alignment == PP_ALIGN.CENTER:
+            x += (width - text_width) / 2
+        elif paragraph.alignment == PP_ALIGN.RIGHT:
+            x += width - text_width
+
+        for text, font, run in fragments:
+            pdf.setFont(font, run.size)
+            pdf.setFillColorRGB(*run.color)
+            pdf.drawString(x, baseline, text)
+            x += pdfmetrics.stringWidth(text, font, run.size)
+
+
+def render_card_pdf(layout, filled_texts, photo_stream, pdf_path, font_dir=None):
+    """
+    Draw one ID card to a PDF file.
+
+    Args:
+        layout (CardLayout): Template layout
+        filled_texts (dict): PlaceholderLocation to its text with placeholders filled in
+        photo_stream: Image stream for the photo, or None
+        pdf_path (str): Output file
+        font_dir (str): Directory holding the template's TrueType fonts
+    """
+    pdf = canvas.Canvas(pdf_path, pagesize=(layout.page_width, layout.page_height))
+    page_height = layout.page_height
+    for page_index, elements in enumerate(layout.pages):
+        for element in elements:
+            if isinstance(element, PictureBox):
+                pdf.drawImage(element.image, element.left, page_height - element.top - element.height,
+                              element.width, element.height, mask='auto')
+            else:
+                paragraphs = element.paragraphs
+                if element.location is not None:
+                    paragraphs = layout.filled_paragraphs(filled_texts[element.location])
+                _draw_text_box(pdf, element, paragraphs, page_height, font_dir)
+
+        if page_index == 0 and photo_stream is not None:
+            left, top, width, height = layout.photo_box
+            pdf.drawImage(ImageReader(photo_stream), left, page_height - top - height, width, height)
+        pdf.showPage()
+    pdf.save()
+
+
+def rasterize_pdf(pdf_path, dpi=150):
+    """
+    Render each page of a PDF to an image with poppler's pdftoppm.
+
+    Returns:
+        list: PIL images, one per page
+    """
+    pdftoppm = shutil.which('pdftoppm')
+    if not pdftoppm:
+        raise RuntimeError("Rasterizing PDFs requires pdftoppm (poppler-utils)")
+    out_dir = tempfile.mkdtemp(prefix='card-raster-')
+    try:
+        subprocess.run([pdftoppm, '-r', str(dpi), '-png', pdf_path, os.path.join(out_dir, 'page')],
+                       check=True, capture_output=True, timeout=60)
+        pages = []
+        for path in sorted(glob.glob(os.path.join(out_dir, 'page*.png'))):
+            with Image.open(path) as page:
+                pages.append(page.convert('RGB'))
+        return pages
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def compare_renderers(generator, student_data, output_dir, dpi=150, threshold=48, photo_data=None,
+                      max_differing_ratio=MAX_DIFFERING_RATIO):
+    """
+    Render a card with both renderers and compare the PDFs pixel by pixel.
+
+    The PPTX path needs PDF conversion (PowerPoint or LibreOffice) and both
+    need pdftoppm to rasterize. Per page, pixels whose largest channel
+    difference exceeds threshold count as differing; a diff image marking
+    them is written to output_dir next to both PDFs. The comparison passes
+    when no page has more than max_differing_ratio of its pixels differing.
+
+    Args:
+        generator (StudentIDCardGenerator): Generator with the template and PDF converter
+        student_data (dict): Student record to render
+        output_dir (str): Folder for the PDFs and diff images
+        dpi (int): Rasterization resolution
+        threshold (int): Channel difference (0-255) above which a pixel differs
+        photo_data (bytes): Photo for both renders (default: fetched once by the generator)
+        max_differing_ratio (float): Largest share of differing pixels a page may have and pass
+
+    Returns:
+        dict: Whether it passed, per-page differing pixel ratio and mean difference, with file paths
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if photo_data is None:
+        photo_data = generator.fetch_photo(student_data) or b''
+
+    results = {}
+    for renderer in ('pptx', 'pdf'):
+        rendered = generator.render_id_card(student_data, photo_data, f"compare_{renderer}", renderer=renderer)
+        if not rendered['success'] or not rendered['pdf_path']:
+            raise RuntimeError(f"{renderer} renderer produced no PDF: {rendered.get('error', 'PDF conversion unavailable')}")
+        destination = os.path.join(output_dir, f"card_{renderer}.pdf")
+        if os.path.abspath(rendered['pdf_path']) != os.path.abspath(destination):
+            shutil.move(rendered['pdf_path'], destination)
+        results[renderer] = {'pdf_path': destination, 'timings': rendered['timings']}
+
+    pptx_pages = rasterize_pdf(results['pptx']['pdf_path'], dpi)
+    pdf_pages = rasterize_pdf(results['pdf']['pdf_path'], dpi)
+    if len(pptx_pages) != len(pdf_pages):
+        raise RuntimeError(f"Page count differs: pptx {len(pptx_pages)}, pdf {len(pdf_pages)}")
+
+    pages = []
+    for page_number, (expected, actual) in enumerate(zip(pptx_pages, pdf_pages), start=1):
+        if actual.size != expected.size:
+            actual = actual.resize(expected.size)
+        difference = ImageChops.difference(expected, actual)
+        channel_max = difference.split()
+        largest = ImageChops.lighter(ImageChops.lighter(channel_max[0], channel_max[1]), channel_max[2])
+        mask = largest.point(lambda value: 255 if value > threshold else 0)
+        histogram = largest.histogram()
+        pixel_count = expected.width * expected.height
+
+        diff_path = os.path.join(output_dir, f"diff_page{page_number}.png")
+        Image.composite(Image.new('RGB', expected.size, (255, 0, 0)), expected.point(lambda value: 128 + value // 2), mask).save(diff_path)
+        differing_ratio = sum(histogram[threshold + 1:]) / pixel_count
+        pages.append({
+            'page': page_number,
+            'passed': differing_ratio <= max_differing_ratio,
+            'differing_ratio': differing_ratio,
+            'mean_difference': sum(value * count for value, count in enumerate(histogram)) / pixel_count,
+            'diff_path': diff_path
+        })
+
+    return {'passed': all(page['passed'] for page in pages), 'pages': pages, 'renderers': results}
@@ -0,0 +1,352 @@
+"""
+MongoDB Job Queue
+Durable background jobs stored in one collection. Workers claim jobs
+atomically with find_one_and_update and hold them under a lease: a job
+whose worker dies becomes claimable again once its lease expires. Failed
+jobs are retried with exponential backoff, and jobs that keep failing are
+dead-lettered until an admin replays them.
+
+Job states:
+    queued    - waiting for run_at
+    running   - claimed by a worker until lease_expires_at
+    succeeded - handler returned
+    dead      - failed max_attempts times
+"""
+
+import os
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+
+
+JOBS_COLLECTION = 'jobs'
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'dead')
+
+# Failure messages kept per job
+ERROR_HISTORY_LIMIT = 10
+
+# Recorded for jobs whose worker stopped renewing the lease on their last attempt
+EXPIRED_LEASE_ERROR = 'Lease expired on the last attempt'
+
+
+def enqueue_job(jobs_collection, job_type, payload, max_attempts=5, delay_seconds=0):
+    """
+    Add a job to the queue.
+
+    Args:
+        jobs_collection: Jobs collection
+        job_type (str): Handler name
+        payload (dict): Handler arguments, stored as-is
+        max_attempts (int): Attempts before the job is dead-lettered
+        delay_seconds (float): Earliest start, relative to now
+
+    Returns:
+        ObjectId: The new job's ID
+    """
+    now = datetime.utcnow()
+    result = jobs_collection.insert_one({
+        'type': job_type,
+        'payload': payload,
+        'status': 'queued',
+        'attempts': 0,
+        'max_attempts': max_attempts,
+        'run_at': now + timedelta(seconds=delay_seconds),
+        'created_at': now,
+        'updated_at': now,
+        'errors': []
+    })
+    return result.inserted_id
+
+
+def claim_job(jobs_collection, worker_id, job_types=None, lease_seconds=300):
+    """
+    Atomically claim the next due job.
+
+    Expired leases are claimable too, so jobs held by a crashed worker are
+    picked up again while they have attempts left; the rest are left for
+    dead_letter_expired_job. Each claim counts as an attempt.
+
+    Returns:
+        dict: The claimed job, or None if nothing is due
+    """
+    now = datetime.utcnow()
+    query = {'$or': [
+        {'status': 'queued', 'run_at': {'$lte': now}},
+        {'status': 'running', 'lease_expires_at': {'$lt': now},
+         '$expr': {'$lt': ['$attempts', '$max_attempts']}}
+    ]}
+    if job_types:
+        query['type'] = {'$in': list(job_types)}
+
+    return jobs_collection.find_one_and_update(
+        query,
+        {
+            '$set': {
+                'status': 'running',
+                'worker_id': worker_id,
+                'started_at': now,
+                'lease_expires_at': now + timedelta(seconds=lease_seconds),
+                'updated_at': now
+            },
+            '$inc': {'attempts': 1}
+        },
+        sort=[('run_at', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def dead_letter_expired_job(jobs_collection, job_types=None):
+    """
+    Dead-letter one job whose lease expired on its last attempt.
+
+    Such a job most likely killed its worker, so it is not claimed again.
+
+    Returns:
+        dict: The job as it was claimed, or None if there is none
+    """
+    now = datetime.utcnow()
+    query = {
+        'status': 'running',
+        'lease_expires_at': {'$lt': now},
+        '$expr': {'$gte': ['$attempts', '$max_attempts']}
+    }
+    if job_types:
+        query['type'] = {'$in': list(job_types)}
+
+    job = jobs_collection.find_one(query)
+    if not job:
+        return None
+    result = jobs_collection.update_one(
+        {**_claim_filter(job), 'lease_expires_at': {'$lt': now}},
+        {
+            '$set': {'status': 'dead', 'last_error': EXPIRED_LEASE_ERROR, 'dead_at': now, 'updated_at': now},
+            '$unset': {'lease_expires_at': ''},
+            '$push': {'errors': {
+                '$each': [{'attempt': job['attempts'], 'error': EXPIRED_LEASE_ERROR, 'at': now}],
+                '$slice': -ERROR_HISTORY_LIMIT
+            }}
+        }
+    )
+    return job if result.matched_count == 1 else None
+
+
+def _claim_filter(job):
+    # Matches only while this claim still holds the job, so a worker whose
+    # lease expired cannot overwrite the state written by the next claimant
+    return {'_id': job['_id'], 'status': 'running', 'attempts': job['attempts']}
+
+
+def extend_lease(jobs_collection, job, lease_seconds=300):
+    """Push back a running job's lease. Returns False if the claim was lost."""
+    now = datetime.utcnow()
+    result = jobs_collection.update_one(
+        _claim_filter(job),
+        {'$set': {'lease_expires_at': now + timedelta(seconds=lease_seconds), 'updated_at': now}}
+    )
+    return result.matched_count == 1
+
+
+def complete_job(jobs_collection, job, result=None):
+    """Mark a claimed job as succeeded. Returns False if the claim was lost."""
+    now = datetime.utcnow()
+    update = jobs_collection.update_one(
+        _claim_filter(job),
+        {
+            '$set': {'status': 'succeeded', 'result': result, 'finished_at': now, 'updated_at': now},
+            '$unset': {'lease_expires_at': '', 'last_error': ''}
+        }
+    )
+    return update.matched_count == 1
+
+
+def retry_delay(attempts, base_seconds=30, max_seconds=3600):
+    """Exponential backoff with jitter for the given number of attempts so far"""
+    delay = min(max_seconds, base_seconds * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def fail_job(jobs_collection, job, error, base_seconds=30, max_seconds=3600):
+    """
+    Record a failed attempt, scheduling a retry or dead-lettering the job.
+
+    Returns:
+        str: The job's new status ('queued' or 'dead'), or None if the claim was lost
+    """
+    now = datetime.utcnow()
+    dead = job['attempts'] >= job.get('max_attempts', 1)
+    update = {
+        'status': 'dead' if dead else 'queued',
+        'last_error': error,
+        'updated_at': now
+    }
+    if dead:
+        update['dead_at'] = now
+    else:
+        update['run_at'] = now + timedelta(seconds=retry_delay(job['attempts'], base_seconds, max_seconds))
+
+    result = jobs_collection.update_one(
+        _claim_filter(job),
+        {
+            '$set': update,
+            '$unset': {'lease_expires_at': ''},
+            '$push': {'errors': {
+                '$each': [{'attempt': job['attempts'], 'error': error, 'at': now}],
+                '$slice': -ERROR_HISTORY_LIMIT
+            }}
+        }
+    )
+    if result.matched_count != 1:
+        return None
+    return update['status']
+
+
+def replay_job(jobs_collection, job_id):
+    """
+    Queue a dead or finished job again with a fresh attempt budget.
+
+    Returns:
+        dict: The replayed job, or None if it does not exist or is still queued or running
+    """
+    try:
+        job_id = ObjectId(job_id)
+    except (InvalidId, TypeError):
+        return None
+
+    now = datetime.utcnow()
+    return jobs_collection.find_one_and_update(
+        {'_id': job_id, 'status': {'$in': ['dead', 'succeeded']}},
+        {
+            '$set': {'status': 'queued', 'attempts': 0, 'run_at': now, 'updated_at': now, 'replayed_at': now},
+            '$unset': {'dead_at': '', 'finished_at': ''}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def list_jobs(jobs_collection, status=None, job_type=None, limit=50):
+    """Get the most recently updated jobs, optionally filtered by status and type"""
+    query = {}
+    if status:
+        query['status'] = status
+    if job_type:
+        query['type'] = job_type
+    return list(jobs_collection.find(query).sort('updated_at', -1).limit(limit))
+
+
+def job_counts(jobs_collection):
+    """
+    Count jobs per type and status in one aggregation.
+
+    Returns:
+        dict: Job type to {status: count}
+    """
+    counts = {}
+    for row in jobs_collection.aggregate([
+        {'$group': {'_id': {'type': '$type', 'status': '$status'}, 'count': {'$sum': 1}}}
+    ]):
+        counts.setdefault(row['_id']['type'], {})[row['_id']['status']] = row['count']
+    return counts
+
+
+class JobWorker:
+    """
+    Claims and runs jobs until stopped.
+
+    Handlers are called with the job payload and their return value is
+    stored as the job result; raising fails the attempt. The lease is
+    renewed in the background while a handler runs, so long jobs are not
+    claimed twice.
+    """
+
+    def __init__(self, jobs_collection, handlers, dead_letter_handlers=None, job_types=None,
+                 lease_seconds=300, poll_interval=2.0, retry_base_seconds=30, retry_max_seconds=3600):
+        """
+        Args:
+            jobs_collection: Jobs collection
+            handlers (dict): Job type to callable(payload)
+            dead_letter_handlers (dict): Job type to callable(payload, error), run when a job is dead-lettered
+            job_types (iterable): Only claim these types (default: every handled type)
+            lease_seconds (int): How long a claim lasts without renewal
+            poll_interval (float): Seconds to wait when no job is due
+            retry_base_seconds (float): Backoff after the first failure
+            retry_max_seconds (float): Upper bound on the backoff
+        """
+        self.jobs_collection = jobs_collection
+        self.handlers = handlers
+        self.dead_letter_handlers = dead_letter_handlers or {}
+        self.job_types = list(job_types or handlers)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    def _keep_lease(self, job, stop):
+        while not stop.wait(self.lease_seconds / 3):
+            if not extend_lease(self.jobs_collection, job, self.lease_seconds):
+                print(f"[WARNING] Lost lease on job {job['_id']}")
+                return
+
+    def _dead_lettered(self, job, error):
+        print(f"Job {job['_id']} ({job['type']}) dead-lettered")
+        dead_letter_handler = self.dead_letter_handlers.get(job['type'])
+        if dead_letter_handler:
+            try:
+                dead_letter_handler(job['payload'], error)
+            except Exception as handler_error:
+                print(f"Dead-letter handler for job {job['_id']} failed: {handler_error}")
+
+    def run_job(self, job):
+        """Run one claimed job and record its outcome"""
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._keep_lease, args=(job, stop), daemon=True)
+        heartbeat.start()
+        try:
+            handler = self.handlers.get(job['type'])
+            if handler is None:
+                raise RuntimeError(f"No handler for job type {job['type']}")
+            result = handler(job['payload'])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            status = fail_job(self.jobs_collection, job, error, self.retry_base_seconds, self.retry_max_seconds)
+            print(f"Job {job['_id']} ({job['type']}) attempt {job['attempts']} failed: {error}")
+            if status == 'dead':
+                self._dead_lettered(job, error)
+            return False
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        complete_job(self.jobs_collection, job, result)
+        print(f"Job {job['_id']} ({job['type']}) succeeded")
+        return True
+
+    def run_once(self):
+        """Claim and run one job. Returns False if no job was due."""
+        while True:
+            expired = dead_letter_expired_job(self.jobs_collection, self.job_types)
+            if not expired:
+                break
+            self._dead_lettered(expired, EXPIRED_LEASE_ERROR)
+
+        job = claim_job(self.jobs_collection, self.worker_id, self.job_types, self.lease_seconds)
+        if not job:
+            return False
+        self.run_job(job)
+        return True
+
+    def run(self, stop_when_idle=False):
+        """Process jobs until interrupted, or until the queue is idle if stop_when_idle"""
+        print(f"Job worker {self.worker_id} started for: {', '.join(self.job_types)}")
+        while True:
+            if self.run_once():
+                continue
+            if stop_when_idle:
+                return
+            time.sleep(self.poll_interval)
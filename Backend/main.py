@@ -1,13 +1,20 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, request, jsonify, Response, send_from_directory, stream_with_context, has_request_context
 from flask_cors import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, ReplaceOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from bson import ObjectId
 import uuid
 from datetime import datetime, timedelta
 import re
 import os
 import io
-from werkzeug.exceptions import BadRequest
+import json
+import csv
+import tempfile
+import shutil
+import base64
+import hashlib
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import cloudinary
@@ -17,16 +24,46 @@ import jwt
 from functools import wraps
 from twilio.rest import Client
 import random
-from idcard import StudentIDCardGenerator, StudentDataFormatter
+import time
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+from idcard import ID_CARD_RENDERERS, StudentIDCardGenerator, StudentDataFormatter
+from idcard_pdf import MAX_DIFFERING_RATIO, compare_renderers
+from id_card_batch import generate_id_cards_batch
+from pdf_conversion import get_pdf_converter
+from department_stats import (
+    STATS_COLLECTION, aggregate_admin_stats, aggregate_department_stats, read_admin_stats, read_department_stats, reconcile_admin_stats,
+    reconcile_department_stats, record_admin_role_change, record_status_change, record_student_registered
+)
+from ttl_cache import StaleWhileRevalidateCache
+from jobs import JOBS_COLLECTION, JOB_STATUSES, JobWorker, enqueue_job, job_counts, list_jobs, replay_job
+from db_indexes import (
+    DEPARTMENT_INDEXES, REGISTRATION_UNIQUE_INDEXES, ensure_collection_indexes, ensure_indexes, missing_unique_indexes,
+    report_indexes
+)
+from student_storage import (
+    CHECKPOINT_COLLECTION, STORAGE_MODES, UNIFIED_COLLECTION, DepartmentScopedCollection, DualWriteCollection,
+    migrate_department_collections, reset_migration_checkpoint, verify_unified_migration
+)
+import click
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Google Drive imports
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
-from google.oauth2.service_account import Credentials
+# Document storage imports
+from drive_client import get_drive_client_factory
+from storage import DriveStorage, LocalStorage, S3Storage
+from drive_folders import FOLDER_LOCKS_COLLECTION, FolderIdCache, folder_lock
+from upload_sessions import (
+    UPLOAD_SESSIONS_COLLECTION, append_chunk, claim_upload_session, create_upload_session,
+    finish_upload_session, get_upload_session, received_bytes, spool_digest
+)
+from document_hashes import (
+    DOCUMENT_HASHES_COLLECTION, HashingSpooledFile, find_stored_documents, record_stored_documents, stream_digest
+)
 
 app = Flask(__name__)
 application = app
@@ -51,9 +88,18 @@ DATABASE_NAME = os.getenv('DATABASE_NAME', 'student_registration')
 if not MONGO_URI:
     raise ValueError("MONGO_URI environment variable is required")
 
+# Create declared indexes the first time each process connects
+AUTO_CREATE_INDEXES = os.getenv('AUTO_CREATE_INDEXES', 'true').lower() == 'true'
+
+# Student record storage: per-department collections, unified collection, or a migration step between them
+STUDENT_STORAGE_MODE = os.getenv('STUDENT_STORAGE_MODE', 'department').lower()
+if STUDENT_STORAGE_MODE not in STORAGE_MODES:
+    raise ValueError(f"STUDENT_STORAGE_MODE must be one of: {', '.join(STORAGE_MODES)}")
+
 # Global variables for lazy connection (fork-safe)
 _client = None
 _db = None
+_indexed_department_collections = set()
 
 def get_db():
     """Get database connection, initialize if needed (fork-safe)"""
@@ -68,8 +114,120 @@ def get_db():
         except Exception as e:
             print(f"[ERROR] Failed to connect to MongoDB: {e}")
             raise
+        if AUTO_CREATE_INDEXES:
+            bootstrap_indexes()
     return _db
 
+def bootstrap_indexes():
+    """Create all declared indexes, including every known department collection"""
+    try:
+        # Before the partial unique index is built, so legacy JU application numbers are covered by it
+        backfill_ju_application_flags()
+        # Legacy department collections are not used once storage is fully unified
+        department_collections = list_department_collections() if STUDENT_STORAGE_MODE != 'unified' else []
+        ensure_indexes(_db, department_collections)
+        _indexed_department_collections.update(department_collections)
+        print("[SUCCESS] MongoDB indexes verified")
+    except Exception as e:
+        print(f"[ERROR] Failed to create MongoDB indexes: {e}")
+    registration_indexes_ready()
+
+_registration_indexes_ready = False
+
+def registration_indexes_ready():
+    """
+    Check the unique indexes that reject duplicate registrations are in place.
+    
+    Until they are, registration falls back to checking for an existing record before inserting.
+    The result is cached once the indexes are found.
+    """
+    global _registration_indexes_ready
+    if not _registration_indexes_ready:
+        missing = missing_unique_indexes(get_students_collection(), REGISTRATION_UNIQUE_INDEXES)
+        _registration_indexes_ready = not missing
+        if missing:
+            print(f"[ERROR] Unique indexes missing on students: {', '.join(missing)} - duplicate registrations "
+                  f"are only caught by pre-insert checks until 'flask --app main indexes ensure' succeeds")
+    return _registration_indexes_ready
+
+def list_department_collections():
+    """Get the normalized names of all department collections"""
+    return sorted(get_department_registry()['by_key'])
+
+@app.cli.group('unified-students')
+def unified_students_command():
+    """Migrate per-department collections into the unified students collection."""
+
+@unified_students_command.command('migrate')
+@click.option('--batch-size', default=500, show_default=True, help='Records copied per bulk write.')
+@click.option('--pause', default=0.0, show_default=True, help='Seconds to sleep between batches.')
+@click.option('--restart', is_flag=True, help='Ignore the saved checkpoint and start over.')
+def migrate_unified_students_command(batch_size, pause, restart):
+    """Backfill the unified collection. Run with all app processes in dual_write mode."""
+    if STUDENT_STORAGE_MODE != 'dual_write':
+        click.echo(f"Warning: STUDENT_STORAGE_MODE is '{STUDENT_STORAGE_MODE}' here; app processes must be in dual_write mode during the backfill")
+    if restart:
+        reset_migration_checkpoint(get_db())
+    copied = migrate_department_collections(get_db(), list_department_collections(), batch_size, pause)
+    click.echo(f"Copied {sum(copied.values())} records")
+
+@unified_students_command.command('verify')
+def verify_unified_students_command():
+    """Check every department record exists in the unified collection."""
+    results = verify_unified_migration(get_db(), list_department_collections())
+    for department_key, result in results.items():
+        status = 'ok' if result['verified'] else f"{len(result['missing'])} missing"
+        click.echo(f"{department_key}: {result['source_count']} source / {result['unified_count']} unified - {status}")
+    if not all(result['verified'] for result in results.values()):
+        raise SystemExit(1)
+    click.echo("All departments verified - reads can be switched with STUDENT_STORAGE_MODE=unified_read")
+
+@app.cli.group('indexes')
+def indexes_command():
+    """Manage MongoDB indexes."""
+
+def backfill_ju_application_flags():
+    """Flag legacy records with a real JU application number so the unique index covers them"""
+    result = get_students_collection().update_many(
+        {
+            "juApplicationConfirmed": {"$exists": False},
+            "juApplication": {"$exists": True, "$nin": [None, ""], "$not": re.compile('^TEMP_')}
+        },
+        {"$set": {"juApplicationConfirmed": True}}
+    )
+    return result.modified_count
+
+@indexes_command.command('ensure')
+def ensure_indexes_command():
+    """Create all declared indexes."""
+    flagged = backfill_ju_application_flags()
+    if flagged:
+        click.echo(f"Flagged {flagged} legacy records with confirmed JU application numbers")
+    results = ensure_indexes(get_db(), list_department_collections())
+    for collection_name, result in results.items():
+        status = 'ok' if not result['errors'] else f"{len(result['errors'])} error(s)"
+        click.echo(f"{collection_name}: {status}")
+        for index_name, error in result['errors'].items():
+            click.echo(f"  {index_name}: {error}")
+    missing = missing_unique_indexes(get_students_collection(), REGISTRATION_UNIQUE_INDEXES)
+    if missing:
+        raise click.ClickException(
+            f"Unique indexes missing on students: {', '.join(missing)} - remove the duplicate records and run again"
+        )
+
+@indexes_command.command('report')
+def report_indexes_command():
+    """Report missing, unused and undeclared indexes."""
+    report = report_indexes(get_db(), list_department_collections())
+    for collection_name, details in report.items():
+        if not details['exists']:
+            click.echo(f"{collection_name}: collection does not exist yet")
+            continue
+        click.echo(f"{collection_name}:")
+        click.echo(f"  missing:    {', '.join(details['missing']) or '-'}")
+        click.echo(f"  unused:     {', '.join(details['unused']) or '-'}")
+        click.echo(f"  undeclared: {', '.join(details['undeclared']) or '-'}")
+
 def get_collection(collection_name):
     """Get a specific collection from the database"""
     db = get_db()
@@ -91,10 +249,59 @@ def get_documents_collection():
 def get_admin_logs_collection():
     return get_collection('admin_logs')
 
+def get_student_read_model_collection():
+    return get_collection('student_list_view')
+
+def get_department_stats_collection():
+    return get_collection(STATS_COLLECTION)
+
+def get_department_registry_collection():
+    return get_collection('department_registry')
+
+def get_jobs_collection():
+    return get_collection(JOBS_COLLECTION)
+
+def get_folder_locks_collection():
+    return get_collection(FOLDER_LOCKS_COLLECTION)
+
+def get_document_hashes_collection():
+    return get_collection(DOCUMENT_HASHES_COLLECTION)
+
+def get_upload_sessions_collection():
+    return get_collection(UPLOAD_SESSIONS_COLLECTION)
+
+def get_unified_students_collection():
+    return get_collection(UNIFIED_COLLECTION)
+
 def get_department_collection(department):
-    """Get department-specific collection"""
+    """Get department-specific collection, routed according to STUDENT_STORAGE_MODE"""
     normalized_dept = normalize_department_name(department)
-    return get_collection(normalized_dept)
+    unified = DepartmentScopedCollection(get_unified_students_collection(), normalized_dept)
+    if STUDENT_STORAGE_MODE == 'unified':
+        return unified
+    
+    collection = get_collection(normalized_dept)
+    if AUTO_CREATE_INDEXES and normalized_dept not in _indexed_department_collections:
+        _indexed_department_collections.add(normalized_dept)
+        ensure_collection_indexes(get_db(), normalized_dept, DEPARTMENT_INDEXES)
+    
+    if STUDENT_STORAGE_MODE == 'dual_write':
+        return DualWriteCollection(collection, unified)
+    if STUDENT_STORAGE_MODE == 'unified_read':
+        return DualWriteCollection(unified, collection)
+    return collection
+
+def find_student_record(student_id):
+    """Get a student's full department record by student ID"""
+    if STUDENT_STORAGE_MODE in ('unified', 'unified_read'):
+        # One indexed query, no department lookup needed
+        return get_unified_students_collection().find_one({"student_id": student_id})
+    
+    student_record = get_students_collection().find_one({"student_id": student_id})
+    if not student_record:
+        return None
+    department = normalize_department_name(student_record['department'])
+    return get_department_collection(department).find_one({"student_id": student_id})
 
 # Cloudinary configuration
 cloudinary.config(
@@ -112,14 +319,26 @@ SCOPES = ['https://www.googleapis.com/auth/drive']
 SERVICE_ACCOUNT_FILE = os.getenv('GOOGLE_SERVICE_ACCOUNT_FILE', './credentials.json')
 PARENT_FOLDER_ID = os.getenv('GOOGLE_DRIVE_PARENT_FOLDER_ID')
 
+# Document storage: 'drive' (Google Drive), 'local' (LOCAL_STORAGE_ROOT on this
+# machine) or 's3' (an S3-compatible bucket such as MinIO, requires boto3).
+# Switching backends does not move documents already stored.
+# Local files are served at LOCAL_STORAGE_BASE_URL to authenticated admins of the owning student's department,
+# or to anyone holding a link signed with SECRET_KEY until it expires. A relative base URL is resolved
+# against the host of the API request that hands the link out.
+DOCUMENT_STORAGE_BACKEND = os.getenv('DOCUMENT_STORAGE_BACKEND', 'drive').lower()
+LOCAL_STORAGE_ROOT = os.getenv('LOCAL_STORAGE_ROOT', './document_storage')
+LOCAL_STORAGE_BASE_URL = os.getenv('LOCAL_STORAGE_BASE_URL', '/api/storage/files')
+LOCAL_STORAGE_LINK_TTL_SECONDS = int(os.getenv('LOCAL_STORAGE_LINK_TTL_SECONDS', '900'))
+S3_BUCKET = os.getenv('S3_BUCKET')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+S3_PREFIX = os.getenv('S3_PREFIX', '')
+S3_PUBLIC_BASE_URL = os.getenv('S3_PUBLIC_BASE_URL')
+S3_REGION = os.getenv('S3_REGION')
+
 # Validate Google Drive config
-if not PARENT_FOLDER_ID:
+if DOCUMENT_STORAGE_BACKEND == 'drive' and not PARENT_FOLDER_ID:
     print("Warning: GOOGLE_DRIVE_PARENT_FOLDER_ID not set. Document uploads may not work.")
 
-# File configuration from environment
-ALLOWED_EXTENSIONS = set(os.getenv('ALLOWED_EXTENSIONS', 'pdf,png,jpg,jpeg').split(','))
-MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE_MB', '5')) * 1024 * 1024  # Convert MB to bytes
-
 # Document types mapping for better organization
 DOCUMENT_TYPES = {
     'aadhaarUpload': 'Aadhaar_Card',
@@ -132,6 +351,110 @@ DOCUMENT_TYPES = {
     'photographUpload': 'Passport_Photograph'
 }
 
+# File configuration from environment
+ALLOWED_EXTENSIONS = set(os.getenv('ALLOWED_EXTENSIONS', 'pdf,png,jpg,jpeg').split(','))
+MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE_MB', '5')) * 1024 * 1024  # Convert MB to bytes
+
+# Concurrent Drive uploads per registration; 1 uploads documents one at a time
+DRIVE_UPLOAD_CONCURRENCY = max(1, int(os.getenv('DRIVE_UPLOAD_CONCURRENCY', '4')))
+
+# Student folder IDs remembered per process, so repeat uploads skip the Drive search
+DRIVE_FOLDER_CACHE_SIZE = int(os.getenv('DRIVE_FOLDER_CACHE_SIZE', '1024'))
+drive_folder_ids = FolderIdCache(DRIVE_FOLDER_CACHE_SIZE)
+
+# Registration document uploads: 'sync' uploads before responding, 'async' spools the
+# files locally and queues an upload_documents job
+DOCUMENT_UPLOAD_MODE = os.getenv('DOCUMENT_UPLOAD_MODE', 'sync').lower()
+DOCUMENT_SPOOL_DIR = os.getenv('DOCUMENT_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'enrollex_document_spool'))
+
+# Resumable uploads: chunks are spooled under DOCUMENT_SPOOL_DIR, so every chunk of a
+# session must reach a server sharing that directory
+UPLOAD_SESSION_SPOOL_DIR = os.path.join(DOCUMENT_SPOOL_DIR, 'upload_sessions')
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE_KB', '512')) * 1024
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv('UPLOAD_SESSION_TTL_HOURS', '24')) * 3600
+# A session finalizing for longer than this is assumed abandoned and can be finalized again
+UPLOAD_FINALIZE_STALE_SECONDS = int(os.getenv('UPLOAD_FINALIZE_STALE_SECONDS', '600'))
+
+# Background jobs: when enabled, ID cards, admission slips and OTP SMS are queued
+# for 'flask --app main jobs work' instead of running inside the request
+BACKGROUND_JOBS = os.getenv('BACKGROUND_JOBS', 'false').lower() == 'true'
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+JOB_RETRY_BASE_SECONDS = float(os.getenv('JOB_RETRY_BASE_SECONDS', '30'))
+JOB_RETRY_MAX_SECONDS = float(os.getenv('JOB_RETRY_MAX_SECONDS', '3600'))
+
+# Batch ID cards: render worker processes (0 = CPU count) and photo reads/uploads in flight at once
+ID_CARD_BATCH_PROCESSES = int(os.getenv('ID_CARD_BATCH_PROCESSES', '0'))
+ID_CARD_UPLOAD_CONCURRENCY = int(os.getenv('ID_CARD_UPLOAD_CONCURRENCY', '4'))
+# Largest batch the API generates inside the request when BACKGROUND_JOBS is off
+ID_CARD_SYNC_BATCH_LIMIT = int(os.getenv('ID_CARD_SYNC_BATCH_LIMIT', '20'))
+
+# ID card PDFs without PowerPoint: a pool of headless LibreOffice processes (see pdf_conversion.py).
+# SOFFICE_PATH defaults to soffice/libreoffice on PATH; PDF conversion is skipped if neither is found.
+SOFFICE_PATH = os.getenv('SOFFICE_PATH')
+PDF_CONVERTER_PROCESSES = int(os.getenv('PDF_CONVERTER_PROCESSES', '0'))
+PDF_CONVERSION_TIMEOUT_SECONDS = float(os.getenv('PDF_CONVERSION_TIMEOUT_SECONDS', '120'))
+
+# ID card renderer: 'pptx' fills the PowerPoint template and converts it, 'pdf' draws the card
+# straight to PDF (see idcard_pdf.py), looking template fonts up as TrueType files in ID_CARD_FONT_DIR
+ID_CARD_RENDERER = os.getenv('ID_CARD_RENDERER', 'pptx')
+ID_CARD_FONT_DIR = os.getenv('ID_CARD_FONT_DIR')
+if ID_CARD_RENDERER not in ID_CARD_RENDERERS:
+    raise ValueError(f"ID_CARD_RENDERER must be one of {', '.join(ID_CARD_RENDERERS)}")
+
+# Multipart uploads: files up to this size stay in memory, larger ones are spooled to a temporary file
+UPLOAD_SPOOL_MEMORY_SIZE = int(os.getenv('UPLOAD_SPOOL_MEMORY_KB', '256')) * 1024
+# One file per document type plus the form fields
+MAX_MULTIPART_REQUEST_SIZE = (len(DOCUMENT_TYPES) + 1) * MAX_FILE_SIZE
+# Bulk import uploads (multipart or raw body)
+MAX_IMPORT_REQUEST_SIZE = int(os.getenv('MAX_IMPORT_SIZE_MB', '100')) * 1024 * 1024
+
+class SpooledUploadRequest(Request):
+    """
+    Request whose multipart file parts are written to SpooledTemporaryFile as
+    they are parsed, hashing each part on the way in for document deduplication.
+    
+    Multipart bodies are limited to MAX_MULTIPART_REQUEST_SIZE, and imports to
+    MAX_IMPORT_REQUEST_SIZE, while they are read, so a chunked request without
+    Content-Length cannot fill the disk.
+    """
+    
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'import_students_endpoint':
+            return MAX_IMPORT_REQUEST_SIZE
+        if self.mimetype == 'multipart/form-data':
+            return MAX_MULTIPART_REQUEST_SIZE
+        return super().max_content_length
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpooledFile(max_size=UPLOAD_SPOOL_MEMORY_SIZE, mode='w+b')
+
+app.request_class = SpooledUploadRequest
+
+# Upper bound on page size for cursor-paginated listings
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '200'))
+
+# Bulk imports: rows validated and written per insert_many chunk
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '500'))
+
+# Streaming exports: records fetched per cursor batch
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '500'))
+
+# Student read model backfill: records per batch, and seconds without progress before another process takes over
+READ_MODEL_BATCH_SIZE = int(os.getenv('READ_MODEL_BATCH_SIZE', '500'))
+READ_MODEL_BUILD_STALE_SECONDS = float(os.getenv('READ_MODEL_BUILD_STALE_SECONDS', '300'))
+
+# Dashboard statistics: 'counters' reads materialized counters, 'aggregate' counts live with one $facet
+STATS_SOURCE = os.getenv('STATS_SOURCE', 'counters').lower()
+STATS_CACHE_TTL_SECONDS = float(os.getenv('STATS_CACHE_TTL_SECONDS', '5'))
+STATS_CACHE_STALE_SECONDS = float(os.getenv('STATS_CACHE_STALE_SECONDS', '30'))
+
+# Department registry cache lifetime; changes made by this process invalidate it immediately, and
+# names missing from the cache are looked up in the registry, so other processes see new departments at once
+DEPARTMENT_CACHE_TTL_SECONDS = float(os.getenv('DEPARTMENT_CACHE_TTL_SECONDS', '30'))
+DEPARTMENT_CACHE_STALE_SECONDS = float(os.getenv('DEPARTMENT_CACHE_STALE_SECONDS', '30'))
+
 # JWT token expiration time from environment
 JWT_EXPIRATION_HOURS = float(os.getenv('JWT_EXPIRATION_HOURS', '0.1'))
 TOKEN_EXPIRATION = timedelta(hours=JWT_EXPIRATION_HOURS)
@@ -169,60 +492,148 @@ validate_config()
 
 # Google Drive Functions
 def get_drive_service():
-    """Create and return Google Drive API service"""
+    """Get this thread's Google Drive API service (credentials are loaded once per process)"""
     try:
-        credentials = Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_FILE, scopes=SCOPES
-        )
-        print("Loaded service account:", credentials.service_account_email)
-
-        service = build('drive', 'v3', credentials=credentials)
-        return service
+        return get_drive_client_factory(SERVICE_ACCOUNT_FILE, SCOPES).service()
     except Exception as e:
         print(f"Error creating Drive service: {e}")
         return None
 
+_document_storage = None
+
+def get_document_storage():
+    """Get the configured document storage backend, or None if it is unavailable"""
+    global _document_storage
+    if DOCUMENT_STORAGE_BACKEND == 'drive':
+        # Check the credentials on every call, as get_drive_service does
+        if get_drive_service() is None:
+            return None
+    
+    if _document_storage is None:
+        try:
+            if DOCUMENT_STORAGE_BACKEND == 'local':
+                _document_storage = LocalStorage(
+                    LOCAL_STORAGE_ROOT, LOCAL_STORAGE_BASE_URL,
+                    app.config['SECRET_KEY'], LOCAL_STORAGE_LINK_TTL_SECONDS
+                )
+            elif DOCUMENT_STORAGE_BACKEND == 's3':
+                _document_storage = S3Storage(S3_BUCKET, S3_ENDPOINT_URL, S3_PREFIX, S3_PUBLIC_BASE_URL, S3_REGION)
+            else:
+                _document_storage = DriveStorage(get_drive_service, PARENT_FOLDER_ID)
+            print(f"Document storage backend: {_document_storage.name}")
+        except Exception as e:
+            print(f"Error creating document storage: {e}")
+            return None
+    return _document_storage
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def create_ju_application_folder(service, ju_application_number, student_name):
-    """Create a folder for student documents using JU application number"""
+def create_ju_application_folder(storage, ju_application_number, student_name, student_id=None):
+    """
+    Get or create the storage folder for a student's documents, named after the JU application number.
+    
+    The folder ID is looked up in the process cache, then on the student's
+    main record, and only then searched for in storage. The search and
+    creation run under a MongoDB lock per folder, so concurrent requests for
+    the same application create one folder between them.
+    
+    Args:
+        storage: DocumentStorage backend
+        ju_application_number (str): JU application number
+        student_name (str): Student's full name, part of the folder name
+        student_id (str): Student whose main record stores the folder ID (optional)
+    
+    Returns:
+        str: Folder ID, or None on error
+    """
     try:
         # Create folder name with JU application number
         folder_name = f"JU_{ju_application_number}_{secure_filename(student_name)}"
+        cache_key = (storage.name, folder_name)
         
-        # Check if folder already exists
-        results = service.files().list(
-            q=f"name='{folder_name}' and parents in '{PARENT_FOLDER_ID}' and mimeType='application/vnd.google-apps.folder'",
-            fields="files(id, name)"
-        ).execute()
-        
-        items = results.get('files', [])
+        folder_id = drive_folder_ids.get(cache_key) or stored_student_folder(student_id, storage, folder_name)
+        if folder_id:
+            drive_folder_ids.put(cache_key, folder_id)
+            return folder_id
         
-        if items:
-            # Folder exists, return its ID
-            print(f"JU Application folder already exists: {folder_name}")
-            return items[0]['id']
-        else:
-            # Create new folder
-            folder_metadata = {
-                'name': folder_name,
-                'parents': [PARENT_FOLDER_ID],
-                'mimeType': 'application/vnd.google-apps.folder',
-                'description': f"Documents for JU Application: {ju_application_number}, Student: {student_name}, Created: {datetime.now().isoformat()}"
-            }
+        with folder_lock(get_folder_locks_collection(), folder_name) as locked:
+            if not locked:
+                print(f"[WARNING] Timed out waiting for the folder lock on {folder_name}; continuing without it")
+            
+            # Another request may have created the folder while we waited
+            folder_id = drive_folder_ids.get(cache_key) or stored_student_folder(student_id, storage, folder_name)
             
-            folder = service.files().create(body=folder_metadata, fields='id').execute()
-            print(f"Created JU Application folder: {folder_name} with ID: {folder.get('id')}")
-            return folder.get('id')
+            if not folder_id:
+                folder_id = storage.find_or_create_folder(
+                    folder_name,
+                    f"Documents for JU Application: {ju_application_number}, Student: {student_name}, Created: {datetime.now().isoformat()}"
+                )
+            
+            # Store before releasing the lock so waiting requests find it
+            store_student_folder(student_id, storage, folder_name, folder_id)
+        
+        drive_folder_ids.put(cache_key, folder_id)
+        return folder_id
             
     except Exception as e:
         print(f"Error creating JU Application folder: {e}")
         return None
 
-def upload_single_document(service, file_data, filename, parent_folder_id, document_type):
-    """Upload a single document to Google Drive"""
+def stored_student_folder(student_id, storage, folder_name):
+    """Get the folder ID stored on a student's main record, if it is folder_name in this storage backend"""
+    if not student_id:
+        return None
+    student = get_students_collection().find_one(
+        {"student_id": student_id},
+        {"documentsFolder": 1, "documentsFolderName": 1, "documentsStorage": 1}
+    )
+    if (student and student.get('documentsFolderName') == folder_name
+            and student.get('documentsStorage', 'drive') == storage.name):
+        return student.get('documentsFolder')
+    return None
+
+def store_student_folder(student_id, storage, folder_name, folder_id):
+    """Record a student's folder ID on their main record"""
+    if student_id and folder_id:
+        get_students_collection().update_one(
+            {"student_id": student_id},
+            {"$set": {"documentsFolder": folder_id, "documentsFolderName": folder_name, "documentsStorage": storage.name}}
+        )
+
+def document_stream(file_data):
+    """
+    Get a readable stream and its size for an uploaded document.
+    
+    Args:
+        file_data: File handle, bytes, base64 string (optionally a data URL)
+                   or the legacy JSON list of byte values
+    
+    Returns:
+        tuple: (seekable binary stream positioned at the start, size in bytes)
+    """
+    if isinstance(file_data, list):
+        # Legacy JSON clients send one integer per byte
+        file_data = bytes(file_data)
+    elif isinstance(file_data, str):
+        file_data = base64.b64decode(file_data.split(',', 1)[-1])
+    
+    if isinstance(file_data, (bytes, bytearray)):
+        return io.BytesIO(file_data), len(file_data)
+    
+    file_data.seek(0, io.SEEK_END)
+    size = file_data.tell()
+    file_data.seek(0)
+    return file_data, size
+
+def upload_single_document(storage, file_data, filename, parent_folder_id, document_type, grant_permission=True):
+    """
+    Upload a single document to document storage from a file handle or bytes.
+    
+    With grant_permission=False the file is left private; callers uploading
+    several files grant access to all of them in one batch afterwards.
+    """
     try:
         # Determine MIME type
         file_extension = filename.rsplit('.', 1)[1].lower()
@@ -240,50 +651,25 @@ def upload_single_document(service, file_data, filename, parent_folder_id, docum
         # Create filename with document type
         clean_filename = f"{doc_display_name}.{file_extension}"
         
-        # File metadata
-        file_metadata = {
-            'name': clean_filename,
-            'parents': [parent_folder_id],
-            'description': f"Document type: {doc_display_name}, Original filename: {filename}, Upload time: {datetime.now().isoformat()}"
-        }
-        
-        # Create media upload object
-        media = MediaIoBaseUpload(
-            io.BytesIO(file_data),
-            mimetype=mime_type,
-            resumable=True
-        )
+        # File handles are streamed without loading them into memory
+        file_stream, _ = document_stream(file_data)
         
         # Upload file
-        uploaded_file = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id,name,webViewLink,webContentLink,size'
-        ).execute()
-        
-        # Make file publicly viewable (optional - adjust permissions as needed)
-        try:
-            permission = {
-                'role': 'reader',
-                'type': 'anyone'
-            }
-            service.permissions().create(
-                fileId=uploaded_file.get('id'),
-                body=permission
-            ).execute()
-        except Exception as perm_error:
-            print(f"Permission setting warning: {perm_error}")
+        stored_file = storage.upload_file(
+            parent_folder_id,
+            file_stream,
+            clean_filename,
+            mime_type,
+            description=f"Document type: {doc_display_name}, Original filename: {filename}, Upload time: {datetime.now().isoformat()}",
+            grant_public=grant_permission
+        )
         
-        print(f"Document uploaded successfully: {clean_filename} with ID: {uploaded_file.get('id')}")
+        print(f"Document uploaded successfully: {clean_filename} with ID: {stored_file['file_id']}")
         
         return {
-            'file_id': uploaded_file.get('id'),
-            'file_name': uploaded_file.get('name'),
-            'web_view_link': uploaded_file.get('webViewLink'),
-            'download_link': uploaded_file.get('webContentLink'),
+            **stored_file,
             'original_name': filename,
             'document_type': document_type,
-            'file_size': uploaded_file.get('size'),
             'upload_success': True
         }
         
@@ -296,13 +682,54 @@ def upload_single_document(service, file_data, filename, parent_folder_id, docum
             'error': str(e)
         }
 
-def process_student_documents(service, documents_data, ju_application_number, student_name):
-    """Process and upload all student documents"""
+def upload_documents_concurrently(storage, tasks, parent_folder_id, max_workers, grant_permission=True):
+    """
+    Upload documents from a bounded thread pool.
+    
+    Storage backends are thread-safe; the Drive backend gives every worker
+    thread its own service because httplib2 transports are not.
+    
+    Args:
+        storage: DocumentStorage backend
+        tasks (list): (document type, file stream, filename) tuples
+        parent_folder_id (str): Folder receiving the documents
+        max_workers (int): Maximum concurrent uploads
+        grant_permission (bool): Passed on to upload_single_document
+    
+    Returns:
+        list: upload_single_document results in task order
+    """
+    def upload(task):
+        doc_type, file_data, filename = task
+        return upload_single_document(storage, file_data, filename, parent_folder_id, doc_type, grant_permission)
+    
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='drive-upload') as executor:
+        return list(executor.map(upload, tasks))
+
+def process_student_documents(storage, documents_data, ju_application_number, student_name, concurrency=None,
+                              student_id=None, folder_id=None):
+    """
+    Process and upload all student documents.
+    
+    Documents are uploaded concurrently when more than one is present and
+    concurrency (default DRIVE_UPLOAD_CONCURRENCY) is above 1, otherwise
+    serially. Read access for all uploaded files is then granted in one
+    batch (one batched call on Drive). Pass the student's known
+    folder_id to skip the folder lookup; student_id records a new folder on
+    the student.
+    
+    With a student_id, a document whose SHA-256 matches one already stored
+    for the student as the same document type is not uploaded again; the
+    stored file is returned with deduplicated set. File info may carry a
+    precomputed 'sha256' digest.
+    """
     try:
         print(f"Processing documents for JU Application: {ju_application_number}")
         
         # Create student folder
-        student_folder_id = create_ju_application_folder(service, ju_application_number, student_name)
+        student_folder_id = folder_id or create_ju_application_folder(
+            storage, ju_application_number, student_name, student_id
+        )
         if not student_folder_id:
             return {
                 'success': False,
@@ -313,26 +740,22 @@ def process_student_documents(service, documents_data, ju_application_number, st
         
         uploaded_documents = {}
         failed_documents = []
-        upload_results = []
+        upload_tasks = []
         
-        # Loop through each document type
+        # Validate each document type before uploading
         for doc_type, file_info in documents_data.items():
             if file_info and isinstance(file_info, dict):
                 print(f"Processing {doc_type}...")
                 
                 try:
-                    # Get file data
-                    file_data = file_info.get('file_data')
+                    # Get file data: a file handle from multipart uploads, or bytes/base64/list from JSON
+                    file_data = file_info.get('file') or file_info.get('file_data')
                     filename = file_info.get('filename')
                     
                     if not file_data or not filename:
                         print(f"Skipping {doc_type} - missing file data or filename")
                         continue
                     
-                    # Convert array back to bytes if needed
-                    if isinstance(file_data, list):
-                        file_data = bytes(file_data)
-                    
                     # Validate file
                     if not allowed_file(filename):
                         print(f"Skipping {doc_type} - invalid file type: {filename}")
@@ -343,8 +766,9 @@ def process_student_documents(service, documents_data, ju_application_number, st
                         })
                         continue
                     
-                    if len(file_data) > MAX_FILE_SIZE:
-                        print(f"Skipping {doc_type} - file too large: {len(file_data)} bytes")
+                    file_data, file_size = document_stream(file_data)
+                    if file_size > MAX_FILE_SIZE:
+                        print(f"Skipping {doc_type} - file too large: {file_size} bytes")
                         failed_documents.append({
                             'document_type': doc_type,
                             'filename': filename,
@@ -352,34 +776,8 @@ def process_student_documents(service, documents_data, ju_application_number, st
                         })
                         continue
                     
-                    # Upload document
-                    upload_result = upload_single_document(
-                        service, 
-                        file_data, 
-                        filename, 
-                        student_folder_id, 
-                        doc_type
-                    )
-                    
-                    upload_results.append(upload_result)
-                    
-                    if upload_result.get('upload_success'):
-                        uploaded_documents[doc_type] = {
-                            'file_id': upload_result['file_id'],
-                            'file_name': upload_result['file_name'],
-                            'web_view_link': upload_result['web_view_link'],
-                            'download_link': upload_result['download_link'],
-                            'original_name': upload_result['original_name'],
-                            'file_size': upload_result['file_size']
-                        }
-                        print(f"Successfully uploaded {doc_type}")
-                    else:
-                        failed_documents.append({
-                            'document_type': doc_type,
-                            'filename': filename,
-                            'error': upload_result.get('error', 'Unknown error')
-                        })
-                        print(f" Failed to upload {doc_type}: {upload_result.get('error')}")
+                    digest = file_info.get('sha256') or stream_digest(file_data)
+                    upload_tasks.append((doc_type, file_data, filename, digest))
                 
                 except Exception as doc_error:
                     print(f"Error processing {doc_type}: {doc_error}")
@@ -389,6 +787,101 @@ def process_student_documents(service, documents_data, ju_application_number, st
                         'error': str(doc_error)
                     })
         
+        # Reuse documents already stored with identical content
+        upload_results = [None] * len(upload_tasks)
+        stored_documents = {}
+        if student_id:
+            try:
+                stored_documents = find_stored_documents(
+                    get_document_hashes_collection(), student_id, storage.name,
+                    [digest for _, _, _, digest in upload_tasks if digest]
+                )
+            except Exception as e:
+                print(f"[WARNING] Document hash lookup failed, uploading everything: {e}")
+        for index, (doc_type, _, filename, digest) in enumerate(upload_tasks):
+            stored_file = stored_documents.get((doc_type, digest))
+            if stored_file and stored_file.get('file_id'):
+                print(f"Reusing stored {doc_type}: identical file already uploaded as {stored_file['file_id']}")
+                upload_results[index] = {
+                    **stored_file,
+                    'original_name': filename,
+                    'document_type': doc_type,
+                    'upload_success': True,
+                    'deduplicated': True
+                }
+        pending = [index for index, upload_result in enumerate(upload_results) if upload_result is None]
+        pending_tasks = [upload_tasks[index][:3] for index in pending]
+        
+        # Upload documents
+        concurrency = concurrency or DRIVE_UPLOAD_CONCURRENCY
+        if concurrency > 1 and len(pending_tasks) > 1:
+            pending_results = upload_documents_concurrently(
+                storage,
+                pending_tasks,
+                student_folder_id,
+                min(concurrency, len(pending_tasks)),
+                grant_permission=False
+            )
+        else:
+            pending_results = [
+                upload_single_document(storage, file_data, filename, student_folder_id, doc_type, grant_permission=False)
+                for doc_type, file_data, filename in pending_tasks
+            ]
+        for index, upload_result in zip(pending, pending_results):
+            upload_results[index] = upload_result
+        
+        # Grant read access for every uploaded file in one batch request
+        uploaded_results = [
+            result for result in upload_results
+            if result.get('upload_success') and not result.get('permission_granted')
+        ]
+        if uploaded_results:
+            try:
+                permission_errors = storage.grant_public_read([result['file_id'] for result in uploaded_results])
+            except Exception as perm_error:
+                permission_errors = [str(perm_error)] * len(uploaded_results)
+            for upload_result, permission_error in zip(uploaded_results, permission_errors):
+                upload_result['permission_granted'] = permission_error is None
+                if permission_error:
+                    print(f"Permission setting warning for {upload_result['document_type']}: {permission_error}")
+                    upload_result['permission_error'] = permission_error
+        
+        # Index new uploads by content so identical resubmissions are skipped
+        if student_id:
+            new_documents = [
+                (doc_type, digest, upload_results[index])
+                for index, (doc_type, _, _, digest) in enumerate(upload_tasks)
+                if digest and index in pending and upload_results[index].get('upload_success')
+            ]
+            try:
+                record_stored_documents(get_document_hashes_collection(), student_id, storage.name, new_documents)
+            except Exception as e:
+                print(f"[WARNING] Could not index uploaded documents: {e}")
+        
+        for (doc_type, _, filename, _), upload_result in zip(upload_tasks, upload_results):
+            if upload_result.get('upload_success'):
+                uploaded_documents[doc_type] = {
+                    'file_id': upload_result['file_id'],
+                    'file_name': upload_result['file_name'],
+                    'web_view_link': upload_result['web_view_link'],
+                    'download_link': upload_result['download_link'],
+                    'original_name': upload_result['original_name'],
+                    'file_size': upload_result['file_size'],
+                    'permission_granted': upload_result.get('permission_granted', False)
+                }
+                if upload_result.get('permission_error'):
+                    uploaded_documents[doc_type]['permission_error'] = upload_result['permission_error']
+                if upload_result.get('deduplicated'):
+                    uploaded_documents[doc_type]['deduplicated'] = True
+                print(f"Successfully uploaded {doc_type}")
+            else:
+                failed_documents.append({
+                    'document_type': doc_type,
+                    'filename': filename,
+                    'error': upload_result.get('error', 'Unknown error')
+                })
+                print(f" Failed to upload {doc_type}: {upload_result.get('error')}")
+        
         # Summary
         total_processed = len(uploaded_documents) + len(failed_documents)
         print(f"Document processing complete: {len(uploaded_documents)} uploaded, {len(failed_documents)} failed out of {total_processed} total")
@@ -414,6 +907,316 @@ def process_student_documents(service, documents_data, ju_application_number, st
             'failed_documents': []
         }
 
+def multipart_documents():
+    """Collect the document file parts of a multipart request as process_student_documents input"""
+    return {
+        doc_type: {'file': upload.stream, 'filename': upload.filename}
+        for doc_type, upload in request.files.items()
+        if doc_type in DOCUMENT_TYPES and upload.filename
+    }
+
+# Student read model
+# Denormalized copy of the fields served by /api/students, kept in a single
+# collection so the list endpoint needs one indexed query instead of one
+# department lookup per row.
+READ_MODEL_FIELD_MAP = {
+    'status': 'status',
+    'attendance': 'attendance',
+    'has_photo': 'hasPhoto',
+    'application_number': 'applicationNumber',
+    'updated_at': 'updatedAt',
+    'documentsFolder': 'documentsFolder',
+    'documentUploadSummary': 'documentUploadSummary',
+}
+
+# Marker in the migration checkpoints collection recording the read model backfill
+READ_MODEL_BUILD_ID = 'student_read_model'
+
+_read_model_ready = False
+
+def build_student_list_entry(student):
+    """Shape a department student record into a /api/students list entry"""
+    return {
+        "studentId": student["student_id"],
+        "name": student.get("name") or student.get("studentFullName"),
+        "email": student["email"],
+        "phone": student.get("phone") or student.get("studentContactNo", ""),
+        "department": student["department"],
+        "attendance": student.get("attendance", "absent"),
+        "status": student["status"],
+        "hasPhoto": student.get("has_photo", False),
+        "applicationNumber": student.get("application_number"),
+        "registrationDate": student["registration_date"],
+        "dob": student.get("dob") or student.get("dateOfBirth", ""),
+        "parentName": student.get("parent_name") or student.get("fatherName", ""),
+        "parentEmail": student.get("parent_email") or student.get("parentEmail", ""),
+        "parentPhone": student.get("parent_phone") or student.get("fatherMobile", ""),
+        "createdAt": student.get("created_at"),
+        "updatedAt": student.get("updated_at"),
+        "juApplication": student.get("juApplication"),
+        "documentsFolder": student.get("documentsFolder"),
+        "documentUploadSummary": student.get("documentUploadSummary", {})
+    }
+
+def upsert_student_read_model(student):
+    """Write the full read model entry for a department student record"""
+    try:
+        entry = build_student_list_entry(student)
+        get_student_read_model_collection().replace_one(
+            {"studentId": entry["studentId"]},
+            entry,
+            upsert=True
+        )
+    except Exception as e:
+        print(f"Error updating student read model: {e}")
+
+def upsert_student_read_models(students):
+    """Write read model entries for many department student records in one bulk write"""
+    try:
+        operations = [
+            ReplaceOne({"studentId": entry["studentId"]}, entry, upsert=True)
+            for entry in (build_student_list_entry(student) for student in students)
+        ]
+        if operations:
+            get_student_read_model_collection().bulk_write(operations, ordered=False)
+    except Exception as e:
+        print(f"Error updating student read model: {e}")
+
+def update_student_read_model(student_id, changes):
+    """Mirror a department record $set onto the read model entry"""
+    try:
+        read_model_changes = {
+            READ_MODEL_FIELD_MAP[field]: value
+            for field, value in changes.items()
+            if field in READ_MODEL_FIELD_MAP
+        }
+        if read_model_changes:
+            get_student_read_model_collection().update_one(
+                {"studentId": student_id},
+                {"$set": read_model_changes}
+            )
+    except Exception as e:
+        print(f"Error updating student read model: {e}")
+
+def get_read_model_build_marker_collection():
+    return get_collection(CHECKPOINT_COLLECTION)
+
+def rebuild_student_read_model():
+    """
+    Rebuild the read model from the department collections and mark the backfill complete.
+    
+    Students are read in batches of READ_MODEL_BATCH_SIZE, one query per department per batch.
+    
+    Returns:
+        int: Entries written
+    """
+    markers = get_read_model_build_marker_collection()
+    rebuilt = 0
+    batch = []
+    
+    def write_batch():
+        nonlocal rebuilt
+        students = find_student_records(batch)
+        upsert_student_read_models(students)
+        rebuilt += len(students)
+        batch.clear()
+        markers.update_one({"_id": READ_MODEL_BUILD_ID}, {"$set": {"heartbeat_at": datetime.utcnow()}})
+    
+    for details in get_students_collection().find({}, {"_id": 0, "student_id": 1}).batch_size(READ_MODEL_BATCH_SIZE):
+        batch.append(details["student_id"])
+        if len(batch) >= READ_MODEL_BATCH_SIZE:
+            write_batch()
+    if batch:
+        write_batch()
+    
+    markers.update_one(
+        {"_id": READ_MODEL_BUILD_ID},
+        {"$set": {"status": "complete", "completed_at": datetime.utcnow(), "entries": rebuilt}},
+        upsert=True
+    )
+    print(f"Student read model rebuilt with {rebuilt} entries")
+    return rebuilt
+
+def claim_student_read_model_build():
+    """Claim the backfill unless it is complete or another process is making progress on it"""
+    now = datetime.utcnow()
+    try:
+        get_read_model_build_marker_collection().find_one_and_update(
+            {
+                "_id": READ_MODEL_BUILD_ID,
+                "status": {"$ne": "complete"},
+                "heartbeat_at": {"$lt": now - timedelta(seconds=READ_MODEL_BUILD_STALE_SECONDS)}
+            },
+            {"$set": {"status": "building", "heartbeat_at": now, "started_at": now}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+def run_student_read_model_build():
+    try:
+        rebuild_student_read_model()
+    except Exception as e:
+        print(f"Error backfilling student read model: {e}")
+
+def ensure_student_read_model():
+    """
+    Check the read model backfill has completed, starting it in the background if nobody is running it.
+    
+    Completion is recorded in a marker document rather than inferred from the read model
+    being non-empty, since registrations write entries before the backfill has run.
+    
+    Returns:
+        bool: True once the read model covers every student
+    """
+    global _read_model_ready
+    if _read_model_ready:
+        return True
+    marker = get_read_model_build_marker_collection().find_one({"_id": READ_MODEL_BUILD_ID})
+    if marker and marker.get("status") == "complete":
+        _read_model_ready = True
+        return True
+    if not marker and get_students_collection().estimated_document_count() == 0:
+        # New database: every student will be written to the read model as they register
+        get_read_model_build_marker_collection().update_one(
+            {"_id": READ_MODEL_BUILD_ID},
+            {"$set": {"status": "complete", "completed_at": datetime.utcnow(), "entries": 0}},
+            upsert=True
+        )
+        _read_model_ready = True
+        return True
+    if claim_student_read_model_build():
+        print("Student read model backfill has not completed - rebuilding in the background")
+        threading.Thread(target=run_student_read_model_build, daemon=True).start()
+    return False
+
+@app.cli.command('rebuild-student-read-model')
+def rebuild_student_read_model_command():
+    """Rebuild the denormalized /api/students read model and mark the backfill complete."""
+    rebuilt = rebuild_student_read_model()
+    click.echo(f"Rebuilt {rebuilt} read model entries")
+
+# Department statistics
+# Each stats request costs at most one database round trip, and concurrent
+# dashboard polls for the same key share a single load through stats_cache.
+stats_cache = StaleWhileRevalidateCache(ttl=STATS_CACHE_TTL_SECONDS, stale_ttl=STATS_CACHE_STALE_SECONDS)
+
+def count_student_registered(department, count=1):
+    """Add newly registered students to the department counters"""
+    department_key = normalize_department_name(department)
+    try:
+        record_student_registered(get_department_stats_collection(), department_key, count=count)
+    except Exception as e:
+        print(f"Error updating department stats: {e}")
+    stats_cache.invalidate(('department', department_key))
+
+def count_status_change(department, old_status, new_status, changed_at=None, previous_changed_at=None):
+    """Move a student between the department's status counters"""
+    department_key = normalize_department_name(department)
+    try:
+        record_status_change(
+            get_department_stats_collection(), department_key, old_status, new_status, changed_at, previous_changed_at
+        )
+    except Exception as e:
+        print(f"Error updating department stats: {e}")
+    stats_cache.invalidate(('department', department_key))
+
+def count_admin_role_change(old_role, new_role):
+    """Move an admin between the role counters"""
+    try:
+        record_admin_role_change(get_department_stats_collection(), old_role, new_role)
+    except Exception as e:
+        print(f"Error updating admin stats: {e}")
+    stats_cache.invalidate(('admins',))
+
+def load_department_stats(department_key):
+    """Load a department's statistics from counters or a live $facet count"""
+    if STATS_SOURCE == 'aggregate':
+        return aggregate_department_stats(get_department_collection(department_key))
+    
+    stats = read_department_stats(get_department_stats_collection(), department_key)
+    if stats is None:
+        # Seed the counters on first use
+        reconcile_department_stats(get_department_stats_collection(), department_key, get_department_collection(department_key))
+        stats = read_department_stats(get_department_stats_collection(), department_key)
+    return stats
+
+def load_admin_stats():
+    """Load admin role statistics from counters or a live aggregation"""
+    if STATS_SOURCE == 'aggregate':
+        return aggregate_admin_stats(get_admins_collection())
+    
+    stats = read_admin_stats(get_department_stats_collection())
+    if stats is None:
+        # Seed the counters on first use
+        reconcile_admin_stats(get_department_stats_collection(), get_admins_collection())
+        stats = read_admin_stats(get_department_stats_collection())
+    return stats
+
+def reconcile_stats():
+    """Recount every department's counters and the admin counters from source"""
+    stats_collection = get_department_stats_collection()
+    for department_key in list_department_collections():
+        reconcile_department_stats(stats_collection, department_key, get_department_collection(department_key))
+    reconcile_admin_stats(stats_collection, get_admins_collection())
+
+@app.cli.group('departments')
+def departments_command():
+    """Manage the department registry."""
+
+@departments_command.command('alias')
+@click.argument('alias')
+@click.argument('department')
+def department_alias_command(alias, department):
+    """Resolve ALIAS to the collection of DEPARTMENT; refused if ALIAS already resolves to a collection with records."""
+    alias = alias.strip()
+    key = department_collection_key(department)
+    registry_collection = get_department_registry_collection()
+    if not registry_collection.find_one({'_id': key}, {'_id': 1}):
+        raise click.ClickException(f"Department not registered: {department}")
+    
+    current = registry_collection.find_one({'aliases': alias}, {'_id': 1, 'name': 1})
+    current_key = current['_id'] if current else department_collection_key(alias)
+    if current_key != key:
+        if current and current.get('name') == alias:
+            raise click.ClickException(f"'{alias}' is the name of department {current_key}")
+        if get_department_collection(current_key).find_one({}, {'_id': 1}):
+            raise click.ClickException(
+                f"'{alias}' resolves to {current_key}, which has student records; move them before repointing the alias"
+            )
+        if current:
+            registry_collection.update_one({'_id': current_key}, {'$pull': {'aliases': alias}})
+    registry_collection.update_one({'_id': key}, {'$addToSet': {'aliases': alias}})
+    department_cache.invalidate()
+    click.echo(f"'{alias}' now resolves to {key}")
+
+@departments_command.command('set-display-name')
+@click.argument('department')
+@click.argument('display_name')
+def department_display_name_command(department, display_name):
+    """Set the display name shown for DEPARTMENT."""
+    key = department_collection_key(department)
+    result = get_department_registry_collection().update_one({'_id': key}, {'$set': {'display_name': display_name}})
+    if not result.matched_count:
+        raise click.ClickException(f"Department not registered: {department}")
+    department_cache.invalidate()
+
+@app.cli.group('stats')
+def stats_command():
+    """Manage materialized department statistics."""
+
+@stats_command.command('reconcile')
+@click.option('--interval', default=0, help='Repeat every N seconds instead of running once.')
+def reconcile_stats_command(interval):
+    """Recount the stats counters from the source collections."""
+    while True:
+        reconcile_stats()
+        click.echo(f"Stats reconciled at {datetime.utcnow().isoformat()}")
+        if not interval:
+            break
+        time.sleep(interval)
+
 # Utility functions
 def generate_student_id():
     """Generate a unique student ID"""
@@ -432,10 +1235,138 @@ def validate_phone(phone):
     """Validate phone number (basic validation)"""
     return phone.isdigit() and len(phone) >= 10
 
-def normalize_department_name(department):
-    """Normalize department name for collection naming"""
+def department_collection_key(department):
+    """Compute the collection name for a department name"""
     return department.strip().lower().replace("_", "").replace(" ","")
 
+def normalize_department_name(department):
+    """Normalize department name for collection naming, resolving through the department registry"""
+    try:
+        key = get_department_registry()['aliases'].get(department)
+        if key:
+            return key
+        # Possibly registered by another process since the cache was loaded
+        entry = get_department_registry_collection().find_one({'aliases': department}, {'_id': 1})
+        if entry:
+            department_cache.invalidate()
+            return entry['_id']
+    except Exception as e:
+        print(f"Department registry unavailable: {e}")
+    return department_collection_key(department)
+
+# Department registry
+# Canonical department names, their collection names and display metadata,
+# maintained on registration and cached in-process.
+department_cache = StaleWhileRevalidateCache(ttl=DEPARTMENT_CACHE_TTL_SECONDS, stale_ttl=DEPARTMENT_CACHE_STALE_SECONDS)
+
+def load_department_registry():
+    """Load the registry into alias and key lookup tables, seeding it from students on first use"""
+    registry_collection = get_department_registry_collection()
+    entries = list(registry_collection.find({}))
+    if not entries:
+        # Seed most-used spellings first so they become the canonical names
+        for row in get_students_collection().aggregate([
+            {'$group': {'_id': '$department', 'count': {'$sum': 1}}},
+            {'$sort': {'count': -1}}
+        ]):
+            if row['_id'] and row['_id'].strip():
+                upsert_department(row['_id'])
+        entries = list(registry_collection.find({}))
+    
+    aliases = {}
+    by_key = {}
+    for entry in entries:
+        by_key[entry['_id']] = entry
+        aliases[entry['_id']] = entry['_id']
+        aliases[entry['name']] = entry['_id']
+        for alias in entry.get('aliases', []):
+            aliases[alias] = entry['_id']
+    return {'aliases': aliases, 'by_key': by_key}
+
+def get_department_registry():
+    """Get the cached department registry"""
+    return department_cache.get(('registry',), load_department_registry)
+
+def upsert_department(department, display_name=None):
+    """
+    Add a department name to the registry.
+    The first name seen for a collection becomes its canonical name; later variants are kept as aliases.
+    
+    Returns:
+        bool: True if the registry changed
+    """
+    name = department.strip()
+    key = department_collection_key(name)
+    result = get_department_registry_collection().update_one(
+        {'_id': key},
+        {
+            '$setOnInsert': {
+                'name': name,
+                'collection': key,
+                'display_name': display_name or name,
+                'created_at': datetime.utcnow()
+            },
+            '$addToSet': {'aliases': name}
+        },
+        upsert=True
+    )
+    return bool(result.upserted_id or result.modified_count)
+
+def register_department(department):
+    """Record a department seen at registration, invalidating the cache if it is new"""
+    try:
+        if department.strip() in get_department_registry()['aliases']:
+            return
+        if upsert_department(department):
+            department_cache.invalidate()
+    except Exception as e:
+        print(f"Error updating department registry: {e}")
+
+def encode_cursor(created_at, student_id):
+    """Encode a (created_at, student_id) position as an opaque cursor token"""
+    payload = json.dumps({"c": created_at.isoformat(), "s": student_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(token):
+    """Decode a cursor token, raising ValueError if it is malformed"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return datetime.fromisoformat(payload["c"]), payload["s"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def keyset_page(collection, filter_query, projection, cursor, limit,
+                created_field="created_at", id_field="student_id", direction=-1):
+    """
+    Fetch one page ordered by (created_field, id_field) starting after cursor.
+    Seeks through the compound index instead of skipping, so every page costs the same.
+
+    Returns:
+        tuple: (documents, next cursor token or None)
+    """
+    query = dict(filter_query)
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        comparison = "$lt" if direction == -1 else "$gt"
+        keyset_condition = {"$or": [
+            {created_field: {comparison: cursor_created_at}},
+            {created_field: cursor_created_at, id_field: {comparison: cursor_id}}
+        ]}
+        query = {"$and": [filter_query, keyset_condition]} if filter_query else keyset_condition
+
+    # Fetch one extra row to know whether another page exists
+    documents = list(collection.find(query, projection).sort(
+        [(created_field, direction), (id_field, direction)]
+    ).limit(limit + 1))
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        last = documents[-1]
+        next_cursor = encode_cursor(last[created_field], last[id_field])
+    return documents, next_cursor
+
 # Authentication decorator
 def auth_required(f):
     @wraps(f)
@@ -490,6 +1421,38 @@ def super_admin_required(f):
     
     return decorated_function
 
+def duplicate_registration_error(error):
+    """Translate a duplicate key error, or one bulk write error entry, from registration into the API error message"""
+    if isinstance(error, dict):
+        key_pattern, message = error.get('keyPattern', {}), error.get('errmsg', '')
+    else:
+        key_pattern, message = (error.details or {}).get('keyPattern', {}), str(error)
+    # Older servers only name the index in the error message
+    if 'juApplication' in key_pattern or 'juApplication' in message:
+        return "JU Application number already registered"
+    return "Email already registered"
+
+def find_duplicate_registration(student_email, ju_application):
+    """Look for an existing registration with this email or JU application number, for when the unique indexes are missing"""
+    conditions = [{"email": student_email}]
+    if not ju_application.startswith('TEMP_'):
+        conditions.append({"juApplication": ju_application})
+    existing = get_students_collection().find_one({"$or": conditions}, {"_id": 0, "email": 1})
+    if not existing:
+        return None
+    if existing.get("email") == student_email:
+        return "Email already registered"
+    return "JU Application number already registered"
+
+def can_access_department(department):
+    """Check whether the current admin may read a department's records"""
+    role = request.current_admin['role']
+    if role == 'super_admin':
+        return True
+    if role == 'department_admin':
+        return request.current_admin.get('department') == normalize_department_name(department)
+    return False
+
 def validate_student_data(data):
     """Enhanced validation function for comprehensive student data"""
     # Essential required fields
@@ -579,260 +1542,630 @@ def health_check():
             'timestamp': datetime.utcnow().isoformat()
         }), 500
 
-@app.route('/api/students/register', methods=['POST'])
-def register_student():
-    """Register a new student with comprehensive details and Google Drive document uploads"""
-    try:
-        # Get JSON data
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"success": False, "error": "No data provided"}), 400
-        
-        print(f"Registration request received for: {data.get('studentFullName', 'Unknown')}")
-        
-        # Validate input data
-        validation_error = validate_student_data(data)
-        if validation_error:
-            return jsonify({"success": False, "error": validation_error}), 400
-        
-        # Check if JU application number is provided (make it optional for now)
-        ju_application = data.get('juApplication', '').strip()
-        if not ju_application:
-            # Generate a temporary JU application number if not provided
-            ju_application = f"TEMP_{uuid.uuid4().hex[:8].upper()}"
-            print(f"Generated temporary JU application: {ju_application}")
-        
-        department = normalize_department_name(data.get('department', ''))
-        print(f"Normalized department name: {department}")
-        students_dept_collection = get_department_collection(department)
-        
-        # Check if email already exists
-        student_email = data.get('studentOfficialEmail') or data.get('studentEmail', '').strip().lower()
-        
-        # FIXED: Use get_db() instead of global db variable
-        if department in get_db().list_collection_names():
-            existing_student = get_students_collection().find_one({"email": student_email})
-        else:
-            existing_student = None
+def build_student_document(data, student_id, ju_application, student_email, documents_upload_result, document_upload_status='none'):
+    """Build the department collection record for a registration payload"""
+    return {
+        # Generated fields
+        "student_id": student_id,
+        "status": "pending",
+        "attendance": "absent",
+        "has_photo": bool(data.get('photographUpload')),
+        "application_number": None,
+        "registration_date": datetime.now().isoformat(),
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
+    
+        # Personal Information
+        "studentFullName": data.get('studentFullName', '').strip(),
+        "name": data.get('studentFullName', '').strip(),  # For backward compatibility
+        "gender": data.get('gender', '').strip(),
+        "dateOfBirth": data.get('dateOfBirth', ''),
+        "dob": data.get('dateOfBirth', ''),  # For backward compatibility
+        "bloodGroup": data.get('bloodGroup', '').strip(),
+        "nationality": data.get('nationality', 'Indian').strip(),
+        "religion": data.get('religion', '').strip(),
+        "caste": data.get('caste', '').strip(),
+        "motherTongue": data.get('motherTongue', '').strip(),
+        "category": data.get('category', '').strip(),
+        "birthPlace": data.get('birthPlace', '').strip(),
+    
+        # Contact Information
+        "studentContactNo": data.get('studentContactNo', '').strip(),
+        "phone": data.get('studentContactNo', '').strip(),  # For backward compatibility
+        "studentEmail": data.get('studentEmail', '').strip().lower(),
+        "email": student_email,  # Primary email for lookups
+        "parentContactNo": data.get('parentContactNo', '').strip(),
+    
+        # Address Information
+        "correspondenceAddress": data.get('correspondenceAddress', '').strip(),
+        "correspondenceCity": data.get('correspondenceCity', '').strip(),
+        "correspondenceState": data.get('correspondenceState', '').strip(),
+        "correspondenceCountry": data.get('correspondenceCountry', 'India').strip(),
+        "correspondencePostalCode": data.get('correspondencePostalCode', '').strip(),
+        "permanentAddress": data.get('permanentAddress', '').strip(),
+        "permanentCity": data.get('permanentCity', '').strip(),
+        "permanentState": data.get('permanentState', '').strip(),
+        "permanentCountry": data.get('permanentCountry', 'India').strip(),
+        "permanentPostalCode": data.get('permanentPostalCode', '').strip(),
+    
+        # Academic Information - 10th
+        "tenthMarksCardNumber": data.get('tenthMarksCardNumber', '').strip(),
+        "tenthBoardUniversity": data.get('tenthBoardUniversity', '').strip(),
+        "tenthSchoolName": data.get('tenthSchoolName', '').strip(),
+        "tenthSchoolState": data.get('tenthSchoolState', '').strip(),
+        "tenthPassedOutYear": data.get('tenthPassedOutYear', ''),
+        "tenthTotalMarks": data.get('tenthTotalMarks', ''),
+        "tenthScoredMarks": data.get('tenthScoredMarks', ''),
+        "tenthPercentage": data.get('tenthPercentage', ''),
+    
+        # Academic Information - 12th
+        "collegeInstitutionName": data.get('collegeInstitutionName', '').strip(),
+        "collegeStateName": data.get('collegeStateName', '').strip(),
+        "boardUniversity": data.get('boardUniversity', '').strip(),
+        "twelfthMarksCardNumber": data.get('twelfthMarksCardNumber', '').strip(),
+        "twelfthRegisterNumber": data.get('twelfthRegisterNumber', '').strip(),
+        "twelfthPassedOutYear": data.get('twelfthPassedOutYear', ''),
+        "twelfthTotalMarks": data.get('twelfthTotalMarks', ''),
+        "twelfthScoredMarks": data.get('twelfthScoredMarks', ''),
+        "twelfthPercentage": data.get('twelfthPercentage', ''),
+    
+        # Subject-wise Marks
+        "pcmTotal": data.get('pcmTotal', ''),
+        "pcmPercentage": data.get('pcmPercentage', ''),
+        "physicsTotal": data.get('physicsTotal', ''),
+        "physicsScored": data.get('physicsScored', ''),
+        "chemistryTotal": data.get('chemistryTotal', ''),
+        "chemistryScored": data.get('chemistryScored', ''),
+        "mathematicsTotal": data.get('mathematicsTotal', ''),
+        "mathematicsScored": data.get('mathematicsScored', ''),
+        "biologyTotal": data.get('biologyTotal', ''),
+        "biologyScored": data.get('biologyScored', ''),
+        "computerScienceTotal": data.get('computerScienceTotal', ''),
+        "computerScienceScored": data.get('computerScienceScored', ''),
+        "englishTotal": data.get('englishTotal', ''),
+        "englishScored": data.get('englishScored', ''),
+        "languageType": data.get('languageType', '').strip(),
+        "languageTotal": data.get('languageTotal', ''),
+        "languageScored": data.get('languageScored', ''),
+        "additionalLanguage": data.get('additionalLanguage', '').strip(),
+        "additionalLanguageTotal": data.get('additionalLanguageTotal', ''),
+        "additionalLanguageScored": data.get('additionalLanguageScored', ''),
+    
+        # Parent/Guardian Information
+        "fatherName": data.get('fatherName', '').strip(),
+        "fatherOccupation": data.get('fatherOccupation', '').strip(),
+        "fatherIncome": data.get('fatherIncome', ''),
+        "fatherMobile": data.get('fatherMobile', '').strip(),
+        "motherName": data.get('motherName', '').strip(),
+        "motherOccupation": data.get('motherOccupation', '').strip(),
+        "motherIncome": data.get('motherIncome', ''),
+        "motherMobile": data.get('motherMobile', '').strip(),
+        "parentEmail": data.get('parentEmail', '').strip().lower(),
+        "parent_name": data.get('fatherName', '').strip(),  # For backward compatibility
+        "parent_email": data.get('parentEmail', '').strip().lower(),  # For backward compatibility
+        "parent_phone": data.get('fatherMobile', '').strip(),  # For backward compatibility
+        "guardianName": data.get('guardianName', '').strip(),
+        "guardianOccupation": data.get('guardianOccupation', '').strip(),
+        "guardianIncome": data.get('guardianIncome', ''),
+    
+        # University/Admission Details
+        "department": data.get('department', '').strip(),
+        "programName": data.get('programName', '').strip(),
+        "admissionType": data.get('admissionType', '').strip(),
+        "juApplication": ju_application,
+        "studentAadhaar": data.get('studentAadhaar', '').strip(),
+    
+        # Document Upload Information (Google Drive)
+        "documentsFolder": documents_upload_result.get('student_folder_id'),
+        "uploadedDocuments": documents_upload_result.get('uploaded_documents', {}),
+        "failedDocuments": documents_upload_result.get('failed_documents', []),
+        "documentUploadSummary": documents_upload_result.get('upload_summary', {}),
+        "documentUploadStatus": document_upload_status,
+    
+        # Legacy document fields (for backward compatibility)
+        "aadhaarUpload": documents_upload_result.get('uploaded_documents', {}).get('aadhaarUpload', {}).get('file_id'),
+        "tenthMarksheetUpload": documents_upload_result.get('uploaded_documents', {}).get('tenthMarksheetUpload', {}).get('file_id'),
+        "twelfthMarksheetUpload": documents_upload_result.get('uploaded_documents', {}).get('twelfthMarksheetUpload', {}).get('file_id'),
+        "transferCertificateUpload": documents_upload_result.get('uploaded_documents', {}).get('transferCertificateUpload', {}).get('file_id'),
+        "conductCertificateUpload": documents_upload_result.get('uploaded_documents', {}).get('conductCertificateUpload', {}).get('file_id'),
+        "casteCertificateUpload": documents_upload_result.get('uploaded_documents', {}).get('casteCertificateUpload', {}).get('file_id'),
+        "incomeCertificateUpload": documents_upload_result.get('uploaded_documents', {}).get('incomeCertificateUpload', {}).get('file_id'),
+        "photographUpload": documents_upload_result.get('uploaded_documents', {}).get('photographUpload', {}).get('file_id')
+    }
+
+# Fields selectable in exports, in register_student schema order
+STUDENT_EXPORT_FIELDS = tuple(build_student_document({}, '', '', '', {}))
+
+DEFAULT_EXPORT_FIELDS = (
+    'student_id', 'studentFullName', 'email', 'studentContactNo', 'department',
+    'programName', 'juApplication', 'status', 'attendance', 'application_number',
+    'registration_date'
+)
 
-        if existing_student:
-            return jsonify({"success": False, "error": "Email already registered"}), 400
-        
-        existing_dept_student = students_dept_collection.find_one({"email": student_email})
-        if existing_dept_student:
-            return jsonify({"success": False, "error": "Email already registered in department"}), 400
-        
-        # Check if JU application number already exists (only if it's not a temp one)
-        if not ju_application.startswith('TEMP_'):
-            existing_ju_student = students_dept_collection.find_one({"juApplication": ju_application})
-            if existing_ju_student:
-                return jsonify({"success": False, "error": "JU Application number already registered"}), 400
-        
-        # Generate unique student ID
-        student_id = generate_student_id()
-        
+def register_student_data(data):
+    """
+    Validate and store one registration, uploading its documents to Google Drive.
+    
+    Args:
+        data (dict): Registration fields, with optional 'documents' mapping each
+                     document type to a file handle ('file') or JSON 'file_data'
+    
+    Returns:
+        tuple: Flask JSON response and status code
+    """
+    print(f"Registration request received for: {data.get('studentFullName', 'Unknown')}")
+    
+    # Validate input data
+    validation_error = validate_student_data(data)
+    if validation_error:
+        return jsonify({"success": False, "error": validation_error}), 400
+    
+    # Check if JU application number is provided (make it optional for now)
+    ju_application = data.get('juApplication', '').strip()
+    if not ju_application:
+        # Generate a temporary JU application number if not provided
+        ju_application = f"TEMP_{uuid.uuid4().hex[:8].upper()}"
+        print(f"Generated temporary JU application: {ju_application}")
+    
+    department = normalize_department_name(data.get('department', ''))
+    print(f"Normalized department name: {department}")
+    students_dept_collection = get_department_collection(department)
+    
+    student_email = data.get('studentOfficialEmail') or data.get('studentEmail', '').strip().lower()
+    
+    # Generate unique student ID
+    student_id = generate_student_id()
+    
+    # Insert into main collection first - its unique indexes on email and confirmed
+    # JU application number reject duplicates, including concurrent submissions
+    student_main_record = {
+        "department": data.get('department', '').strip(),
+        "student_id": student_id,
+        "email": student_email,
+        "juApplication": ju_application,
+        "created_at": datetime.utcnow()
+    }
+    if not ju_application.startswith('TEMP_'):
+        student_main_record["juApplicationConfirmed"] = True
+    
+    if not registration_indexes_ready():
+        duplicate_error = find_duplicate_registration(student_email, ju_application)
+        if duplicate_error:
+            return jsonify({"success": False, "error": duplicate_error}), 400
+    
+    try:
+        get_students_collection().insert_one(student_main_record)
+    except DuplicateKeyError as e:
+        return jsonify({"success": False, "error": duplicate_registration_error(e)}), 400
+    print(f"Student main record created: {student_id}")
+    
+    try:
         # Process documents if provided
         documents_upload_result = {}
-        print(data.get('documenst'))
-        if data.get('documents'):
+        document_upload_status = 'none'
+        spooled_documents = []
+        if data.get('documents') and DOCUMENT_UPLOAD_MODE == 'async':
+            # Upload after responding: keep the files until the worker picks them up
+            spooled_documents = spool_student_documents(student_id, data['documents'])
+            document_upload_status = 'queued' if spooled_documents else 'none'
+        elif data.get('documents'):
             print("Processing document uploads...")
-            
-            # Get Google Drive service
-            drive_service = get_drive_service()
-            if drive_service:
+            document_upload_status = 'completed'
+        
+            # Get document storage
+            storage = get_document_storage()
+            if storage:
                 documents_data = data.get('documents', {})
                 student_name = data.get('studentFullName', 'Unknown')
-                
+            
                 # Process documents
                 upload_result = process_student_documents(
-                    drive_service, 
+                    storage, 
                     documents_data, 
                     ju_application, 
-                    student_name
+                    student_name,
+                    student_id=student_id
                 )
-                
+            
                 documents_upload_result = upload_result
                 print(f"Document upload result: {upload_result.get('upload_summary', {})}")
             else:
-                print("Google Drive service unavailable - skipping document upload")
-        
+                print("Document storage unavailable - skipping document upload")
+                document_upload_status = 'failed'
+    
         # Prepare comprehensive student document for department collection
-        student_doc = {
-            # Generated fields
-            "student_id": student_id,
-            "status": "pending",
-            "attendance": "absent",
-            "has_photo": bool(data.get('photographUpload')),
-            "application_number": None,
-            "registration_date": datetime.now().isoformat(),
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow(),
-            
-            # Personal Information
-            "studentFullName": data.get('studentFullName', '').strip(),
-            "name": data.get('studentFullName', '').strip(),  # For backward compatibility
-            "gender": data.get('gender', '').strip(),
-            "dateOfBirth": data.get('dateOfBirth', ''),
-            "dob": data.get('dateOfBirth', ''),  # For backward compatibility
-            "bloodGroup": data.get('bloodGroup', '').strip(),
-            "nationality": data.get('nationality', 'Indian').strip(),
-            "religion": data.get('religion', '').strip(),
-            "caste": data.get('caste', '').strip(),
-            "motherTongue": data.get('motherTongue', '').strip(),
-            "category": data.get('category', '').strip(),
-            "birthPlace": data.get('birthPlace', '').strip(),
-            
-            # Contact Information
-            "studentContactNo": data.get('studentContactNo', '').strip(),
-            "phone": data.get('studentContactNo', '').strip(),  # For backward compatibility
-            "studentEmail": data.get('studentEmail', '').strip().lower(),
-            "email": student_email,  # Primary email for lookups
-            "parentContactNo": data.get('parentContactNo', '').strip(),
-            
-            # Address Information
-            "correspondenceAddress": data.get('correspondenceAddress', '').strip(),
-            "correspondenceCity": data.get('correspondenceCity', '').strip(),
-            "correspondenceState": data.get('correspondenceState', '').strip(),
-            "correspondenceCountry": data.get('correspondenceCountry', 'India').strip(),
-            "correspondencePostalCode": data.get('correspondencePostalCode', '').strip(),
-            "permanentAddress": data.get('permanentAddress', '').strip(),
-            "permanentCity": data.get('permanentCity', '').strip(),
-            "permanentState": data.get('permanentState', '').strip(),
-            "permanentCountry": data.get('permanentCountry', 'India').strip(),
-            "permanentPostalCode": data.get('permanentPostalCode', '').strip(),
-            
-            # Academic Information - 10th
-            "tenthMarksCardNumber": data.get('tenthMarksCardNumber', '').strip(),
-            "tenthBoardUniversity": data.get('tenthBoardUniversity', '').strip(),
-            "tenthSchoolName": data.get('tenthSchoolName', '').strip(),
-            "tenthSchoolState": data.get('tenthSchoolState', '').strip(),
-            "tenthPassedOutYear": data.get('tenthPassedOutYear', ''),
-            "tenthTotalMarks": data.get('tenthTotalMarks', ''),
-            "tenthScoredMarks": data.get('tenthScoredMarks', ''),
-            "tenthPercentage": data.get('tenthPercentage', ''),
-            
-            # Academic Information - 12th
-            "collegeInstitutionName": data.get('collegeInstitutionName', '').strip(),
-            "collegeStateName": data.get('collegeStateName', '').strip(),
-            "boardUniversity": data.get('boardUniversity', '').strip(),
-            "twelfthMarksCardNumber": data.get('twelfthMarksCardNumber', '').strip(),
-            "twelfthRegisterNumber": data.get('twelfthRegisterNumber', '').strip(),
-            "twelfthPassedOutYear": data.get('twelfthPassedOutYear', ''),
-            "twelfthTotalMarks": data.get('twelfthTotalMarks', ''),
-            "twelfthScoredMarks": data.get('twelfthScoredMarks', ''),
-            "twelfthPercentage": data.get('twelfthPercentage', ''),
-            
-            # Subject-wise Marks
-            "pcmTotal": data.get('pcmTotal', ''),
-            "pcmPercentage": data.get('pcmPercentage', ''),
-            "physicsTotal": data.get('physicsTotal', ''),
-            "physicsScored": data.get('physicsScored', ''),
-            "chemistryTotal": data.get('chemistryTotal', ''),
-            "chemistryScored": data.get('chemistryScored', ''),
-            "mathematicsTotal": data.get('mathematicsTotal', ''),
-            "mathematicsScored": data.get('mathematicsScored', ''),
-            "biologyTotal": data.get('biologyTotal', ''),
-            "biologyScored": data.get('biologyScored', ''),
-            "computerScienceTotal": data.get('computerScienceTotal', ''),
-            "computerScienceScored": data.get('computerScienceScored', ''),
-            "englishTotal": data.get('englishTotal', ''),
-            "englishScored": data.get('englishScored', ''),
-            "languageType": data.get('languageType', '').strip(),
-            "languageTotal": data.get('languageTotal', ''),
-            "languageScored": data.get('languageScored', ''),
-            "additionalLanguage": data.get('additionalLanguage', '').strip(),
-            "additionalLanguageTotal": data.get('additionalLanguageTotal', ''),
-            "additionalLanguageScored": data.get('additionalLanguageScored', ''),
-            
-            # Parent/Guardian Information
-            "fatherName": data.get('fatherName', '').strip(),
-            "fatherOccupation": data.get('fatherOccupation', '').strip(),
-            "fatherIncome": data.get('fatherIncome', ''),
-            "fatherMobile": data.get('fatherMobile', '').strip(),
-            "motherName": data.get('motherName', '').strip(),
-            "motherOccupation": data.get('motherOccupation', '').strip(),
-            "motherIncome": data.get('motherIncome', ''),
-            "motherMobile": data.get('motherMobile', '').strip(),
-            "parentEmail": data.get('parentEmail', '').strip().lower(),
-            "parent_name": data.get('fatherName', '').strip(),  # For backward compatibility
-            "parent_email": data.get('parentEmail', '').strip().lower(),  # For backward compatibility
-            "parent_phone": data.get('fatherMobile', '').strip(),  # For backward compatibility
-            "guardianName": data.get('guardianName', '').strip(),
-            "guardianOccupation": data.get('guardianOccupation', '').strip(),
-            "guardianIncome": data.get('guardianIncome', ''),
-            
-            # University/Admission Details
-            "department": data.get('department', '').strip(),
-            "programName": data.get('programName', '').strip(),
-            "admissionType": data.get('admissionType', '').strip(),
+        student_doc = build_student_document(
+            data,
+            student_id,
+            ju_application,
+            student_email,
+            documents_upload_result,
+            document_upload_status
+        )
+    
+        # Insert into department collection
+        result = students_dept_collection.insert_one(student_doc)
+    except DuplicateKeyError as e:
+        get_students_collection().delete_one({"student_id": student_id})
+        discard_spooled_documents(student_id)
+        return jsonify({"success": False, "error": duplicate_registration_error(e)}), 400
+    except Exception:
+        # Release the email and JU application number so the student can retry
+        get_students_collection().delete_one({"student_id": student_id})
+        discard_spooled_documents(student_id)
+        raise
+    
+    if result.inserted_id:
+        upsert_student_read_model(student_doc)
+        count_student_registered(department)
+        register_department(data.get('department', ''))
+        
+        if spooled_documents:
+            try:
+                enqueue_document_upload(student_id, department, ju_application, data.get('studentFullName', 'Unknown'), spooled_documents)
+            except Exception as e:
+                # The registration stands; the student can upload the documents again
+                print(f"Could not queue document upload for {student_id}: {e}")
+                discard_spooled_documents(student_id)
+                document_upload_status = 'failed'
+                students_dept_collection.update_one(
+                    {"student_id": student_id},
+                    {"$set": {"documentUploadStatus": document_upload_status}}
+                )
+        
+        response_data = {
+            "success": True,
+            "studentId": student_id,
             "juApplication": ju_application,
-            "studentAadhaar": data.get('studentAadhaar', '').strip(),
+            "data": {
+                "studentFullName": data.get('studentFullName', ''),
+                "name": data.get('studentFullName', ''),  # For backward compatibility
+                "department": data.get('department', ''),
+                "email": student_email,
+                "studentContactNo": data.get('studentContactNo', ''),
+                "admissionType": data.get('admissionType', ''),
+                "programName": data.get('programName', '')
+            },
+            "documentUpload": {
+                "status": document_upload_status,
+                "folderId": documents_upload_result.get('student_folder_id'),
+                "uploadedCount": len(documents_upload_result.get('uploaded_documents', {})),
+                "failedCount": len(documents_upload_result.get('failed_documents', [])),
+                "queuedCount": len(spooled_documents),
+                "summary": documents_upload_result.get('upload_summary', {})
+            },
+            "message": "Registration successful"
+        }
+        
+        print(f"Registration successful for {student_id} - JU: {ju_application}")
+        return jsonify(response_data), 201
+    else:
+        return jsonify({"success": False, "error": "Failed to save student data"}), 500
+
+@app.route('/api/students/register', methods=['POST'])
+def register_student():
+    """Register a new student with comprehensive details and Google Drive document uploads"""
+    try:
+        # Get JSON data
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"success": False, "error": "No data provided"}), 400
+        
+        return register_student_data(data)
             
-            # Document Upload Information (Google Drive)
-            "documentsFolder": documents_upload_result.get('student_folder_id'),
-            "uploadedDocuments": documents_upload_result.get('uploaded_documents', {}),
-            "failedDocuments": documents_upload_result.get('failed_documents', []),
-            "documentUploadSummary": documents_upload_result.get('upload_summary', {}),
+    except Exception as e:
+        print(f"Registration error: {e}")
+        return jsonify({"success": False, "error": "Internal server error"}), 500
+
+@app.route('/api/students/register/multipart', methods=['POST'])
+def register_student_multipart():
+    """
+    Register a new student from a multipart/form-data submission.
+    
+    Registration fields are sent as form fields and documents as file parts
+    named after their document type (aadhaarUpload, photographUpload, ...).
+    Files are spooled to disk as they arrive and streamed to Google Drive,
+    so they never sit in worker memory as JSON byte arrays.
+    """
+    try:
+        if request.content_length and request.content_length > MAX_MULTIPART_REQUEST_SIZE:
+            return jsonify({"success": False, "error": "Request too large"}), 413
+        
+        data = request.form.to_dict()
+        if not data:
+            return jsonify({"success": False, "error": "No data provided"}), 400
+        
+        documents = multipart_documents()
+        if documents:
+            data['documents'] = documents
+        
+        return register_student_data(data)
             
-            # Legacy document fields (for backward compatibility)
-            "aadhaarUpload": documents_upload_result.get('uploaded_documents', {}).get('aadhaarUpload', {}).get('file_id'),
-            "tenthMarksheetUpload": documents_upload_result.get('uploaded_documents', {}).get('tenthMarksheetUpload', {}).get('file_id'),
-            "twelfthMarksheetUpload": documents_upload_result.get('uploaded_documents', {}).get('twelfthMarksheetUpload', {}).get('file_id'),
-            "transferCertificateUpload": documents_upload_result.get('uploaded_documents', {}).get('transferCertificateUpload', {}).get('file_id'),
-            "conductCertificateUpload": documents_upload_result.get('uploaded_documents', {}).get('conductCertificateUpload', {}).get('file_id'),
-            "casteCertificateUpload": documents_upload_result.get('uploaded_documents', {}).get('casteCertificateUpload', {}).get('file_id'),
-            "incomeCertificateUpload": documents_upload_result.get('uploaded_documents', {}).get('incomeCertificateUpload', {}).get('file_id'),
-            "photographUpload": documents_upload_result.get('uploaded_documents', {}).get('photographUpload', {}).get('file_id')
-        }
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        print(f"Registration error: {e}")
+        return jsonify({"success": False, "error": "Internal server error"}), 500
+
+def parse_import_rows(text_stream, import_format):
+    """
+    Parse a CSV or NDJSON import into registration payloads.
+    
+    Yields:
+        tuple: (row number, payload dict or None, parse error or None)
+    """
+    if import_format == 'csv':
+        for row_number, row in enumerate(csv.DictReader(text_stream), start=1):
+            # Blank cells are treated as missing fields
+            yield row_number, {key.strip(): value for key, value in row.items() if key and value not in (None, '')}, None
+        return
+    
+    row_number = 0
+    for line in text_stream:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield row_number, None, "Each line must be a JSON object"
+            continue
+        # Fields are strings as in CSV; numbers are accepted as their text
+        invalid = [key for key, value in row.items() if isinstance(value, (bool, dict, list))]
+        if invalid:
+            yield row_number, None, f"Fields must be strings or numbers: {', '.join(invalid)}"
+            continue
+        yield row_number, {
+            key: value if isinstance(value, str) else str(value)
+            for key, value in row.items() if value is not None
+        }, None
+
+def import_format_for(filename, content_type=None, requested_format=None):
+    """Work out the import format from an explicit format, file name or content type"""
+    if requested_format:
+        return requested_format.lower()
+    filename = (filename or '').lower()
+    if filename.endswith(('.ndjson', '.jsonl')) or 'ndjson' in (content_type or ''):
+        return 'ndjson'
+    return 'csv'
+
+def import_student_chunk(rows, report, seen_emails, seen_ju_applications, can_import=None):
+    """
+    Register one chunk of parsed import rows with bulk writes.
+    
+    Args:
+        rows (list): (row number, payload, parse error) tuples
+        report (dict): Import report, updated in place
+        seen_emails (set): Emails already taken earlier in this import
+        seen_ju_applications (set): JU application numbers already taken earlier in this import
+        can_import (callable): Optional check of whether a department may be imported into
+    """
+    def fail(row_number, error, data=None):
+        report['errors'].append({
+            'row': row_number,
+            'email': (data or {}).get('studentEmail') or (data or {}).get('studentOfficialEmail'),
+            'error': error
+        })
+    
+    candidates = []
+    for row_number, data, parse_error in rows:
+        if parse_error:
+            fail(row_number, parse_error)
+            continue
         
-        # Store in main students collection for tracking
-        student_main_record = {
+        validation_error = validate_student_data(data)
+        if validation_error:
+            fail(row_number, validation_error, data)
+            continue
+        if can_import and not can_import(data['department']):
+            fail(row_number, 'Access denied for department', data)
+            continue
+        
+        student_email = data.get('studentOfficialEmail') or data.get('studentEmail', '').strip().lower()
+        ju_application = str(data.get('juApplication', '')).strip() or f"TEMP_{uuid.uuid4().hex[:8].upper()}"
+        if student_email in seen_emails:
+            fail(row_number, "Email already registered", data)
+            continue
+        if ju_application in seen_ju_applications:
+            fail(row_number, "JU Application number already registered", data)
+            continue
+        seen_emails.add(student_email)
+        seen_ju_applications.add(ju_application)
+        candidates.append((row_number, data, student_email, ju_application))
+    
+    if not candidates:
+        return
+    
+    # One query finds every row that collides with an existing registration
+    confirmed_ju_applications = [ju for _, _, _, ju in candidates if not ju.startswith('TEMP_')]
+    existing_emails = set()
+    existing_ju_applications = set()
+    for existing in get_students_collection().find(
+        {"$or": [
+            {"email": {"$in": [email for _, _, email, _ in candidates]}},
+            {"juApplication": {"$in": confirmed_ju_applications}}
+        ]},
+        {"_id": 0, "email": 1, "juApplication": 1}
+    ):
+        existing_emails.add(existing.get('email'))
+        existing_ju_applications.add(existing.get('juApplication'))
+    
+    pending = []
+    for row_number, data, student_email, ju_application in candidates:
+        if student_email in existing_emails:
+            fail(row_number, "Email already registered", data)
+            continue
+        if ju_application in existing_ju_applications:
+            fail(row_number, "JU Application number already registered", data)
+            continue
+        
+        student_id = generate_student_id()
+        try:
+            student_doc = build_student_document(data, student_id, ju_application, student_email, {})
+        except Exception as e:
+            fail(row_number, f"Invalid row: {e}", data)
+            continue
+        
+        main_record = {
             "department": data.get('department', '').strip(),
             "student_id": student_id,
             "email": student_email,
             "juApplication": ju_application,
             "created_at": datetime.utcnow()
         }
+        if not ju_application.startswith('TEMP_'):
+            main_record["juApplicationConfirmed"] = True
+        pending.append({'row': row_number, 'data': data, 'main': main_record, 'doc': student_doc})
+    
+    if not pending:
+        return
+    
+    # Main records first: their unique indexes still reject rows that raced a concurrent registration
+    rejected = {}
+    try:
+        get_students_collection().insert_many([entry['main'] for entry in pending], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get('writeErrors', []):
+            rejected[error['index']] = error
+    
+    by_department = {}
+    for index, entry in enumerate(pending):
+        if index in rejected:
+            error = rejected[index]
+            message = duplicate_registration_error(error) if error.get('code') == 11000 else error.get('errmsg', 'Write failed')
+            fail(entry['row'], message, entry['data'])
+            continue
+        by_department.setdefault(normalize_department_name(entry['data']['department']), []).append(entry)
+    
+    for department, entries in by_department.items():
+        failed_indexes = {}
+        try:
+            get_department_collection(department).insert_many([entry['doc'] for entry in entries], ordered=False)
+        except BulkWriteError as e:
+            failed_indexes = {error['index']: error for error in e.details.get('writeErrors', [])}
+        except Exception as e:
+            failed_indexes = {index: {'errmsg': str(e)} for index in range(len(entries))}
         
-        # Insert into main collection
-        get_students_collection().insert_one(student_main_record)
-        print(f"Student main record created: {student_id}")
+        if failed_indexes:
+            # Release the email and JU application number so the rows can be retried
+            get_students_collection().delete_many({
+                "student_id": {"$in": [entries[index]['main']['student_id'] for index in failed_indexes]}
+            })
+            for index, error in failed_indexes.items():
+                message = duplicate_registration_error(error) if error.get('code') == 11000 else error.get('errmsg', 'Write failed')
+                fail(entries[index]['row'], message, entries[index]['data'])
+        
+        imported = [entry for index, entry in enumerate(entries) if index not in failed_indexes]
+        if not imported:
+            continue
+        upsert_student_read_models([entry['doc'] for entry in imported])
+        count_student_registered(department, count=len(imported))
+        for name in {entry['data']['department'] for entry in imported}:
+            register_department(name)
+        report['imported'].extend(
+            {'row': entry['row'], 'studentId': entry['main']['student_id'], 'juApplication': entry['main']['juApplication']}
+            for entry in imported
+        )
+
+def import_students(text_stream, import_format, chunk_size=None, can_import=None):
+    """
+    Register students from a CSV or NDJSON stream.
+    
+    Rows are validated with validate_student_data, checked for duplicates in
+    bulk, and written with unordered insert_many chunks to the students and
+    department collections. Documents are not uploaded; students upload
+    them afterwards through the usual endpoints.
+    
+    Args:
+        text_stream: Text file object with the import data
+        import_format (str): 'csv' or 'ndjson'
+        chunk_size (int): Rows per bulk write (default IMPORT_CHUNK_SIZE)
+        can_import (callable): Optional check of whether a department may be imported into
+    
+    Returns:
+        dict: Summary, imported rows and per-row errors
+    """
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    report = {'imported': [], 'errors': []}
+    seen_emails = set()
+    seen_ju_applications = set()
+    total = 0
+    
+    chunk = []
+    for row in parse_import_rows(text_stream, import_format):
+        chunk.append(row)
+        total += 1
+        if len(chunk) >= chunk_size:
+            import_student_chunk(chunk, report, seen_emails, seen_ju_applications, can_import)
+            chunk = []
+    if chunk:
+        import_student_chunk(chunk, report, seen_emails, seen_ju_applications, can_import)
+    
+    report['errors'].sort(key=lambda error: error['row'])
+    report['summary'] = {
+        'total': total,
+        'imported': len(report['imported']),
+        'failed': len(report['errors'])
+    }
+    print(f"Bulk import finished: {report['summary']}")
+    return report
+
+@app.route('/api/students/import', methods=['POST'])
+@auth_required
+def import_students_endpoint():
+    """
+    Bulk register students from a CSV or NDJSON upload.
+    
+    Accepts a multipart 'file' field or the raw request body. The format is
+    taken from ?format=csv|ndjson, then the file name, then the content type.
+    Department admins can only import into their own department.
+    """
+    try:
+        upload = request.files.get('file')
+        if upload:
+            import_format = import_format_for(upload.filename, upload.content_type, request.args.get('format'))
+            binary_stream = upload.stream
+        else:
+            import_format = import_format_for(None, request.content_type, request.args.get('format'))
+            binary_stream = request.stream
         
-        # Insert into department collection
-        result = students_dept_collection.insert_one(student_doc)
+        if import_format not in ('csv', 'ndjson'):
+            return jsonify({'success': False, 'error': 'format must be csv or ndjson'}), 400
         
-        if result.inserted_id:
-            response_data = {
-                "success": True,
-                "studentId": student_id,
-                "juApplication": ju_application,
-                "data": {
-                    "studentFullName": data.get('studentFullName', ''),
-                    "name": data.get('studentFullName', ''),  # For backward compatibility
-                    "department": data.get('department', ''),
-                    "email": student_email,
-                    "studentContactNo": data.get('studentContactNo', ''),
-                    "admissionType": data.get('admissionType', ''),
-                    "programName": data.get('programName', '')
-                },
-                "documentUpload": {
-                    "folderId": documents_upload_result.get('student_folder_id'),
-                    "uploadedCount": len(documents_upload_result.get('uploaded_documents', {})),
-                    "failedCount": len(documents_upload_result.get('failed_documents', [])),
-                    "summary": documents_upload_result.get('upload_summary', {})
-                },
-                "message": "Registration successful"
-            }
-            
-            print(f"Registration successful for {student_id} - JU: {ju_application}")
-            return jsonify(response_data), 201
-        else:
-            return jsonify({"success": False, "error": "Failed to save student data"}), 500
-            
+        text_stream = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+        report = import_students(text_stream, import_format, can_import=can_access_department)
+        return jsonify({'success': True, **report}), 200
+        
+    except (csv.Error, UnicodeDecodeError) as e:
+        return jsonify({'success': False, 'error': f"Could not parse import: {e}"}), 400
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
-        print(f"Registration error: {e}")
-        return jsonify({"success": False, "error": "Internal server error"}), 500
+        print(f"Bulk import error: {e}")
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
+
+@app.cli.command('import-students')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'import_format', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=None, type=int, help='Rows per bulk write (default IMPORT_CHUNK_SIZE).')
+@click.option('--report', 'report_path', type=click.Path(dir_okay=False), help='Write the full JSON report here.')
+def import_students_command(path, import_format, chunk_size, report_path):
+    """Bulk register students from a CSV or NDJSON file."""
+    with open(path, encoding='utf-8-sig', newline='') as text_stream:
+        report = import_students(text_stream, import_format_for(path, requested_format=import_format), chunk_size)
+    
+    summary = report['summary']
+    click.echo(f"{summary['imported']} of {summary['total']} rows imported, {summary['failed']} failed")
+    for error in report['errors']:
+        click.echo(f"  row {error['row']}: {error['error']}")
+    if report_path:
+        with open(report_path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+        click.echo(f"Report written to {report_path}")
 
 @app.route('/api/students/status', methods=['POST'])
 def check_student_status():
@@ -845,18 +2178,10 @@ def check_student_status():
         
         student_id = data['studentId']
         
-        # Find student in main collection to get department
-        dept_details = get_students_collection().find_one({"student_id": student_id})
-        if not dept_details:
-            return jsonify({"success": False, "error": "Student not found"}), 404
-
-        department = normalize_department_name(dept_details['department'])
-        students_dept_collection = get_department_collection(department)
-
-        # Find student in department collection
-        student = students_dept_collection.find_one({"student_id": student_id})
+        # Find student's department record
+        student = find_student_record(student_id)
         if not student:
-            return jsonify({"success": False, "error": "Student not found in department records"}), 404
+            return jsonify({"success": False, "error": "Student not found"}), 404
         
         # Return student data
         return jsonify({
@@ -868,7 +2193,9 @@ def check_student_status():
                 "status": student["status"],
                 "hasPhoto": student.get("has_photo", False),
                 "applicationNumber": student.get("application_number"),
-                "registrationDate": student["registration_date"]
+                "registrationDate": student["registration_date"],
+                "documentUploadStatus": student.get("documentUploadStatus", "none"),
+                "documentUploadSummary": student.get("documentUploadSummary", {})
             }
         }), 200
         
@@ -889,78 +2216,84 @@ def get_all_students():
         search_query = request.args.get('search')
         sort_by = request.args.get('sortBy', 'registration_date')
         sort_order = request.args.get('sortOrder', 'desc')
+        # Passing a cursor (empty for the first page) switches to keyset pagination
+        cursor = request.args.get('cursor')
         
-        # Build filter query
+        if not ensure_student_read_model():
+            return jsonify({
+                "success": False,
+                "error": "The student list is being rebuilt, please try again shortly"
+            }), 503
+        
+        # Build filter query - every filter runs server-side against the read model
         filter_query = {}
         
         # Department filter
         if department_filter:
             filter_query['department'] = department_filter
         
-        # Search filter for main collection
+        # Status and photo filters
+        if status_filter:
+            filter_query['status'] = status_filter
+        if has_photo_filter is not None:
+            filter_query['hasPhoto'] = has_photo_filter.lower() == 'true'
+        
+        # Search filter
         if search_query:
             search_regex = {"$regex": search_query, "$options": "i"}
             filter_query["$or"] = [
-                {"student_id": search_regex},
+                {"studentId": search_regex},
                 {"department": search_regex}
             ]
         
-        # Calculate pagination
-        skip = (page - 1) * limit
-        
-        # Get total count from main collection
-        total_students = get_students_collection().count_documents(filter_query)
+        read_model = get_student_read_model_collection()
         
         # Set sort order
         sort_direction = -1 if sort_order == 'desc' else 1
         
-        # Get students from main collection with pagination
-        students_cursor = get_students_collection().find(
-            filter_query,
-            {
-                "_id": 0,
-                "student_id": 1,
-                "department": 1,
-            }
-        ).sort("created_at", sort_direction).skip(skip).limit(limit)
-
-        students = []
-        for details in students_cursor:
-
-            department = normalize_department_name(details["department"])
-            students_dept_collection = get_department_collection(department)
-            student = students_dept_collection.find_one({"student_id": details['student_id']})
-
-            if not student:
-                continue  # skip if not found in department collection
-
-            # Apply additional filters
-            if status_filter and student.get("status") != status_filter:
-                continue
-            if has_photo_filter is not None and student.get("has_photo", False) != (has_photo_filter.lower() == 'true'):
-                continue
-
-            students.append({
-                "studentId": student["student_id"],
-                "name": student.get("name") or student.get("studentFullName"),
-                "email": student["email"],
-                "phone": student.get("phone") or student.get("studentContactNo", ""),
-                "department": student["department"],
-                "attendance":student["attendance"],
-                "status": student["status"],
-                "hasPhoto": student.get("has_photo", False),
-                "applicationNumber": student.get("application_number"),
-                "registrationDate": student["registration_date"],
-                "dob": student.get("dob") or student.get("dateOfBirth", ""),
-                "parentName": student.get("parent_name") or student.get("fatherName", ""),
-                "parentEmail": student.get("parent_email") or student.get("parentEmail", ""),
-                "parentPhone": student.get("parent_phone") or student.get("fatherMobile", ""),
-                "createdAt": student.get("created_at"),
-                "updatedAt": student.get("updated_at"),
-                "juApplication": student.get("juApplication"),
-                "documentsFolder": student.get("documentsFolder"),
-                "documentUploadSummary": student.get("documentUploadSummary", {})
-            })
+        if cursor is not None:
+            try:
+                students, next_cursor = keyset_page(
+                    read_model,
+                    filter_query,
+                    {"_id": 0},
+                    cursor,
+                    max(1, min(limit, MAX_PAGE_SIZE)),
+                    created_field="createdAt",
+                    id_field="studentId",
+                    direction=sort_direction
+                )
+            except ValueError as e:
+                return jsonify({"success": False, "error": str(e)}), 400
+            
+            return jsonify({
+                "success": True,
+                "students": students,
+                "pagination": {
+                    "mode": "cursor",
+                    "studentsPerPage": max(1, min(limit, MAX_PAGE_SIZE)),
+                    "nextCursor": next_cursor,
+                    "hasNext": next_cursor is not None
+                },
+                "filters": {
+                    "status": status_filter,
+                    "department": department_filter,
+                    "hasPhoto": has_photo_filter,
+                    "search": search_query
+                }
+            }), 200
+        
+        # Calculate pagination
+        skip = (page - 1) * limit
+        
+        # Get total count of matching students
+        total_students = read_model.count_documents(filter_query)
+        
+        # Get the page of students in a single query
+        students = list(read_model.find(
+            filter_query,
+            {"_id": 0}
+        ).sort("createdAt", sort_direction).skip(skip).limit(limit))
         
         # Calculate pagination info
         total_pages = (total_students + limit - 1) // limit
@@ -993,12 +2326,12 @@ def get_all_students():
 
 @app.route('/api/students/department/<department>/pending-verification', methods=['GET'])
 def get_students_by_department(department):
-    """Get all students in a specific department"""
+    """Get students in a specific department, paginated by cursor (50 per page unless limit is given)"""
     try:
         department_normalized = normalize_department_name(department)
         students_dept_collection = get_department_collection(department)
         
-        students = list(students_dept_collection.find({}, {
+        projection = {
             "_id": 0,
             "student_id": 1,
             "name": 1,
@@ -1012,7 +2345,21 @@ def get_students_by_department(department):
             "juApplication": 1,
             "documentsFolder": 1,
             "attendance": 1,
-        }))
+            "created_at": 1,
+        }
+        
+        try:
+            page_size = max(1, min(int(request.args.get('limit', 50)), MAX_PAGE_SIZE))
+            students, next_cursor = keyset_page(
+                students_dept_collection,
+                {},
+                projection,
+                request.args.get('cursor'),
+                page_size,
+                direction=1
+            )
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
 
         # Normalize the response for backward compatibility
         for student in students:
@@ -1021,15 +2368,124 @@ def get_students_by_department(department):
             if not student.get('phone') and student.get('studentContactNo'):
                 student['phone'] = student['studentContactNo']
 
-        return jsonify({
+        response_data = {
             "success": True,
-            "students": students
-        }), 200
+            "students": students,
+            "pagination": {
+                "mode": "cursor",
+                "studentsPerPage": page_size,
+                "nextCursor": next_cursor,
+                "hasNext": next_cursor is not None
+            }
+        }
+        
+        return jsonify(response_data), 200
         
     except Exception as e:
         print(f"Get students by department error: {e}")
         return jsonify({"success": False, "error": "Internal server error"}), 500
 
+def export_json_default(value):
+    """JSON encoder fallback for exported values"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def export_value(value):
+    """Convert a stored field value into a CSV cell"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=export_json_default)
+    return value
+
+def export_csv_rows(documents, fields):
+    """Yield CSV text one cursor batch at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    rows = 0
+    for document in documents:
+        writer.writerow([export_value(document.get(field)) for field in fields])
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+def export_ndjson_rows(documents, fields):
+    """Yield one JSON object per line, one cursor batch at a time"""
+    lines = []
+    for document in documents:
+        lines.append(json.dumps({field: document.get(field) for field in fields}, default=export_json_default))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+@app.route('/api/students/export-department/<department>', methods=['GET'])
+@auth_required
+def export_department_students(department):
+    """
+    Stream a department's student records as CSV or NDJSON.
+    
+    Query params:
+        format: csv (default) or ndjson
+        fields: Comma-separated fields from STUDENT_EXPORT_FIELDS
+        status: Only export students with this status
+    """
+    if not can_access_department(department):
+        return jsonify({'success': False, 'error': 'Access denied'}), 403
+    
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'error': 'format must be csv or ndjson'}), 400
+    
+    fields_param = request.args.get('fields')
+    fields = [field.strip() for field in fields_param.split(',') if field.strip()] if fields_param else list(DEFAULT_EXPORT_FIELDS)
+    unknown_fields = [field for field in fields if field not in STUDENT_EXPORT_FIELDS]
+    if unknown_fields or not fields:
+        return jsonify({
+            'success': False,
+            'error': f"Unknown export fields: {', '.join(unknown_fields)}" if unknown_fields else 'No export fields given',
+            'availableFields': list(STUDENT_EXPORT_FIELDS)
+        }), 400
+    
+    filter_query = {}
+    if request.args.get('status'):
+        filter_query['status'] = request.args.get('status')
+    
+    projection = {field: 1 for field in fields}
+    projection['_id'] = 0
+    # Server-side cursor: documents arrive EXPORT_BATCH_SIZE at a time as the response is written
+    documents = get_department_collection(department).find(
+        filter_query,
+        projection,
+        batch_size=EXPORT_BATCH_SIZE
+    ).sort([('created_at', 1), ('student_id', 1)])
+    
+    department_normalized = normalize_department_name(department)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if export_format == 'csv':
+        rows = export_csv_rows(documents, fields)
+        mimetype = 'text/csv'
+    else:
+        rows = export_ndjson_rows(documents, fields)
+        mimetype = 'application/x-ndjson'
+    
+    return Response(
+        stream_with_context(rows),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{department_normalized}_students_{timestamp}.{export_format}"',
+            'Cache-Control': 'no-store'
+        }
+    )
+
 def sendid(student_id):
     """
     Generate ID card for a verified student.
@@ -1051,7 +2507,11 @@ def sendid(student_id):
         # Initialize ID card generator with custom paths if needed
         generator = StudentIDCardGenerator(
             template_path='./Jain.pptx',
-            output_folder='./generated_id_cards'
+            output_folder='./generated_id_cards',
+            storage=get_document_storage(),
+            pdf_converter=get_id_card_pdf_converter(),
+            renderer=ID_CARD_RENDERER,
+            font_dir=ID_CARD_FONT_DIR
         )
         
         # Generate the ID card
@@ -1073,6 +2533,11 @@ def sendid(student_id):
         return {"success": False, "error": str(e)}
 
 
+def get_id_card_pdf_converter():
+    """Get this process's LibreOffice PDF converter pool, or None if LibreOffice is not installed"""
+    return get_pdf_converter(SOFFICE_PATH, PDF_CONVERTER_PROCESSES or None, PDF_CONVERSION_TIMEOUT_SECONDS)
+
+
 def fetch_student_data_for_id_card(student_id):
     """
     Fetch and format student data for ID card generation.
@@ -1084,24 +2549,15 @@ def fetch_student_data_for_id_card(student_id):
         dict: Formatted student data or None if not found
     """
     try:
-        # Get student record from main students collection
-        student_record = get_students_collection().find_one({"student_id": student_id})
-        if not student_record:
-            print(f"Student record not found for ID: {student_id}")
-            return None
-        
-        # Get additional details from department collection
-        department = normalize_department_name(student_record['department'])
-        dept_collection = get_department_collection(department)
-        dept_record = dept_collection.find_one({"student_id": student_id})
-        
+        # Get the student's full department record
+        dept_record = find_student_record(student_id)
         if not dept_record:
-            print(f"Department record not found for student: {student_id}")
+            print(f"Student record not found for ID: {student_id}")
             return None
         
         # Use the data formatter to create properly formatted data
         formatted_data = StudentDataFormatter.format_student_data(
-            student_record, 
+            dept_record, 
             dept_record
         )
         
@@ -1146,6 +2602,209 @@ def get_id_card_log_collection():
     return get_collection('id_card_generation_logs')
 
 
+def find_student_records(student_ids):
+    """
+    Get full department records for several students, one query per department.
+    
+    Args:
+        student_ids (list): Student IDs
+    
+    Returns:
+        list: Records found, in the order of student_ids
+    """
+    if STUDENT_STORAGE_MODE in ('unified', 'unified_read'):
+        records = get_unified_students_collection().find({"student_id": {"$in": student_ids}})
+    else:
+        departments = {}
+        for student in get_students_collection().find({"student_id": {"$in": student_ids}}, {"student_id": 1, "department": 1}):
+            departments.setdefault(normalize_department_name(student['department']), []).append(student['student_id'])
+        records = [
+            record
+            for department, department_ids in departments.items()
+            for record in get_department_collection(department).find({"student_id": {"$in": department_ids}})
+        ]
+    
+    records_by_id = {record['student_id']: record for record in records}
+    return [records_by_id[student_id] for student_id in student_ids if student_id in records_by_id]
+
+
+def generate_id_card_batch(department=None, student_ids=None, status='verified', processes=None, upload_concurrency=None,
+                           renderer=None):
+    """
+    Generate ID cards for a department's students or a list of students.
+    
+    Rendering is spread over worker processes and uploads are bounded by
+    ID_CARD_UPLOAD_CONCURRENCY (see id_card_batch.py).
+    
+    Args:
+        department (str): Generate for this department's students with the given status
+        student_ids (list): Generate for these students instead
+        status (str): Student status selected from the department
+        processes (int): Render worker processes (default: ID_CARD_BATCH_PROCESSES)
+        upload_concurrency (int): Photo reads and uploads in flight (default: ID_CARD_UPLOAD_CONCURRENCY)
+        renderer (str): 'pptx' or 'pdf' (default: ID_CARD_RENDERER)
+    
+    Returns:
+        dict: Batch summary with per-card results and stage timings in seconds
+    """
+    if student_ids:
+        students = find_student_records(student_ids)
+    else:
+        students = list(get_department_collection(department).find({"status": status}))
+    print(f"Generating {len(students)} ID cards...")
+    
+    generator = StudentIDCardGenerator(
+        template_path='./Jain.pptx',
+        output_folder='./generated_id_cards',
+        storage=get_document_storage(),
+        pdf_converter=get_id_card_pdf_converter(),
+        renderer=renderer or ID_CARD_RENDERER,
+        font_dir=ID_CARD_FONT_DIR
+    )
+    summary = generate_id_cards_batch(
+        students,
+        generator,
+        processes=processes or ID_CARD_BATCH_PROCESSES or None,
+        io_concurrency=upload_concurrency or ID_CARD_UPLOAD_CONCURRENCY,
+        on_card=log_id_card_generation
+    )
+    
+    found_ids = {student['student_id'] for student in students}
+    for student_id in student_ids or []:
+        if student_id not in found_ids:
+            summary['cards'].append({"student_id": student_id, "success": False, "error": "Student data not found"})
+            summary['total'] += 1
+            summary['failed'] += 1
+    
+    print(f"ID card batch finished: {summary['succeeded']}/{summary['total']} generated in {summary['elapsed']:.1f}s")
+    return summary
+
+
+@app.route('/api/admin/id-cards/batch', methods=['POST'])
+@auth_required
+def generate_id_cards_for_batch():
+    """
+    Generate ID cards for a department or a list of students.
+    
+    Body:
+        department: Generate for this department's students with the given status
+        studentIds: Generate for these students instead
+        status: Student status selected from the department (default: verified)
+        renderer: 'pptx' or 'pdf' (default: ID_CARD_RENDERER)
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        department = data.get('department')
+        student_ids = data.get('studentIds')
+        status = data.get('status', 'verified')
+        renderer = data.get('renderer')
+        
+        if bool(department) == bool(student_ids):
+            return jsonify({'success': False, 'error': 'Provide either department or studentIds'}), 400
+        if student_ids and (not isinstance(student_ids, list) or not all(isinstance(student_id, str) for student_id in student_ids)):
+            return jsonify({'success': False, 'error': 'studentIds must be a list of student IDs'}), 400
+        if renderer is not None and renderer not in ID_CARD_RENDERERS:
+            return jsonify({'success': False, 'error': f"renderer must be one of {', '.join(ID_CARD_RENDERERS)}"}), 400
+        
+        if department:
+            if not can_access_department(department):
+                return jsonify({'success': False, 'error': 'Access denied'}), 403
+        else:
+            student_ids = list(dict.fromkeys(student_ids))
+            for student in get_students_collection().find({"student_id": {"$in": student_ids}}, {"department": 1}):
+                if not can_access_department(student['department']):
+                    return jsonify({'success': False, 'error': 'Access denied'}), 403
+        
+        if BACKGROUND_JOBS:
+            job_id = enqueue_background_job('generate_id_card_batch', {
+                "department": department,
+                "student_ids": student_ids,
+                "status": status,
+                "renderer": renderer
+            })
+            return jsonify({'success': True, 'queued': True, 'jobId': str(job_id)}), 202
+        
+        card_count = len(student_ids) if student_ids else get_department_collection(department).count_documents({"status": status})
+        if card_count > ID_CARD_SYNC_BATCH_LIMIT:
+            return jsonify({
+                'success': False,
+                'error': f"Batches of more than {ID_CARD_SYNC_BATCH_LIMIT} ID cards need BACKGROUND_JOBS enabled; "
+                         "use 'flask --app main id-cards generate' instead"
+            }), 400
+        
+        summary = generate_id_card_batch(department, student_ids, status, renderer=renderer)
+        return jsonify({'success': True, **summary}), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.cli.group('id-cards')
+def id_cards_command():
+    """Generate student ID cards."""
+
+@id_cards_command.command('generate')
+@click.option('--department', help="Generate for this department's students.")
+@click.option('--student-id', 'student_ids', multiple=True, help='Generate for this student (repeatable).')
+@click.option('--status', default='verified', show_default=True, help='Student status selected from the department.')
+@click.option('--processes', type=int, help='Render worker processes (default: ID_CARD_BATCH_PROCESSES or CPU count).')
+@click.option('--upload-concurrency', type=int, help='Photo reads and uploads in flight (default: ID_CARD_UPLOAD_CONCURRENCY).')
+@click.option('--renderer', type=click.Choice(ID_CARD_RENDERERS), help='Card renderer (default: ID_CARD_RENDERER).')
+def generate_id_cards_command(department, student_ids, status, processes, upload_concurrency, renderer):
+    """Generate and upload ID cards, printing per-card stage timings."""
+    if bool(department) == bool(student_ids):
+        raise click.UsageError("Give either --department or --student-id")
+    
+    summary = generate_id_card_batch(department, list(student_ids), status, processes, upload_concurrency, renderer)
+    for card in summary['cards']:
+        timings = card.get('timings', {})
+        stages = '  '.join(f"{stage}={timings[stage]:.2f}s" for stage in ('fetch', 'render', 'convert', 'upload', 'total') if stage in timings)
+        outcome = 'ok' if card.get('success') else f"failed: {card.get('error')}"
+        click.echo(f"{card['student_id']:<24} {outcome:<12} {stages}")
+    click.echo(f"{summary['succeeded']}/{summary['total']} ID cards generated in {summary['elapsed']:.1f}s; "
+               + ', '.join(f"{stage} {seconds:.1f}s" for stage, seconds in summary['stage_seconds'].items()))
+
+@id_cards_command.command('compare')
+@click.argument('student_id')
+@click.option('--output', default='./id_card_comparison', show_default=True, help='Folder for both PDFs and the diff images.')
+@click.option('--dpi', default=150, show_default=True, help='Rasterization resolution.')
+@click.option('--threshold', default=48, show_default=True, help='Channel difference (0-255) above which a pixel differs.')
+@click.option('--max-differing-ratio', default=MAX_DIFFERING_RATIO, show_default=True,
+              help='Largest share of differing pixels a page may have and pass.')
+def compare_id_card_renderers_command(student_id, output, dpi, threshold, max_differing_ratio):
+    """Render a student's card with the pptx and pdf renderers and diff the pages; exits 1 if a page fails."""
+    student_data = fetch_student_data_for_id_card(student_id)
+    if not student_data:
+        raise click.ClickException("Student data not found")
+    
+    generator = StudentIDCardGenerator(
+        template_path='./Jain.pptx',
+        output_folder=output,
+        storage=get_document_storage(),
+        pdf_converter=get_id_card_pdf_converter(),
+        font_dir=ID_CARD_FONT_DIR
+    )
+    try:
+        comparison = compare_renderers(
+            generator, student_data, output, dpi=dpi, threshold=threshold, max_differing_ratio=max_differing_ratio
+        )
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    
+    for renderer, rendered in comparison['renderers'].items():
+        timings = rendered['timings']
+        click.echo(f"{renderer:<5} {rendered['pdf_path']}  render={timings['render']:.3f}s  convert={timings['convert']:.2f}s")
+    for page in comparison['pages']:
+        outcome = 'ok' if page['passed'] else 'FAILED'
+        click.echo(f"page {page['page']}: {outcome} - {page['differing_ratio']:.2%} of pixels differ, "
+                   f"mean difference {page['mean_difference']:.1f}  ({page['diff_path']})")
+    if not comparison['passed']:
+        click.echo(f"The pdf renderer differs from the pptx renderer by more than {max_differing_ratio:.2%} "
+                   "of a page's pixels - keep ID_CARD_RENDERER=pptx")
+        raise SystemExit(1)
+    click.echo("The pdf renderer matches the pptx renderer - ID_CARD_RENDERER=pdf can be used")
+
+
 @app.route('/api/students/<student_id>/documents', methods=['POST', 'PUT'])
 def upload_student_documents(student_id):
     """
@@ -1202,6 +2861,7 @@ def upload_student_documents(student_id):
         
         # If all main documents verified, update status and generate ID card
         id_card_result = None
+        id_card_job_id = None
         if all_required_verified:
             # Get student's department from the central "students" collection
             student_record = get_students_collection().find_one({"student_id": student_id})
@@ -1215,19 +2875,30 @@ def upload_student_documents(student_id):
             students_dept_collection = get_department_collection(department)
             
             # Update status in the corresponding department collection
-            update_result = students_dept_collection.update_one(
+            status_update = {"status": "verified", "updated_at": datetime.utcnow()}
+            previous_record = students_dept_collection.find_one_and_update(
                 {"student_id": student_id},
-                {"$set": {"status": "verified", "updated_at": datetime.utcnow()}}
+                {"$set": status_update},
+                projection={"status": 1, "updated_at": 1},
+                return_document=ReturnDocument.BEFORE
             )
+            update_student_read_model(student_id, status_update)
+            if previous_record:
+                count_status_change(department, previous_record.get("status"), "verified", status_update["updated_at"],
+                                    previous_record.get("updated_at"))
             
             # Generate ID card using the imported module
-            print(f"All documents verified for {student_id}, generating ID card...")
-            id_card_result = sendid(student_id)
+            if BACKGROUND_JOBS:
+                print(f"All documents verified for {student_id}, queueing ID card generation...")
+                id_card_job_id = enqueue_background_job('generate_id_card', {"student_id": student_id})
+            else:
+                print(f"All documents verified for {student_id}, generating ID card...")
+                id_card_result = sendid(student_id)
             
-            if update_result.modified_count:
+            if previous_record:
                 print(f"Student {student_id} status updated to 'verified' in {department}")
             else:
-                print(f"Student {student_id} found but status not updated")
+                print(f"Student {student_id} not found in {department} - status not updated")
         
         # Prepare response
         response_data = {
@@ -1238,7 +2909,13 @@ def upload_student_documents(student_id):
         }
         
         # Add ID card generation result to response
-        if id_card_result:
+        if id_card_job_id:
+            response_data["idCardGeneration"] = {
+                "attempted": True,
+                "queued": True,
+                "jobId": str(id_card_job_id)
+            }
+        elif id_card_result:
             response_data["idCardGeneration"] = {
                 "attempted": True,
                 "success": id_card_result.get("success", False),
@@ -1264,6 +2941,378 @@ def upload_student_documents(student_id):
         }), 500
 
 
+@app.route('/api/students/<student_id>/documents/upload', methods=['POST'])
+def upload_student_document_files(student_id):
+    """
+    Upload documents for a registered student from a multipart/form-data request.
+    
+    File parts are named after their document type, as in multipart registration.
+    """
+    try:
+        if request.content_length and request.content_length > MAX_MULTIPART_REQUEST_SIZE:
+            return jsonify({"success": False, "error": "Request too large"}), 413
+        
+        documents = multipart_documents()
+        if not documents:
+            return jsonify({"success": False, "error": "No documents provided"}), 400
+        
+        student = find_student_record(student_id)
+        if not student:
+            return jsonify({"success": False, "error": "Student not found"}), 404
+        
+        storage = get_document_storage()
+        if not storage:
+            return jsonify({"success": False, "error": "Document storage unavailable"}), 503
+        
+        upload_result = process_student_documents(
+            storage,
+            documents,
+            student.get('juApplication', student_id),
+            student.get('studentFullName', student.get('name', 'Unknown')),
+            student_id=student_id,
+            folder_id=student.get('documentsFolder')
+        )
+        if not upload_result.get('success'):
+            return jsonify({"success": False, "error": upload_result.get('error', 'Document upload failed')}), 500
+        
+        uploaded_documents = upload_result.get('uploaded_documents', {})
+        if uploaded_documents:
+            apply_document_upload_result(student_id, student.get('department', ''), upload_result)
+        
+        return jsonify({
+            "success": True,
+            "studentId": student_id,
+            "documentUpload": {
+                "folderId": upload_result.get('student_folder_id'),
+                "uploadedCount": len(uploaded_documents),
+                "failedCount": len(upload_result.get('failed_documents', [])),
+                "uploadedDocuments": uploaded_documents,
+                "failedDocuments": upload_result.get('failed_documents', [])
+            }
+        }), 200
+        
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        print(f"Document file upload error: {e}")
+        return jsonify({"success": False, "error": "Internal server error"}), 500
+
+# Resumable document uploads
+# POST   /api/students/<student_id>/documents/uploads              open a session
+# GET    /api/students/<student_id>/documents/uploads/<upload_id>  bytes received so far
+# PUT    /api/students/<student_id>/documents/uploads/<upload_id>  append a chunk at ?offset=
+# POST   /api/students/<student_id>/documents/uploads/<upload_id>/complete  store the document
+def upload_session_spool_path(upload_id):
+    return os.path.join(UPLOAD_SESSION_SPOOL_DIR, secure_filename(upload_id))
+
+def serialize_upload_session(session, received=None):
+    return {
+        "uploadId": session['_id'],
+        "documentType": session['document_type'],
+        "filename": session['filename'],
+        "size": session['size'],
+        "received": session['received'] if received is None else received,
+        "status": session['status'],
+        "chunkSize": UPLOAD_CHUNK_SIZE,
+        "expiresAt": session['expires_at'].isoformat()
+    }
+
+@app.route('/api/students/<student_id>/documents/uploads', methods=['POST'])
+def create_document_upload_session(student_id):
+    """Open a resumable upload session for one document"""
+    try:
+        data = request.get_json(silent=True) or {}
+        document_type = data.get('documentType')
+        filename = data.get('filename')
+        size = data.get('size')
+        
+        if document_type not in DOCUMENT_TYPES:
+            return jsonify({"success": False, "error": f"documentType must be one of: {', '.join(DOCUMENT_TYPES)}"}), 400
+        if not filename or not allowed_file(filename):
+            return jsonify({"success": False, "error": "Invalid file type"}), 400
+        if not isinstance(size, int) or size <= 0:
+            return jsonify({"success": False, "error": "size must be a positive number of bytes"}), 400
+        if size > MAX_FILE_SIZE:
+            return jsonify({"success": False, "error": "File too large (>5MB)"}), 413
+        
+        if not find_student_record(student_id):
+            return jsonify({"success": False, "error": "Student not found"}), 404
+        
+        session = create_upload_session(
+            get_upload_sessions_collection(), student_id, document_type, filename, size, UPLOAD_SESSION_TTL_SECONDS
+        )
+        return jsonify({"success": True, "upload": serialize_upload_session(session)}), 201
+        
+    except Exception as e:
+        print(f"Upload session error: {e}")
+        return jsonify({"success": False, "error": "Internal server error"}), 500
+
+@app.route('/api/students/<student_id>/documents/uploads/<upload_id>', methods=['GET'])
+def get_document_upload_session(student_id, upload_id):
+    """Get how many bytes of an upload have been received, to resume after a failure"""
+    session = get_upload_session(get_upload_sessions_collection(), upload_id, student_id)
+    if not session:
+        return jsonify({"success": False, "error": "Upload not found"}), 404
+    received = received_bytes(session, upload_session_spool_path(upload_id))
+    return jsonify({"success": True, "upload": serialize_upload_session(session, received)}), 200
+
+@app.route('/api/students/<student_id>/documents/uploads/<upload_id>', methods=['PUT'])
+def append_document_upload_chunk(student_id, upload_id):
+    """
+    Append a chunk, sent as the raw request body, at the byte offset given by
+    the offset query parameter. Returns 409 with the received offset when a
+    chunk would leave a gap.
+    """
+    try:
+        session = get_upload_session(get_upload_sessions_collection(), upload_id, student_id)
+        if not session:
+            return jsonify({"success": False, "error": "Upload not found"}), 404
+        if session['status'] != 'open':
+            return jsonify({"success": False, "error": f"Upload is {session['status']}"}), 409
+        
+        try:
+            offset = int(request.args.get('offset', ''))
+        except ValueError:
+            return jsonify({"success": False, "error": "offset query parameter is required"}), 400
+        length = request.content_length
+        if length is None:
+            return jsonify({"success": False, "error": "Content-Length is required"}), 411
+        if offset < 0 or offset + length > session['size']:
+            return jsonify({"success": False, "error": "Chunk exceeds the declared size"}), 413
+        
+        accepted, received = append_chunk(
+            get_upload_sessions_collection(), session, upload_session_spool_path(upload_id), offset, request.stream, length
+        )
+        if not accepted:
+            return jsonify({"success": False, "error": "Offset is past the received bytes", "received": received}), 409
+        return jsonify({"success": True, "received": received, "complete": received == session['size']}), 200
+        
+    except Exception as e:
+        print(f"Upload chunk error: {e}")
+        return jsonify({"success": False, "error": "Internal server error"}), 500
+
+@app.route('/api/students/<student_id>/documents/uploads/<upload_id>/complete', methods=['POST'])
+def complete_document_upload(student_id, upload_id):
+    """Store a fully received upload, streaming it from the spool file to document storage"""
+    sessions_collection = get_upload_sessions_collection()
+    session = get_upload_session(sessions_collection, upload_id, student_id)
+    if not session:
+        return jsonify({"success": False, "error": "Upload not found"}), 404
+    if session['status'] == 'completed':
+        return jsonify({"success": True, "studentId": student_id, "documentUpload": session.get('result')}), 200
+    
+    spool_path = upload_session_spool_path(upload_id)
+    received = received_bytes(session, spool_path)
+    if received != session['size']:
+        return jsonify({"success": False, "error": "Upload is incomplete", "received": received}), 409
+    
+    session = claim_upload_session(sessions_collection, session, UPLOAD_FINALIZE_STALE_SECONDS)
+    if not session:
+        return jsonify({"success": False, "error": "Upload is already being finalized"}), 409
+    
+    try:
+        student = find_student_record(student_id)
+        storage = get_document_storage()
+        if not student or not storage:
+            finish_upload_session(sessions_collection, session, 'open')
+            if not student:
+                return jsonify({"success": False, "error": "Student not found"}), 404
+            return jsonify({"success": False, "error": "Document storage unavailable"}), 503
+        
+        # Hashed so the upload is deduplicated and recorded like a multipart upload
+        digest = spool_digest(spool_path)
+        with open(spool_path, 'rb') as spool_file:
+            upload_result = process_student_documents(
+                storage,
+                {session['document_type']: {'file': spool_file, 'filename': session['filename'], 'sha256': digest}},
+                student.get('juApplication', student_id),
+                student.get('studentFullName', student.get('name', 'Unknown')),
+                student_id=student_id,
+                folder_id=student.get('documentsFolder')
+            )
+        
+        uploaded_documents = upload_result.get('uploaded_documents', {})
+        if not upload_result.get('success') or not uploaded_documents:
+            finish_upload_session(sessions_collection, session, 'open')
+            failed = upload_result.get('failed_documents') or [{}]
+            return jsonify({
+                "success": False,
+                "error": upload_result.get('error') or failed[0].get('error', 'Document upload failed')
+            }), 502
+        
+        apply_document_upload_result(student_id, student.get('department', ''), upload_result)
+        document_upload = {
+            "folderId": upload_result.get('student_folder_id'),
+            "uploadedDocuments": uploaded_documents
+        }
+        finish_upload_session(sessions_collection, session, 'completed', document_upload)
+        os.remove(spool_path)
+        
+        return jsonify({"success": True, "studentId": student_id, "documentUpload": document_upload}), 200
+        
+    except Exception as e:
+        finish_upload_session(sessions_collection, session, 'open')
+        print(f"Upload finalize error: {e}")
+        return jsonify({"success": False, "error": "Internal server error"}), 500
+
+@app.cli.group('uploads')
+def uploads_command():
+    """Manage resumable document uploads."""
+
+@uploads_command.command('cleanup')
+def cleanup_uploads_command():
+    """Delete spool files of expired or completed upload sessions."""
+    spool_dir = UPLOAD_SESSION_SPOOL_DIR
+    if not os.path.isdir(spool_dir):
+        click.echo("No upload spool directory")
+        return
+    
+    upload_ids = os.listdir(spool_dir)
+    open_ids = {
+        session['_id'] for session in get_upload_sessions_collection().find(
+            {'_id': {'$in': upload_ids}, 'status': {'$ne': 'completed'}, 'expires_at': {'$gt': datetime.utcnow()}},
+            {'_id': 1}
+        )
+    }
+    removed = 0
+    for upload_id in upload_ids:
+        if upload_id not in open_ids:
+            os.remove(os.path.join(spool_dir, upload_id))
+            removed += 1
+    click.echo(f"Removed {removed} spool file(s), kept {len(open_ids)}")
+
+def apply_document_upload_result(student_id, department, upload_result, extra_fields=None):
+    """Merge process_student_documents results into a student's department record"""
+    document_update = {
+        "documentsFolder": upload_result.get('student_folder_id'),
+        "updated_at": datetime.utcnow()
+    }
+    for doc_type, file_info in upload_result.get('uploaded_documents', {}).items():
+        document_update[f"uploadedDocuments.{doc_type}"] = file_info
+        # Legacy document fields (for backward compatibility)
+        document_update[doc_type] = file_info['file_id']
+    document_update.update(extra_fields or {})
+    
+    get_department_collection(department).update_one(
+        {"student_id": student_id},
+        {"$set": document_update}
+    )
+    update_student_read_model(student_id, document_update)
+
+# Asynchronous document uploads (DOCUMENT_UPLOAD_MODE=async)
+# Registration spools the files to DOCUMENT_SPOOL_DIR and queues an
+# upload_documents job; the job worker uploads them and patches the summary
+# into the department record. Workers must share the spool directory with
+# the web processes.
+def student_spool_dir(student_id):
+    return os.path.join(DOCUMENT_SPOOL_DIR, secure_filename(student_id))
+
+def spool_student_documents(student_id, documents_data):
+    """
+    Write a registration's documents to the local spool directory.
+    
+    Returns:
+        list: Spooled documents with document type, original filename, path and SHA-256 digest
+    """
+    spool_dir = student_spool_dir(student_id)
+    os.makedirs(spool_dir, exist_ok=True)
+    spooled = []
+    for doc_type, file_info in documents_data.items():
+        if not file_info or not isinstance(file_info, dict) or doc_type not in DOCUMENT_TYPES:
+            continue
+        file_data = file_info.get('file') or file_info.get('file_data')
+        filename = file_info.get('filename')
+        if not file_data or not filename:
+            continue
+        
+        file_stream, _ = document_stream(file_data)
+        digest = stream_digest(file_stream)
+        content_hash = None if digest else hashlib.sha256()
+        path = os.path.join(spool_dir, doc_type)
+        with open(path, 'wb') as spool_file:
+            # Hash while copying when the digest was not taken on the way in
+            while True:
+                chunk = file_stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                if content_hash:
+                    content_hash.update(chunk)
+                spool_file.write(chunk)
+        spooled.append({
+            'document_type': doc_type,
+            'filename': filename,
+            'path': path,
+            'sha256': digest or content_hash.hexdigest()
+        })
+    return spooled
+
+def discard_spooled_documents(student_id):
+    shutil.rmtree(student_spool_dir(student_id), ignore_errors=True)
+
+def enqueue_document_upload(student_id, department, ju_application, student_name, spooled_documents):
+    """Queue spooled documents for the job worker"""
+    return enqueue_background_job('upload_documents', {
+        "student_id": student_id,
+        "department": department,
+        "ju_application": ju_application,
+        "student_name": student_name,
+        "documents": spooled_documents
+    })
+
+def process_queued_document_upload(payload):
+    """Job handler: upload one queued registration's documents and record the outcome on the student"""
+    student_id = payload['student_id']
+    get_department_collection(payload['department']).update_one(
+        {"student_id": student_id},
+        {"$set": {"documentUploadStatus": "processing"}}
+    )
+    
+    storage = get_document_storage()
+    if not storage:
+        raise RuntimeError("Document storage unavailable")
+    
+    open_files = []
+    try:
+        documents_data = {}
+        for document in payload['documents']:
+            spool_file = open(document['path'], 'rb')
+            open_files.append(spool_file)
+            documents_data[document['document_type']] = {
+                'file': spool_file,
+                'filename': document['filename'],
+                'sha256': document.get('sha256')
+            }
+        
+        upload_result = process_student_documents(
+            storage,
+            documents_data,
+            payload['ju_application'],
+            payload['student_name'],
+            student_id=student_id
+        )
+    finally:
+        for spool_file in open_files:
+            spool_file.close()
+    
+    if not upload_result.get('success'):
+        raise RuntimeError(upload_result.get('error', 'Document upload failed'))
+    
+    apply_document_upload_result(student_id, payload['department'], upload_result, {
+        "failedDocuments": upload_result.get('failed_documents', []),
+        "documentUploadSummary": upload_result.get('upload_summary', {}),
+        "documentUploadStatus": "completed" if not upload_result.get('failed_documents') else "completed_with_errors"
+    })
+    discard_spooled_documents(student_id)
+    print(f"Uploaded documents for {student_id}: {upload_result.get('upload_summary', {})}")
+    return {"uploadSummary": upload_result.get('upload_summary', {})}
+
+def document_upload_dead_lettered(payload, error):
+    """Dead-letter handler: show the failure on the student record, keeping the spooled files for a replay"""
+    get_department_collection(payload['department']).update_one(
+        {"student_id": payload['student_id']},
+        {"$set": {"documentUploadStatus": "failed"}}
+    )
+
 @app.route('/api/students/<student_id>/documents', methods=['GET'])
 def get_student_documents(student_id):
     try:
@@ -1317,23 +3366,30 @@ def upload_student_photo():
         students_dept_collection = get_department_collection(department)
         print(f"Updating student in department: {department}")
 
-        update_result = students_dept_collection.update_one(
+        photo_update = {
+            "has_photo": True,
+            "status": "photo_uploaded",
+            "photo_url": photo_url,
+            "updated_at": datetime.utcnow()
+        }
+        previous_record = students_dept_collection.find_one_and_update(
             {"student_id": student_id},
-            {
-                "$set": {
-                    "has_photo": True,
-                    "status": "photo_uploaded",
-                    "photo_url": photo_url,
-                    "updated_at": datetime.utcnow()
-                }
-            }
+            {"$set": photo_update},
+            projection={"status": 1, "updated_at": 1},
+            return_document=ReturnDocument.BEFORE
         )
 
-        if update_result.modified_count == 0:
+        if not previous_record:
             return jsonify({"success": False, "error": "Failed to update student record"}), 500
 
+        update_student_read_model(student_id, photo_update)
+        count_status_change(department, previous_record.get("status"), "photo_uploaded", photo_update["updated_at"],
+                            previous_record.get("updated_at"))
+
         return jsonify({"success": True, "url": photo_url}), 200
 
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         print(f"Photo upload error: {e}")
         return jsonify({"success": False, "error": "Internal server error"}), 500
@@ -1434,20 +3490,11 @@ def get_admins():
 @super_admin_required
 def get_admin_stats():
     try:
-        # Get counts by role
-        total_admins = get_admins_collection().count_documents({})
-        super_admins = get_admins_collection().count_documents({'role': 'super_admin'})
-        department_admins = get_admins_collection().count_documents({'role': 'department_admin'})
-        photo_admins = get_admins_collection().count_documents({'role': 'photo_admin'})
+        stats = stats_cache.get(('admins',), load_admin_stats)
         
         return jsonify({
             'success': True,
-            'stats': {
-                'totalAdmins': total_admins,
-                'superAdmins': super_admins,
-                'departmentAdmins': department_admins,
-                'photoAdmins': photo_admins
-            }
+            'stats': stats
         }), 200
         
     except Exception as e:
@@ -1504,6 +3551,7 @@ def create_admin():
         
         # Insert admin
         result = get_admins_collection().insert_one(new_admin)
+        count_admin_role_change(None, new_admin['role'])
         
         # Log admin creation
         get_admin_logs_collection().insert_one({
@@ -1551,6 +3599,7 @@ def delete_admin(admin_id):
         
         if result.deleted_count == 0:
             return jsonify({'success': False, 'error': 'Failed to delete admin'}), 500
+        count_admin_role_change(admin['role'], None)
         
         # Log admin deletion
         get_admin_logs_collection().insert_one({
@@ -1633,6 +3682,8 @@ def update_admin(admin_id):
             {'_id': admin_obj_id},
             {'$set': update_fields}
         )
+        if 'role' in update_fields:
+            count_admin_role_change(admin.get('role'), update_fields['role'])
         
         # Log admin update
         get_admin_logs_collection().insert_one({
@@ -1676,6 +3727,7 @@ def init_admin():
         }
         
         result = get_admins_collection().insert_one(default_admin)
+        count_admin_role_change(None, default_admin['role'])
         
         return jsonify({
             'success': True,
@@ -1695,26 +3747,20 @@ def init_admin():
 def get_department_stats(department):
     try:
         # Check if admin has access to this department
-        if request.current_admin['role'] == 'department_admin':
-            if request.current_admin.get('department') != normalize_department_name(department):
-                return jsonify({'success': False, 'error': 'Access denied'}), 403
-        elif request.current_admin['role'] != 'super_admin':
+        if not can_access_department(department):
             return jsonify({'success': False, 'error': 'Access denied'}), 403
         
         department_normalized = normalize_department_name(department)
-        students_dept_collection = get_department_collection(department)
         
-        # Get statistics
-        total_students = students_dept_collection.count_documents({})
-        pending_verification = students_dept_collection.count_documents({'status': 'photo_uploaded'})
-        completed_verification = students_dept_collection.count_documents({'status': 'verified'})
+        stats = stats_cache.get(
+            ('department', department_normalized),
+            lambda: load_department_stats(department_normalized)
+        )
         
-        # Get today's completions
-        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_completed = students_dept_collection.count_documents({
-            'status': 'verified',
-            'updated_at': {'$gte': today_start}
-        })
+        total_students = stats['totalStudents']
+        pending_verification = stats['pendingVerification']
+        completed_verification = stats['completedVerification']
+        today_completed = stats['todayCompleted']
         
         completion_rate = 0
         if total_students > 0:
@@ -1750,17 +3796,79 @@ def verify_token():
 @app.route('/api/departments', methods=['GET'])
 def get_departments():
     try:
-        # Get unique departments from students collection
-        departments = get_students_collection().distinct('department')
+        # Serve canonical department names from the cached registry
+        entries = sorted(get_department_registry()['by_key'].values(), key=lambda entry: entry['name'])
         
         return jsonify({
             'success': True,
-            'departments': departments
+            'departments': [entry['name'] for entry in entries],
+            'departmentDetails': [
+                {
+                    'name': entry['name'],
+                    'collection': entry['collection'],
+                    'displayName': entry.get('display_name', entry['name'])
+                }
+                for entry in entries
+            ]
         }), 200
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def document_link(file_id, stored_link):
+    """
+    Get a link to hand out for a stored file.
+    
+    Local storage links are signed again, as the stored ones expire, and made
+    absolute so the frontend can open them on the API host.
+    """
+    if DOCUMENT_STORAGE_BACKEND != 'local' or not file_id:
+        return stored_link
+    storage = get_document_storage()
+    link = storage.link_for(file_id) if storage else None
+    if link and has_request_context():
+        link = urljoin(request.host_url, link)
+    return link or stored_link
+
+def stored_file_owner_department(folder_id):
+    """Get the department of the student owning a storage folder, or None if no student owns it"""
+    student = get_students_collection().find_one({"documentsFolder": folder_id}, {"_id": 0, "student_id": 1})
+    if not student:
+        return None
+    entry = get_student_read_model_collection().find_one({"studentId": student['student_id']}, {"_id": 0, "department": 1})
+    return entry.get('department') if entry else None
+
+@app.route('/api/storage/files/<path:file_id>', methods=['GET'])
+def get_stored_file(file_id):
+    """
+    Serve a stored document when DOCUMENT_STORAGE_BACKEND is 'local' (the links LocalStorage hands out).
+    
+    Signed links are served until they expire. Otherwise files are served to admins who may
+    access the department of the student owning the folder; files in folders no student
+    owns are served to super admins only.
+    """
+    if DOCUMENT_STORAGE_BACKEND != 'local':
+        return jsonify({"success": False, "error": "Not found"}), 404
+    storage = get_document_storage()
+    if not storage:
+        return jsonify({"success": False, "error": "Document storage unavailable"}), 503
+    
+    if storage.verify_link(file_id, request.args.get('expires'), request.args.get('signature')):
+        return send_from_directory(storage.root, file_id)
+    return serve_stored_file_to_admin(storage, file_id)
+
+@auth_required
+def serve_stored_file_to_admin(storage, file_id):
+    """Serve a stored document to an admin allowed to see its owner's department"""
+    department = stored_file_owner_department(file_id.split('/', 1)[0])
+    if department:
+        allowed = can_access_department(department)
+    else:
+        allowed = request.current_admin['role'] == 'super_admin'
+    if not allowed:
+        return jsonify({"success": False, "error": "Access denied"}), 403
+    return send_from_directory(storage.root, file_id)
+
 # Google Drive specific routes
 @app.route('/api/google-drive/test', methods=['GET'])
 def test_google_drive():
@@ -1800,18 +3908,10 @@ def test_google_drive():
 def get_student_drive_folder(student_id):
     """Get Google Drive folder for a specific student"""
     try:
-        # Find student in main collection
-        student_record = get_students_collection().find_one({"student_id": student_id})
-        if not student_record:
-            return jsonify({"success": False, "error": "Student not found"}), 404
-        
-        # Get student from department collection
-        department = normalize_department_name(student_record['department'])
-        students_dept_collection = get_department_collection(department)
-        student = students_dept_collection.find_one({"student_id": student_id})
-        
+        # Find student's department record
+        student = find_student_record(student_id)
         if not student:
-            return jsonify({"success": False, "error": "Student not found in department"}), 404
+            return jsonify({"success": False, "error": "Student not found"}), 404
         
         folder_id = student.get('documentsFolder')
         uploaded_docs = student.get('uploadedDocuments', {})
@@ -1865,8 +3965,14 @@ def otp():
 
         otp = generate_otp()
         print(f"Generated OTP: {otp}")
-        message_id = send_otp_via_sms(user_phone, otp)
-        print("OTP sent successfully!")
+        if BACKGROUND_JOBS:
+            message_id = None
+            job_id = enqueue_background_job('send_sms', {"phone": user_phone, "otp": otp}, max_attempts=3)
+            print("OTP queued for sending")
+        else:
+            job_id = None
+            message_id = send_otp_via_sms(user_phone, otp)
+            print("OTP sent successfully!")
         otp_document = {
             "phone": user_phone,
             "otp": otp,
@@ -1880,7 +3986,8 @@ def otp():
             "success": True,
             "message": "OTP sent successfully",
             "otp": otp,  # For testing purposes, you might want to remove this in production
-            "messageId": message_id
+            "messageId": message_id,
+            "jobId": str(job_id) if job_id else None
         }), 200
     
     except Exception as e:
@@ -1936,6 +4043,8 @@ def mark():
 
     if update_result.modified_count == 0:
         return jsonify({"success": False, "error": "Failed to update attendance status"}), 500
+
+    update_student_read_model(student_id, {"attendance": status})
     return jsonify({"success": True, "message": "Attendance status updated successfully"}), 200
 
 # Add these imports at the top of your file if not already present
@@ -1951,18 +4060,10 @@ import tempfile
 def generate_admission_document(student_id):
     """Generate provisional admission document PDF for verified student"""
     try:
-        # Find student in main collection
-        student_record = get_students_collection().find_one({"student_id": student_id})
-        if not student_record:
-            return jsonify({"success": False, "error": "Student not found"}), 404
-
-        # Get student from department collection
-        department = normalize_department_name(student_record['department'])
-        students_dept_collection = get_department_collection(department)
-        student = students_dept_collection.find_one({"student_id": student_id})
-        
+        # Find student's department record
+        student = find_student_record(student_id)
         if not student:
-            return jsonify({"success": False, "error": "Student not found in department"}), 404
+            return jsonify({"success": False, "error": "Student not found"}), 404
 
         # Check if student is verified
         if student.get('status') not in ['verified', 'documents_verified']:
@@ -1977,7 +4078,7 @@ def generate_admission_document(student_id):
             return jsonify({
                 "success": True,
                 "message": "Admission slip already generated",
-                "documentUrl": student.get('admission_slip_link'),
+                "documentUrl": document_link(existing_slip, student.get('admission_slip_link')),
                 "fileId": existing_slip,
                 "generatedAt": student.get('admission_slip_generated_at'),
                 "action": "open_existing"
@@ -1991,6 +4092,16 @@ def generate_admission_document(student_id):
                 "error": "No document verification data found"
             }), 404
 
+        if BACKGROUND_JOBS:
+            job = find_active_job('generate_admission_document', student_id)
+            job_id = job['_id'] if job else enqueue_background_job('generate_admission_document', {"student_id": student_id})
+            return jsonify({
+                "success": True,
+                "message": "Admission slip generation queued",
+                "jobId": str(job_id),
+                "action": "queued"
+            }), 202
+
         # Generate PDF
         pdf_path = generate_admission_pdf(student, document_data)
         
@@ -2013,8 +4124,8 @@ def generate_admission_document(student_id):
         return jsonify({
             "success": True,
             "message": "Admission slip generated successfully",
-            "documentUrl": drive_upload_result.get('web_view_link'),
-            "downloadUrl": drive_upload_result.get('download_link'),
+            "documentUrl": document_link(drive_upload_result.get('file_id'), drive_upload_result.get('web_view_link')),
+            "downloadUrl": document_link(drive_upload_result.get('file_id'), drive_upload_result.get('download_link')),
             "fileId": drive_upload_result.get('file_id'),
             "fileName": drive_upload_result.get('file_name'),
             "generatedAt": datetime.utcnow().isoformat(),
@@ -2227,11 +4338,11 @@ def generate_admission_pdf(student, document_data):
         return None
 
 def upload_admission_pdf_to_drive(pdf_path, student):
-    """Upload generated admission PDF to Google Drive"""
+    """Upload generated admission PDF to document storage"""
     try:
-        drive_service = get_drive_service()
-        if not drive_service:
-            print("Google Drive service not available")
+        storage = get_document_storage()
+        if not storage:
+            print("Document storage not available")
             return None
 
         # Get student's existing folder or create new one
@@ -2239,28 +4350,26 @@ def upload_admission_pdf_to_drive(pdf_path, student):
         if not student_folder_id:
             ju_application = student.get('juApplication', student.get('student_id'))
             student_name = student.get('studentFullName', student.get('name', 'Unknown'))
-            student_folder_id = create_ju_application_folder(drive_service, ju_application, student_name)
+            student_folder_id = create_ju_application_folder(storage, ju_application, student_name, student.get('student_id'))
 
         if not student_folder_id:
             print("Could not create/find student folder")
             return None
 
         # Upload PDF
-        with open(pdf_path, 'rb') as pdf_file:
-            file_data = pdf_file.read()
-
         filename = f"Admission_Slip_{student.get('student_id')}.pdf"
         
-        upload_result = upload_single_document(
-            drive_service,
-            file_data,
-            filename,
-            student_folder_id,
-            'admission_slip'
-        )
+        with open(pdf_path, 'rb') as pdf_file:
+            upload_result = upload_single_document(
+                storage,
+                pdf_file,
+                filename,
+                student_folder_id,
+                'admission_slip'
+            )
 
         if upload_result.get('upload_success'):
-            print(f"PDF uploaded to Drive: {upload_result.get('web_view_link')}")
+            print(f"PDF uploaded to document storage: {upload_result.get('file_id')}")
             
             # Update student record with admission slip info
             department = normalize_department_name(student.get('department', ''))
@@ -2270,6 +4379,7 @@ def upload_admission_pdf_to_drive(pdf_path, student):
                 {"student_id": student.get('student_id')},
                 {
                     "$set": {
+                        "documentsFolder": student_folder_id,
                         "admission_slip_generated": True,
                         "admission_slip_file_id": upload_result.get('file_id'),
                         "admission_slip_link": upload_result.get('web_view_link'),
@@ -2278,6 +4388,7 @@ def upload_admission_pdf_to_drive(pdf_path, student):
                     }
                 }
             )
+            update_student_read_model(student.get('student_id'), {"documentsFolder": student_folder_id})
             
             return upload_result
         else:
@@ -2296,6 +4407,186 @@ def upload_admission_pdf_to_drive(pdf_path, student):
         except Exception as e:
             print(f"Error cleaning up temporary file: {e}")
 
+# Background jobs
+# Slow work queued in the jobs collection (see jobs.py) and run by
+# 'flask --app main jobs work'. Upload jobs are always queued in async
+# document mode; the other job types only when BACKGROUND_JOBS is enabled.
+def enqueue_background_job(job_type, payload, max_attempts=None):
+    """Queue a job for the worker, returning its ID"""
+    return enqueue_job(get_jobs_collection(), job_type, payload, max_attempts or JOB_MAX_ATTEMPTS)
+
+def find_active_job(job_type, student_id):
+    """Get a queued or running job of this type for a student, if any"""
+    return get_jobs_collection().find_one({
+        "type": job_type,
+        "payload.student_id": student_id,
+        "status": {"$in": ["queued", "running"]}
+    })
+
+def generate_id_card_job(payload):
+    """Job handler: generate a verified student's ID card"""
+    result = sendid(payload['student_id'])
+    if not result.get('success'):
+        raise RuntimeError(result.get('error', 'ID card generation failed'))
+    return {"filePath": result.get('file_path'), "format": result.get('format')}
+
+def generate_id_card_batch_job(payload):
+    """Job handler: generate ID cards for a department or a list of students"""
+    summary = generate_id_card_batch(
+        payload.get('department'), payload.get('student_ids'), payload.get('status', 'verified'),
+        renderer=payload.get('renderer')
+    )
+    result = {key: value for key, value in summary.items() if key != 'cards'}
+    result['failedCards'] = [
+        {"studentId": card['student_id'], "error": card.get('error')} for card in summary['cards'] if not card.get('success')
+    ]
+    return result
+
+def generate_admission_document_job(payload):
+    """Job handler: generate a verified student's admission slip and upload it to Drive"""
+    student = find_student_record(payload['student_id'])
+    if not student:
+        raise RuntimeError("Student not found")
+    if student.get('admission_slip_file_id') and student.get('admission_slip_link'):
+        return {"documentUrl": student.get('admission_slip_link'), "alreadyGenerated": True}
+    
+    document_data = get_documents_collection().find_one({"student_id": payload['student_id']})
+    if not document_data:
+        raise RuntimeError("No document verification data found")
+    
+    pdf_path = generate_admission_pdf(student, document_data)
+    if not pdf_path:
+        raise RuntimeError("Failed to generate PDF document")
+    
+    drive_upload_result = upload_admission_pdf_to_drive(pdf_path, student)
+    if not drive_upload_result or not drive_upload_result.get('upload_success'):
+        raise RuntimeError("Failed to upload document to Google Drive")
+    return {"documentUrl": drive_upload_result.get('web_view_link'), "fileId": drive_upload_result.get('file_id')}
+
+def send_otp_sms_job(payload):
+    """Job handler: send an OTP text message"""
+    return {"messageSid": send_otp_via_sms(payload['phone'], payload['otp'])}
+
+JOB_HANDLERS = {
+    'upload_documents': process_queued_document_upload,
+    'generate_id_card': generate_id_card_job,
+    'generate_id_card_batch': generate_id_card_batch_job,
+    'generate_admission_document': generate_admission_document_job,
+    'send_sms': send_otp_sms_job,
+}
+
+JOB_DEAD_LETTER_HANDLERS = {
+    'upload_documents': document_upload_dead_lettered,
+}
+
+def run_job_worker(job_types=(), once=False, poll_interval=2.0, fresh_connection=False):
+    """Run a job worker in this process"""
+    global _client, _db
+    if fresh_connection:
+        # Never share a MongoClient inherited from a parent process
+        _client = None
+        _db = None
+    
+    JobWorker(
+        get_jobs_collection(),
+        JOB_HANDLERS,
+        JOB_DEAD_LETTER_HANDLERS,
+        job_types=job_types or None,
+        lease_seconds=JOB_LEASE_SECONDS,
+        poll_interval=poll_interval,
+        retry_base_seconds=JOB_RETRY_BASE_SECONDS,
+        retry_max_seconds=JOB_RETRY_MAX_SECONDS
+    ).run(stop_when_idle=once)
+
+def serialize_job(job):
+    """Shape a job document for the admin API, hiding OTP codes"""
+    job = dict(job)
+    job['_id'] = str(job['_id'])
+    job['payload'] = {key: value for key, value in job.get('payload', {}).items() if key != 'otp'}
+    return job
+
+@app.cli.group('jobs')
+def jobs_command():
+    """Run and inspect background jobs."""
+
+@jobs_command.command('work')
+@click.option('--processes', default=1, show_default=True, help='Worker processes to run.')
+@click.option('--type', 'job_types', multiple=True, type=click.Choice(sorted(JOB_HANDLERS)), help='Only run these job types.')
+@click.option('--once', is_flag=True, help='Exit when no job is due.')
+@click.option('--poll-interval', default=2.0, show_default=True, help='Seconds to wait when no job is due.')
+def work_jobs_command(processes, job_types, once, poll_interval):
+    """Claim and run queued jobs."""
+    if processes <= 1:
+        run_job_worker(job_types, once, poll_interval)
+        return
+    
+    workers = [
+        multiprocessing.Process(target=run_job_worker, args=(job_types, once, poll_interval, True))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+@jobs_command.command('list')
+@click.option('--status', type=click.Choice(JOB_STATUSES))
+@click.option('--type', 'job_type')
+@click.option('--limit', default=20, show_default=True)
+def list_jobs_command(status, job_type, limit):
+    """Show job counts and the most recently updated jobs."""
+    for counted_type, statuses in sorted(job_counts(get_jobs_collection()).items()):
+        click.echo(f"{counted_type}: " + ', '.join(f"{count} {name}" for name, count in sorted(statuses.items())))
+    for job in list_jobs(get_jobs_collection(), status, job_type, limit):
+        click.echo(f"{job['_id']}  {job['type']:<28} {job['status']:<9} attempts={job['attempts']}  {job.get('last_error') or ''}")
+
+@jobs_command.command('replay')
+@click.argument('job_id')
+def replay_job_command(job_id):
+    """Queue a dead or finished job again."""
+    if not replay_job(get_jobs_collection(), job_id):
+        raise click.ClickException(f"No dead or finished job {job_id}")
+    click.echo(f"Job {job_id} queued")
+
+@app.route('/api/admin/jobs', methods=['GET'])
+@super_admin_required
+def get_jobs():
+    """List background jobs with per-type status counts"""
+    try:
+        status = request.args.get('status')
+        if status and status not in JOB_STATUSES:
+            return jsonify({'success': False, 'error': f"status must be one of: {', '.join(JOB_STATUSES)}"}), 400
+        limit = max(1, min(int(request.args.get('limit', 50)), MAX_PAGE_SIZE))
+        
+        jobs = list_jobs(get_jobs_collection(), status, request.args.get('type'), limit)
+        return jsonify({
+            'success': True,
+            'counts': job_counts(get_jobs_collection()),
+            'jobs': [serialize_job(job) for job in jobs]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/admin/jobs/<job_id>/replay', methods=['POST'])
+@super_admin_required
+def replay_background_job(job_id):
+    """Queue a dead or finished job again"""
+    try:
+        job = replay_job(get_jobs_collection(), job_id)
+        if not job:
+            return jsonify({'success': False, 'error': 'Job not found, or still queued or running'}), 404
+        return jsonify({'success': True, 'job': serialize_job(job)}), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -2309,5 +4600,9 @@ def internal_error(error):
 def bad_request(error):
     return jsonify({'success': False, 'error': 'Bad request'}), 400
 
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({'success': False, 'error': 'Request too large'}), 413
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
\ No newline at end of file
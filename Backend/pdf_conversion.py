@@ -0,0 +1,322 @@
+"""
+PowerPoint to PDF Conversion with LibreOffice
+Converts generated ID cards to PDF on servers without PowerPoint, using a
+pool of long-lived headless LibreOffice (soffice) processes.
+
+Each pool slot owns one soffice process listening on a named pipe, with
+its own user profile so the processes do not contend for a profile lock.
+A conversion borrows an idle slot, loads the presentation over UNO and
+stores it as PDF, so the several-second office startup is paid once per
+slot rather than once per card. The pool never runs more conversions than
+it has slots (one per CPU by default).
+
+A conversion that exceeds the timeout kills its soffice process; a slot
+whose process died, timed out or failed is restarted on its next use, and
+a conversion interrupted by a crash is retried once on the fresh process.
+
+The UNO bridge (the python3-uno package) is optional. Without it each slot
+runs 'soffice --convert-to pdf' per file instead, still with a warm
+per-slot profile, the same concurrency limit and the same timeout.
+"""
+
+import multiprocessing.util
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+# The UNO bridge ships with LibreOffice (python3-uno), not on PyPI
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    from com.sun.star.connection import NoConnectException
+except ImportError:
+    uno = None
+
+# Executables tried when no soffice path is configured
+SOFFICE_NAMES = ('soffice', 'libreoffice')
+
+# Export filter for presentations
+IMPRESS_PDF_FILTER = 'impress_pdf_Export'
+
+
+def find_soffice(soffice_path=None):
+    """Get the soffice executable to use, or None if LibreOffice is not installed"""
+    if soffice_path:
+        return shutil.which(soffice_path)
+    for name in SOFFICE_NAMES:
+        found = shutil.which(name)
+        if found:
+            return found
+    return None
+
+
+def _properties(**values):
+    properties = []
+    for name, value in values.items():
+        prop = PropertyValue()
+        prop.Name = name
+        prop.Value = value
+        properties.append(prop)
+    return tuple(properties)
+
+
+class SofficeProcess:
+    """One pool slot: a headless soffice process and its user profile"""
+
+    def __init__(self, soffice_path, profile_dir, start_timeout=30):
+        """
+        Args:
+            soffice_path (str): soffice executable
+            profile_dir (str): User profile directory owned by this slot
+            start_timeout (float): Seconds to wait for a new listener to accept connections
+        """
+        self.soffice_path = soffice_path
+        self.profile_dir = profile_dir
+        self.start_timeout = start_timeout
+        self.pipe_name = f"enrollex_soffice_{uuid.uuid4().hex}"
+        self.process = None
+        self.desktop = None
+        self.killed = False
+
+    def _base_args(self):
+        return [
+            self.soffice_path,
+            '--headless', '--invisible', '--nologo', '--norestore', '--nodefault', '--nolockcheck',
+            f"-env:UserInstallation={Path(self.profile_dir).as_uri()}"
+        ]
+
+    def _spawn(self, args):
+        # Own process group: the soffice launcher forks the real office process, and both must die together
+        return subprocess.Popen(
+            self._base_args() + args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+
+    def alive(self):
+        if uno is None:
+            return True
+        return self.process is not None and self.process.poll() is None and self.desktop is not None
+
+    def start(self):
+        """Start the listener and connect to it"""
+        self.killed = False
+        if uno is None:
+            return
+
+        self.process = self._spawn([f"--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"])
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            'com.sun.star.bridge.UnoUrlResolver', local_context
+        )
+        deadline = time.monotonic() + self.start_timeout
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"soffice exited with code {self.process.returncode} while starting")
+            try:
+                context = resolver.resolve(f"uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext")
+                break
+            except NoConnectException:
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"soffice did not accept connections within {self.start_timeout}s")
+                time.sleep(0.2)
+        self.desktop = context.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', context)
+        print(f"Started soffice listener {self.pipe_name} (pid {self.process.pid})")
+
+    def convert(self, ppt_path, pdf_path, timeout):
+        """Convert one presentation; the process is killed if it takes longer than timeout seconds"""
+        self.killed = False
+        if uno is None:
+            self._convert_with_cli(ppt_path, pdf_path, timeout)
+            return
+
+        timer = threading.Timer(timeout, self.kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            document = self.desktop.loadComponentFromURL(
+                Path(os.path.abspath(ppt_path)).as_uri(), '_blank', 0, _properties(Hidden=True, ReadOnly=True)
+            )
+            try:
+                document.storeToURL(Path(os.path.abspath(pdf_path)).as_uri(), _properties(FilterName=IMPRESS_PDF_FILTER))
+            finally:
+                document.close(True)
+        finally:
+            timer.cancel()
+
+    def _convert_with_cli(self, ppt_path, pdf_path, timeout):
+        # --convert-to names the output after the input, so convert into a scratch directory
+        out_dir = tempfile.mkdtemp(prefix='soffice-out-')
+        try:
+            self.process = self._spawn(['--convert-to', 'pdf', '--outdir', out_dir, os.path.abspath(ppt_path)])
+            try:
+                returncode = self.process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self.kill()
+                raise
+            finally:
+                self.process = None
+            if returncode != 0:
+                raise RuntimeError(f"soffice exited with code {returncode}")
+            converted = os.path.join(out_dir, f"{Path(ppt_path).stem}.pdf")
+            if not os.path.exists(converted):
+                raise RuntimeError("soffice produced no PDF")
+            os.replace(converted, pdf_path)
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+    def kill(self):
+        """Kill a stuck conversion's process"""
+        self.killed = True
+        self._kill_group(self.process)
+
+    @staticmethod
+    def _kill_group(process):
+        if process is not None and process.poll() is None:
+            print(f"Killing soffice process group {process.pid}")
+            try:
+                if hasattr(os, 'killpg'):
+                    os.killpg(process.pid, signal.SIGKILL)
+                else:
+                    process.kill()
+            except ProcessLookupError:
+                pass
+            process.wait()
+
+    def stop(self):
+        """Shut the listener down, killing it if it does not exit promptly"""
+        desktop, process = self.desktop, self.process
+        self.desktop = None
+        self.process = None
+        if process is None or process.poll() is not None:
+            return
+        try:
+            if desktop is not None:
+                desktop.terminate()
+            process.wait(timeout=5)
+        except Exception:
+            self._kill_group(process)
+
+
+class SofficeConverter:
+    """
+    Process-local pool of soffice slots converting presentations to PDF.
+
+    Slots are started on first use and reused until they fail. Safe to
+    use from several threads; at most max_workers conversions run at once.
+    After a fork the child starts its own slots.
+    """
+
+    def __init__(self, soffice_path, max_workers=None, timeout=120, queue_timeout=None, start_timeout=30):
+        """
+        Args:
+            soffice_path (str): soffice executable (see find_soffice)
+            max_workers (int): soffice processes, and so concurrent conversions (default: CPU count)
+            timeout (float): Seconds one conversion may take before its process is killed
+            queue_timeout (float): Seconds to wait for an idle slot (default: wait indefinitely)
+            start_timeout (float): Seconds to wait for a new listener to accept connections
+        """
+        self.soffice_path = soffice_path
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.start_timeout = start_timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._profile_root = None
+        self._slots = []
+        self._idle = None
+        # Runs at interpreter exit, including in multiprocessing workers where atexit does not
+        multiprocessing.util.Finalize(self, self.close, exitpriority=10)
+
+    def _check_process(self):
+        # Caller holds self._lock. Slots inherited through a fork belong to the parent.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._profile_root = tempfile.mkdtemp(prefix='enrollex-soffice-')
+            self._slots = [
+                SofficeProcess(self.soffice_path, os.path.join(self._profile_root, f"slot{index}"), self.start_timeout)
+                for index in range(self.max_workers)
+            ]
+            self._idle = queue.Queue()
+            for slot in self._slots:
+                self._idle.put(slot)
+
+    def convert(self, ppt_path, pdf_path):
+        """
+        Convert a presentation to PDF.
+
+        Returns:
+            bool: True if the PDF was written
+        """
+        with self._lock:
+            self._check_process()
+            idle = self._idle
+        try:
+            slot = idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            print(f"  PDF conversion error: no soffice process free within {self.queue_timeout}s")
+            return False
+
+        try:
+            for attempt in (1, 2):
+                try:
+                    if not slot.alive():
+                        slot.stop()
+                        slot.start()
+                    slot.convert(ppt_path, pdf_path, self.timeout)
+                    return True
+                except Exception as e:
+                    timed_out = slot.killed
+                    slot.stop()
+                    if timed_out:
+                        print(f"  PDF conversion timed out after {self.timeout}s")
+                        return False
+                    if attempt == 2:
+                        print(f"  PDF conversion error: {e}")
+                        return False
+                    print(f"  soffice failed ({e}), retrying on a new process")
+        finally:
+            idle.put(slot)
+
+    def close(self):
+        """Stop every soffice process started by this process"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            for slot in self._slots:
+                slot.stop()
+            if self._profile_root:
+                shutil.rmtree(self._profile_root, ignore_errors=True)
+            self._pid = None
+
+
+_converters = {}
+_converters_lock = threading.Lock()
+
+
+def get_pdf_converter(soffice_path=None, max_workers=None, timeout=120):
+    """
+    Get the shared converter for these settings.
+
+    Returns:
+        SofficeConverter: The converter, or None if LibreOffice is not installed
+    """
+    soffice_path = find_soffice(soffice_path)
+    if not soffice_path:
+        return None
+    key = (soffice_path, max_workers, timeout)
+    with _converters_lock:
+        if key not in _converters:
+            _converters[key] = SofficeConverter(soffice_path, max_workers, timeout)
+        return _converters[key]
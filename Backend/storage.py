@@ -0,0 +1,359 @@
+"""
+Document Storage Backends
+Student documents, admission slips and ID cards are stored through one
+interface with three implementations, selected by DOCUMENT_STORAGE_BACKEND:
+
+    drive - Google Drive folders under GOOGLE_DRIVE_PARENT_FOLDER_ID (default)
+    local - a directory tree on local disk, for on-prem installs and load tests
+    s3    - an S3-compatible bucket such as MinIO (requires boto3)
+
+Each student gets a folder; a folder ID is whatever the backend needs to
+find it again (a Drive folder ID, a directory name or a key prefix).
+"""
+
+import hashlib
+import hmac
+import os
+import tempfile
+import time
+from urllib.parse import quote
+
+from werkzeug.utils import secure_filename
+
+from drive_client import ANYONE_READER, execute_batch, grant_public_read as drive_grant_public_read
+
+# boto3 is only needed for the s3 backend
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+
+class DocumentStorage:
+    """
+    Interface shared by the storage backends.
+
+    upload_file returns a dict with file_id, file_name, web_view_link,
+    download_link and file_size (a string, as Drive reports it).
+    Implementations must be safe to use from several threads.
+    """
+
+    name = None
+
+    def find_or_create_folder(self, folder_name, description=''):
+        """Get the ID of the folder with this name, creating it if needed"""
+        raise NotImplementedError
+
+    def upload_file(self, folder_id, stream, filename, mime_type, description='', grant_public=True):
+        """
+        Store a file in a folder.
+
+        Args:
+            folder_id (str): Folder from find_or_create_folder
+            stream: Readable binary file object positioned at the start
+            filename (str): Name within the folder
+            mime_type (str): Content type
+            description (str): Free-text note kept with the file where supported
+            grant_public (bool): Make the file readable through its link right away
+
+        Returns:
+            dict: Stored file details
+        """
+        raise NotImplementedError
+
+    def grant_public_read(self, file_ids):
+        """
+        Make files readable through their links.
+
+        Returns:
+            list: Error message per file ID, in order; None where it succeeded
+        """
+        return [None] * len(file_ids)
+
+    def delete_files(self, folder_id, filenames):
+        """
+        Delete the files with these names from a folder.
+
+        Returns:
+            list: Names that were deleted
+        """
+        raise NotImplementedError
+
+    def read_file(self, file_id):
+        """Get a file's contents, or None if the backend serves files by link only"""
+        return None
+
+
+class DriveStorage(DocumentStorage):
+    """Google Drive, one folder per student under a parent folder"""
+
+    name = 'drive'
+
+    def __init__(self, service_factory, parent_folder_id=None):
+        """
+        Args:
+            service_factory (callable): Returns the calling thread's Drive service
+            parent_folder_id (str): Folder holding the student folders
+        """
+        self.service_factory = service_factory
+        self.parent_folder_id = parent_folder_id
+
+    def service(self):
+        return self.service_factory()
+
+    def find_or_create_folder(self, folder_name, description=''):
+        service = self.service()
+        results = service.files().list(
+            q=f"name='{folder_name}' and parents in '{self.parent_folder_id}' and mimeType='{FOLDER_MIME_TYPE}'",
+            fields="files(id, name)"
+        ).execute()
+        items = results.get('files', [])
+        if items:
+            print(f"JU Application folder already exists: {folder_name}")
+            return items[0]['id']
+
+        folder_metadata = {
+            'name': folder_name,
+            'parents': [self.parent_folder_id],
+            'mimeType': FOLDER_MIME_TYPE,
+            'description': description
+        }
+        folder = service.files().create(body=folder_metadata, fields='id').execute()
+        print(f"Created JU Application folder: {folder_name} with ID: {folder.get('id')}")
+        return folder.get('id')
+
+    def upload_file(self, folder_id, stream, filename, mime_type, description='', grant_public=True):
+        # Imported here so the other backends do not need the media helpers
+        from googleapiclient.http import MediaIoBaseUpload
+
+        service = self.service()
+        uploaded_file = service.files().create(
+            body={'name': filename, 'parents': [folder_id], 'description': description},
+            media_body=MediaIoBaseUpload(stream, mimetype=mime_type, resumable=True),
+            fields='id,name,webViewLink,webContentLink,size'
+        ).execute()
+
+        stored = {
+            'file_id': uploaded_file.get('id'),
+            'file_name': uploaded_file.get('name'),
+            'web_view_link': uploaded_file.get('webViewLink'),
+            'download_link': uploaded_file.get('webContentLink'),
+            'file_size': uploaded_file.get('size')
+        }
+        if grant_public:
+            try:
+                service.permissions().create(fileId=stored['file_id'], body=ANYONE_READER).execute()
+                stored['permission_granted'] = True
+            except Exception as perm_error:
+                print(f"Permission setting warning: {perm_error}")
+                stored['permission_granted'] = False
+                stored['permission_error'] = str(perm_error)
+        return stored
+
+    def grant_public_read(self, file_ids):
+        return drive_grant_public_read(self.service(), file_ids)
+
+    def delete_files(self, folder_id, filenames):
+        if not filenames:
+            return []
+
+        # One lookup for every name, then one batch of deletes
+        service = self.service()
+        name_query = ' or '.join(f"name='{name}'" for name in filenames)
+        existing_files = service.files().list(
+            q=f"({name_query}) and parents in '{folder_id}'",
+            fields="files(id, name)"
+        ).execute().get('files', [])
+        if not existing_files:
+            return []
+
+        delete_requests = [service.files().delete(fileId=existing_file['id']) for existing_file in existing_files]
+        deleted = []
+        for existing_file, (_, error) in zip(existing_files, execute_batch(service, delete_requests)):
+            if error:
+                print(f"Could not delete existing file {existing_file['name']}: {error}")
+            else:
+                deleted.append(existing_file['name'])
+        return deleted
+
+
+class LocalStorage(DocumentStorage):
+    """
+    Directory tree on local disk: root/<folder>/<filename>.
+
+    File IDs are paths relative to root. Links are built from base_url,
+    which should point at a route serving the root directory. With a
+    signing_key, links carry an expiry and an HMAC signature so they can
+    be opened without an Authorization header until they expire.
+    """
+
+    name = 'local'
+
+    def __init__(self, root, base_url=None, signing_key=None, link_ttl_seconds=900):
+        """
+        Args:
+            root (str): Directory holding the student folders
+            base_url (str): URL prefix for links to stored files (optional)
+            signing_key (str): Secret for signing links (optional)
+            link_ttl_seconds (int): How long a signed link stays valid
+        """
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.signing_key = signing_key.encode() if signing_key else None
+        self.link_ttl_seconds = link_ttl_seconds
+        os.makedirs(self.root, exist_ok=True)
+
+    def path_for(self, file_id):
+        """Absolute path of a file ID, refusing IDs that escape the root"""
+        path = os.path.abspath(os.path.join(self.root, file_id))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"Invalid file ID: {file_id}")
+        return path
+
+    def link_for(self, file_id):
+        if not self.base_url:
+            return None
+        link = f"{self.base_url}/{quote(file_id)}"
+        if not self.signing_key:
+            return link
+        expires = int(time.time()) + self.link_ttl_seconds
+        return f"{link}?expires={expires}&signature={self.signature_for(file_id, expires)}"
+
+    def signature_for(self, file_id, expires):
+        """HMAC of a file ID and expiry time, hex encoded"""
+        message = f"{file_id}:{expires}".encode()
+        return hmac.new(self.signing_key, message, hashlib.sha256).hexdigest()
+
+    def verify_link(self, file_id, expires, signature):
+        """
+        Check the expiry and signature query parameters of a link.
+
+        Returns:
+            bool: True if the link was signed for this file and has not expired
+        """
+        if not self.signing_key or not expires or not signature:
+            return False
+        try:
+            expires = int(expires)
+        except ValueError:
+            return False
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self.signature_for(file_id, expires), signature)
+
+    def find_or_create_folder(self, folder_name, description=''):
+        folder_id = secure_filename(folder_name)
+        os.makedirs(self.path_for(folder_id), exist_ok=True)
+        return folder_id
+
+    def upload_file(self, folder_id, stream, filename, mime_type, description='', grant_public=True):
+        file_id = f"{folder_id}/{secure_filename(filename)}"
+        path = self.path_for(file_id)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write next to the target and rename, so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                while True:
+                    chunk = stream.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    temp_file.write(chunk)
+            os.replace(temp_path, path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+
+        link = self.link_for(file_id)
+        return {
+            'file_id': file_id,
+            'file_name': os.path.basename(path),
+            'web_view_link': link,
+            'download_link': link,
+            'file_size': str(os.path.getsize(path))
+        }
+
+    def delete_files(self, folder_id, filenames):
+        deleted = []
+        for filename in filenames:
+            path = self.path_for(f"{folder_id}/{secure_filename(filename)}")
+            if os.path.exists(path):
+                os.unlink(path)
+                deleted.append(filename)
+        return deleted
+
+    def read_file(self, file_id):
+        with open(self.path_for(file_id), 'rb') as stored_file:
+            return stored_file.read()
+
+
+class S3Storage(DocumentStorage):
+    """
+    S3-compatible bucket. Folders are key prefixes, so creating one costs
+    no request. Public access is governed by the bucket policy; links are
+    built from public_base_url when it is set.
+    """
+
+    name = 's3'
+
+    def __init__(self, bucket, endpoint_url=None, prefix='', public_base_url=None, region_name=None):
+        """
+        Args:
+            bucket (str): Bucket name
+            endpoint_url (str): Endpoint for S3-compatible servers such as MinIO (default AWS)
+            prefix (str): Key prefix for every student folder
+            public_base_url (str): URL prefix for links to stored objects (optional)
+            region_name (str): Bucket region
+        """
+        if boto3 is None:
+            raise RuntimeError("The s3 storage backend requires boto3 (pip install boto3)")
+        if not bucket:
+            raise ValueError("S3_BUCKET is required for the s3 storage backend")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.public_base_url = public_base_url.rstrip('/') if public_base_url else None
+        # Credentials come from the standard AWS environment variables or config files.
+        # boto3 clients are thread-safe.
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region_name)
+
+    def link_for(self, key):
+        if not self.public_base_url:
+            return None
+        return f"{self.public_base_url}/{quote(key)}"
+
+    def find_or_create_folder(self, folder_name, description=''):
+        folder_name = secure_filename(folder_name)
+        return f"{self.prefix}/{folder_name}" if self.prefix else folder_name
+
+    def upload_file(self, folder_id, stream, filename, mime_type, description='', grant_public=True):
+        key = f"{folder_id}/{secure_filename(filename)}"
+        self.client.upload_fileobj(stream, self.bucket, key, ExtraArgs={'ContentType': mime_type})
+        size = self.client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+
+        link = self.link_for(key)
+        return {
+            'file_id': key,
+            'file_name': os.path.basename(key),
+            'web_view_link': link,
+            'download_link': link,
+            'file_size': str(size)
+        }
+
+    def delete_files(self, folder_id, filenames):
+        if not filenames:
+            return []
+        keys = [f"{folder_id}/{secure_filename(filename)}" for filename in filenames]
+        response = self.client.delete_objects(
+            Bucket=self.bucket,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+        )
+        failed = {error['Key'] for error in response.get('Errors', [])}
+        return [filename for filename, key in zip(filenames, keys) if key not in failed]
+
+    def read_file(self, file_id):
+        return self.client.get_object(Bucket=self.bucket, Key=file_id)['Body'].read()
@@ -0,0 +1,316 @@
+"""
+Unified Student Storage
+Keeps every department's student records in one collection keyed by
+department_key, with wrappers that let existing per-department code run
+against it, and an online, resumable migration from the per-department
+collections.
+
+Storage modes (STUDENT_STORAGE_MODE):
+    department   - per-department collections only (legacy)
+    dual_write   - read per-department, write both (run the backfill in this mode)
+    unified_read - read unified, write both (cut-over with a rollback path)
+    unified      - unified collection only
+"""
+
+import time
+from datetime import datetime
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+UNIFIED_COLLECTION = 'student_records'
+CHECKPOINT_COLLECTION = 'migration_checkpoints'
+MIGRATION_ID = 'unified_students'
+
+STORAGE_MODES = ('department', 'dual_write', 'unified_read', 'unified')
+
+
+class DepartmentScopedCollection:
+    """
+    View of the unified collection restricted to one department.
+    Exposes the subset of the pymongo Collection API used on department collections.
+    """
+
+    def __init__(self, collection, department_key):
+        self.collection = collection
+        self.department_key = department_key
+
+    @property
+    def name(self):
+        return self.collection.name
+
+    def _scope(self, filter_query):
+        scoped = dict(filter_query or {})
+        scoped['department_key'] = self.department_key
+        return scoped
+
+    def find_one(self, filter_query=None, *args, **kwargs):
+        return self.collection.find_one(self._scope(filter_query), *args, **kwargs)
+
+    def find(self, filter_query=None, *args, **kwargs):
+        return self.collection.find(self._scope(filter_query), *args, **kwargs)
+
+    def count_documents(self, filter_query, **kwargs):
+        return self.collection.count_documents(self._scope(filter_query), **kwargs)
+
+    def distinct(self, key, filter_query=None, **kwargs):
+        return self.collection.distinct(key, self._scope(filter_query), **kwargs)
+
+    def aggregate(self, pipeline, **kwargs):
+        return self.collection.aggregate([{'$match': self._scope({})}] + list(pipeline), **kwargs)
+
+    def insert_one(self, document, **kwargs):
+        document['department_key'] = self.department_key
+        return self.collection.insert_one(document, **kwargs)
+
+    def insert_many(self, documents, **kwargs):
+        for document in documents:
+            document['department_key'] = self.department_key
+        return self.collection.insert_many(documents, **kwargs)
+
+    def replace_one(self, filter_query, replacement, **kwargs):
+        replacement = dict(replacement)
+        replacement['department_key'] = self.department_key
+        return self.collection.replace_one(self._scope(filter_query), replacement, **kwargs)
+
+    def update_one(self, filter_query, update, **kwargs):
+        return self.collection.update_one(self._scope(filter_query), update, **kwargs)
+
+    def update_many(self, filter_query, update, **kwargs):
+        return self.collection.update_many(self._scope(filter_query), update, **kwargs)
+
+    def find_one_and_update(self, filter_query, update, **kwargs):
+        return self.collection.find_one_and_update(self._scope(filter_query), update, **kwargs)
+
+    def delete_one(self, filter_query, **kwargs):
+        return self.collection.delete_one(self._scope(filter_query), **kwargs)
+
+
+class DualWriteCollection:
+    """
+    Reads from the primary collection and mirrors writes to a secondary one.
+
+    A mirrored update that matches nothing (the record has not been
+    backfilled yet) copies the fresh primary record instead, so the
+    backfill's insert-only writes can never overwrite newer data.
+    Mirror failures are logged and never fail the request.
+    """
+
+    # Writes without a mirrored implementation below, refused rather than
+    # silently reaching the primary only
+    UNMIRRORED_WRITES = ('delete_many', 'bulk_write', 'find_one_and_replace', 'find_one_and_delete')
+
+    def __init__(self, primary, mirror):
+        self.primary = primary
+        self.mirror = mirror
+
+    def __getattr__(self, attribute):
+        if attribute in self.UNMIRRORED_WRITES:
+            raise AttributeError(f"{attribute} is not supported while dual-writing")
+        # Reads (find, find_one, count_documents, aggregate, ...) go to the primary
+        return getattr(self.primary, attribute)
+
+    def _copy_to_mirror(self, filter_query):
+        document = self.primary.find_one(filter_query)
+        if document:
+            self.mirror.replace_one({'_id': document['_id']}, document, upsert=True)
+
+    def insert_one(self, document, **kwargs):
+        result = self.primary.insert_one(document, **kwargs)
+        try:
+            self.mirror.insert_one(dict(document))
+        except Exception as e:
+            print(f"[WARNING] Dual-write insert to mirror failed: {e}")
+        return result
+
+    def _mirror_inserts(self, documents):
+        try:
+            copies = [dict(document) for document in documents]
+            if copies:
+                self.mirror.insert_many(copies, ordered=False)
+        except Exception as e:
+            print(f"[WARNING] Dual-write insert to mirror failed: {e}")
+
+    def insert_many(self, documents, **kwargs):
+        documents = list(documents)
+        try:
+            result = self.primary.insert_many(documents, **kwargs)
+        except BulkWriteError as e:
+            # Mirror the documents the primary accepted before re-raising
+            failed = {error['index'] for error in e.details.get('writeErrors', [])}
+            if kwargs.get('ordered', True):
+                inserted = documents[:min(failed)] if failed else documents
+            else:
+                inserted = [document for index, document in enumerate(documents) if index not in failed]
+            self._mirror_inserts(inserted)
+            raise
+        self._mirror_inserts(documents)
+        return result
+
+    # Upserts are never replayed on the mirror, where they would create a record
+    # with a different _id; the primary's record is copied over instead
+
+    def replace_one(self, filter_query, replacement, upsert=False, **kwargs):
+        result = self.primary.replace_one(filter_query, replacement, upsert=upsert, **kwargs)
+        try:
+            if result.upserted_id is not None:
+                self._copy_to_mirror({'_id': result.upserted_id})
+            else:
+                mirrored = self.mirror.replace_one(filter_query, replacement, **kwargs)
+                if mirrored.matched_count == 0 and result.matched_count:
+                    self._copy_to_mirror(filter_query)
+        except Exception as e:
+            print(f"[WARNING] Dual-write replace on mirror failed: {e}")
+        return result
+
+    def update_one(self, filter_query, update, upsert=False, **kwargs):
+        result = self.primary.update_one(filter_query, update, upsert=upsert, **kwargs)
+        try:
+            if result.upserted_id is not None:
+                self._copy_to_mirror({'_id': result.upserted_id})
+            else:
+                mirrored = self.mirror.update_one(filter_query, update, **kwargs)
+                if mirrored.matched_count == 0 and result.matched_count:
+                    self._copy_to_mirror(filter_query)
+        except Exception as e:
+            print(f"[WARNING] Dual-write update to mirror failed: {e}")
+        return result
+
+    def update_many(self, filter_query, update, upsert=False, **kwargs):
+        result = self.primary.update_many(filter_query, update, upsert=upsert, **kwargs)
+        try:
+            if result.upserted_id is not None:
+                self._copy_to_mirror({'_id': result.upserted_id})
+            else:
+                mirrored = self.mirror.update_many(filter_query, update, **kwargs)
+                if mirrored.matched_count < result.matched_count:
+                    # Some records are not backfilled yet; copy every matching record
+                    for document in self.primary.find(filter_query):
+                        self.mirror.replace_one({'_id': document['_id']}, document, upsert=True)
+        except Exception as e:
+            print(f"[WARNING] Dual-write update to mirror failed: {e}")
+        return result
+
+    def find_one_and_update(self, filter_query, update, upsert=False, **kwargs):
+        result = self.primary.find_one_and_update(filter_query, update, upsert=upsert, **kwargs)
+        try:
+            mirrored = self.mirror.update_one(filter_query, update)
+            if mirrored.matched_count == 0:
+                # With the default ReturnDocument.BEFORE an upsert returns None
+                self._copy_to_mirror({'_id': result['_id']} if result is not None else filter_query)
+        except Exception as e:
+            print(f"[WARNING] Dual-write update to mirror failed: {e}")
+        return result
+
+    def delete_one(self, filter_query, **kwargs):
+        result = self.primary.delete_one(filter_query, **kwargs)
+        try:
+            self.mirror.delete_one(filter_query)
+        except Exception as e:
+            print(f"[WARNING] Dual-write delete from mirror failed: {e}")
+        return result
+
+
+def migrate_department_collections(db, department_collections, batch_size=500, pause_seconds=0.0):
+    """
+    Copy per-department collections into the unified collection in batches.
+
+    Progress is checkpointed per department by _id, so an interrupted run
+    resumes where it stopped. Records are written with $setOnInsert, so a
+    record already written through dual-write is never overwritten. Run
+    this while every app process is in dual_write mode.
+
+    Args:
+        db: pymongo Database
+        department_collections (iterable): Normalized department collection names
+        batch_size (int): Records copied per bulk write
+        pause_seconds (float): Sleep between batches to limit load on the primary
+
+    Returns:
+        dict: Records copied per department in this run
+    """
+    unified = db[UNIFIED_COLLECTION]
+    checkpoints = db[CHECKPOINT_COLLECTION]
+    checkpoint = checkpoints.find_one({'_id': MIGRATION_ID}) or {}
+    progress = checkpoint.get('departments', {})
+
+    copied = {}
+    for department_key in department_collections:
+        department_progress = progress.get(department_key, {})
+        last_id = department_progress.get('last_id')
+        copied[department_key] = 0
+        print(f"Migrating {department_key} (resuming after {last_id})" if last_id else f"Migrating {department_key}")
+
+        while True:
+            query = {'_id': {'$gt': last_id}} if last_id else {}
+            batch = list(db[department_key].find(query).sort('_id', ASCENDING).limit(batch_size))
+            if not batch:
+                break
+
+            operations = []
+            for document in batch:
+                document['department_key'] = department_key
+                operations.append(UpdateOne(
+                    {'department_key': department_key, 'student_id': document.get('student_id')},
+                    {'$setOnInsert': document},
+                    upsert=True
+                ))
+            try:
+                unified.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # Duplicate keys mean the record already exists in the unified collection
+                non_duplicate_errors = [error for error in e.details.get('writeErrors', []) if error.get('code') != 11000]
+                if non_duplicate_errors:
+                    raise
+
+            last_id = batch[-1]['_id']
+            copied[department_key] += len(batch)
+            checkpoints.update_one(
+                {'_id': MIGRATION_ID},
+                {
+                    '$set': {
+                        f'departments.{department_key}.last_id': last_id,
+                        'updated_at': datetime.utcnow()
+                    },
+                    '$inc': {f'departments.{department_key}.copied': len(batch)}
+                },
+                upsert=True
+            )
+
+            if pause_seconds:
+                time.sleep(pause_seconds)
+
+        print(f"  {department_key}: {copied[department_key]} records copied")
+    return copied
+
+
+def verify_unified_migration(db, department_collections):
+    """
+    Compare each department collection with its slice of the unified collection.
+
+    Args:
+        db: pymongo Database
+        department_collections (iterable): Normalized department collection names
+
+    Returns:
+        dict: Per-department counts and student IDs missing from the unified collection
+    """
+    unified = db[UNIFIED_COLLECTION]
+    results = {}
+    for department_key in department_collections:
+        source_ids = set(db[department_key].distinct('student_id'))
+        unified_ids = set(unified.distinct('student_id', {'department_key': department_key}))
+        missing = sorted(source_ids - unified_ids)
+        results[department_key] = {
+            'source_count': len(source_ids),
+            'unified_count': len(unified_ids),
+            'missing': missing,
+            'verified': not missing
+        }
+    return results
+
+
+def reset_migration_checkpoint(db):
+    """Forget migration progress so the next run starts from the beginning"""
+    db[CHECKPOINT_COLLECTION].delete_one({'_id': MIGRATION_ID})
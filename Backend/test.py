@@ -8,6 +8,7 @@ import os
 import io
 import random
 import requests
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from faker import Faker
 from pptx import Presentation
@@ -346,8 +347,8 @@ class LocalIDCardGenerator:
                 'student_name': student_data.get('studentFullName', 'Unknown')
             }
     
-    def generate_batch_id_cards(self, count=20):
-        """Generate multiple ID cards"""
+    def generate_batch_id_cards(self, count=20, processes=None):
+        """Generate multiple ID cards, rendering them in parallel worker processes"""
         print(f"🎓 Generating {count} sample ID cards...")
         print(f"📁 Output folder: {os.path.abspath(self.output_folder)}")
         print("=" * 60)
@@ -355,23 +356,22 @@ class LocalIDCardGenerator:
         results = []
         successful = 0
         
-        for i in range(count):
-            print(f"\n📋 Generating ID Card {i+1}/{count}")
+        # Generate student data up front; cards are rendered across processes and reported in order
+        students = [self.generate_student_data(i+1) for i in range(count)]
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            card_results = pool.map(self.generate_single_id_card, students)
             
-            # Generate student data
-            student_data = self.generate_student_data(i+1)
-            print(f"Student: {student_data['studentFullName']} ({student_data['department']})")
-            
-            # Generate ID card
-            result = self.generate_single_id_card(student_data)
-            
-            if result['success']:
-                print(f"✅ ID card saved: {result['filename']}")
-                successful += 1
-            else:
-                print(f"❌ Failed: {result['error']}")
-            
-            results.append(result)
+            for i, (student_data, result) in enumerate(zip(students, card_results)):
+                print(f"\n📋 ID Card {i+1}/{count}")
+                print(f"Student: {student_data['studentFullName']} ({student_data['department']})")
+                
+                if result['success']:
+                    print(f"✅ ID card saved: {result['filename']}")
+                    successful += 1
+                else:
+                    print(f"❌ Failed: {result['error']}")
+                
+                results.append(result)
         
         print(f"\n" + "=" * 60)
         print(f"📊 GENERATION COMPLETE")
@@ -0,0 +1,132 @@
+"""
+In-process TTL Cache
+Stale-while-revalidate cache with single-flight loading: concurrent misses
+for the same key share one load, and a stale entry is served immediately
+while a single background refresh runs.
+"""
+
+import threading
+import time
+
+
+class _Flight:
+    """A load in progress that other callers can wait on"""
+
+    def __init__(self, generation):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        # Cache generation the load started in; stale once invalidate runs
+        self.generation = generation
+
+
+class StaleWhileRevalidateCache:
+    """
+    Cache of loader results keyed by any hashable key.
+
+    Entries are fresh for ttl seconds, then served stale for up to
+    stale_ttl more seconds while one background refresh runs. After that
+    the next caller loads synchronously, and concurrent callers wait for
+    that same load instead of starting their own. A load still running
+    when its key is invalidated does not store its result.
+    """
+
+    def __init__(self, ttl=5.0, stale_ttl=30.0, max_entries=1024):
+        """
+        Args:
+            ttl (float): Seconds an entry is served without refreshing
+            stale_ttl (float): Extra seconds a stale entry may be served during a refresh
+            max_entries (int): Oldest entries are evicted beyond this size
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._inflight = {}
+        # Bumped by invalidate: all keys, and per key
+        self._generation = 0
+        self._key_generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """
+        Get the cached value for key, calling loader() to fill or refresh it.
+
+        Args:
+            key: Cache key
+            loader (callable): Produces the value; exceptions propagate to every waiting caller
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, loaded_at = entry
+                age = now - loaded_at
+                if age < self.ttl:
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    if key not in self._inflight:
+                        self._start_flight(key, loader, background=True)
+                    return value
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._start_flight(key, loader, background=False)
+
+        if leader:
+            self._run_flight(key, loader, flight)
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def invalidate(self, key=None):
+        """Drop one key, or every key when key is None"""
+        with self._lock:
+            if key is None:
+                self._generation += 1
+                self._key_generations.clear()
+                self._entries.clear()
+                self._inflight.clear()
+            else:
+                self._key_generations[key] = self._key_generations.get(key, 0) + 1
+                self._entries.pop(key, None)
+                self._inflight.pop(key, None)
+
+    def _current_generation(self, key):
+        # Caller holds self._lock
+        return (self._generation, self._key_generations.get(key, 0))
+
+    def _start_flight(self, key, loader, background):
+        # Caller holds self._lock
+        flight = _Flight(self._current_generation(key))
+        self._inflight[key] = flight
+        if background:
+            threading.Thread(target=self._run_flight, args=(key, loader, flight), daemon=True).start()
+        return flight
+
+    def _run_flight(self, key, loader, flight):
+        try:
+            flight.value = loader()
+            with self._lock:
+                if flight.generation != self._current_generation(key):
+                    # Invalidated while loading; callers already waiting still get this value
+                    return
+                self._entries[key] = (flight.value, time.monotonic())
+                if len(self._entries) > self.max_entries:
+                    oldest_key = min(self._entries, key=lambda k: self._entries[k][1])
+                    self._entries.pop(oldest_key, None)
+        except Exception as e:
+            flight.error = e
+            print(f"Cache refresh failed for {key}: {e}")
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.done.set()
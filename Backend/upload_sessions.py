@@ -0,0 +1,161 @@
+"""
+Resumable Document Uploads
+Clients upload a large document in chunks: they open a session, append
+chunks at explicit byte offsets and finalize once every byte has arrived.
+Chunks are appended to a spool file on local disk; after a dropped
+connection the client asks for the received offset and resends only what
+is missing. Sessions expire through a TTL index.
+
+The spool file is hashed when the upload is finalized rather than while
+chunks arrive, since a resent chunk rewrites bytes already hashed.
+"""
+
+import hashlib
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+
+UPLOAD_SESSIONS_COLLECTION = 'upload_sessions'
+
+# Bytes read from the request per write to the spool file
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def create_upload_session(sessions_collection, student_id, document_type, filename, size, ttl_seconds=86400):
+    """
+    Open an upload session.
+
+    Args:
+        sessions_collection: Upload sessions collection
+        student_id (str): Student receiving the document
+        document_type (str): Document type key, e.g. aadhaarUpload
+        filename (str): Client's filename
+        size (int): Total size in bytes
+        ttl_seconds (int): Seconds until an unfinished session expires
+
+    Returns:
+        dict: The new session
+    """
+    now = datetime.utcnow()
+    session = {
+        '_id': uuid.uuid4().hex,
+        'student_id': student_id,
+        'document_type': document_type,
+        'filename': filename,
+        'size': size,
+        'received': 0,
+        'status': 'open',
+        'created_at': now,
+        'updated_at': now,
+        'expires_at': now + timedelta(seconds=ttl_seconds)
+    }
+    sessions_collection.insert_one(session)
+    return session
+
+
+def get_upload_session(sessions_collection, upload_id, student_id):
+    """Get a student's upload session, or None"""
+    return sessions_collection.find_one({'_id': upload_id, 'student_id': student_id})
+
+
+def received_bytes(session, spool_path):
+    """
+    Bytes safely received for a session.
+
+    The spool file can be shorter than the recorded count if it was lost
+    (e.g. the chunk went to another machine), and longer if a process died
+    between writing a chunk and recording it; the smaller value is the
+    offset the client must resume from.
+    """
+    on_disk = os.path.getsize(spool_path) if os.path.exists(spool_path) else 0
+    return min(session['received'], on_disk)
+
+
+def append_chunk(sessions_collection, session, spool_path, offset, stream, length):
+    """
+    Write a chunk at offset and record the new received count.
+
+    A chunk may start before the received offset (a resent chunk); the
+    spool file is truncated to offset first, so resending is idempotent.
+
+    Args:
+        sessions_collection: Upload sessions collection
+        session (dict): Open upload session
+        spool_path (str): Session spool file
+        offset (int): Byte offset of the chunk within the document
+        stream: Readable chunk body
+        length (int): Chunk length in bytes
+
+    Returns:
+        tuple: (accepted, received); accepted is False if offset is past the received bytes
+    """
+    received = received_bytes(session, spool_path)
+    if offset > received:
+        return False, received
+
+    os.makedirs(os.path.dirname(spool_path), exist_ok=True)
+    mode = 'r+b' if os.path.exists(spool_path) else 'w+b'
+    written = 0
+    with open(spool_path, mode) as spool_file:
+        spool_file.truncate(offset)
+        spool_file.seek(offset)
+        while written < length:
+            chunk = stream.read(min(COPY_BUFFER_SIZE, length - written))
+            if not chunk:
+                break
+            spool_file.write(chunk)
+            written += len(chunk)
+
+    received = offset + written
+    sessions_collection.update_one(
+        {'_id': session['_id'], 'status': 'open'},
+        {'$set': {'received': received, 'updated_at': datetime.utcnow()}}
+    )
+    return True, received
+
+
+def spool_digest(spool_path):
+    """Get the SHA-256 hex digest of a session's spool file"""
+    digest = hashlib.sha256()
+    with open(spool_path, 'rb') as spool_file:
+        while True:
+            chunk = spool_file.read(COPY_BUFFER_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def claim_upload_session(sessions_collection, session, stale_after_seconds=600):
+    """
+    Move a fully received session to 'finalizing' so only one request uploads it.
+
+    A session left in 'finalizing' for stale_after_seconds (its finalizing
+    request died) can be claimed again.
+
+    Returns:
+        dict: The claimed session, or None if it is being finalized or was completed
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=stale_after_seconds)
+    return sessions_collection.find_one_and_update(
+        {
+            '_id': session['_id'],
+            '$or': [
+                {'status': 'open'},
+                {'status': 'finalizing', 'updated_at': {'$lt': stale_before}}
+            ]
+        },
+        {'$set': {'status': 'finalizing', 'updated_at': datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def finish_upload_session(sessions_collection, session, status, result=None):
+    """Record the outcome of finalizing: 'completed', or 'open' again so the client can retry"""
+    sessions_collection.update_one(
+        {'_id': session['_id']},
+        {'$set': {'status': status, 'result': result, 'updated_at': datetime.utcnow()}}
+    )
@@ -138,11 +138,14 @@ export default function DepartmentAdminPage() {
 
       // Parse JSON response
       const data = await response.json();
-      
-      if (data.success) {
+
+      if (data.success && data.action === 'queued') {
+        // Generated by a background job; the slip opens directly on the next click
+        showNotification(`Admission slip for ${student.name} is being generated. Please try again in a moment.`, 'info');
+      } else if (data.success) {
         // Clear any existing info notification
         setNotification({ message: '', type: '' });
-        
+
         // Open Google Drive link in new tab
         const documentUrl = data.documentUrl;
         const printWindow = window.open(documentUrl, '_blank');
@@ -256,12 +259,24 @@ export default function DepartmentAdminPage() {
   const loadStudentsForVerification = async () => {
     setLoading(true);
     try {
-      const response = await fetch(`${API_BASE_URL}/api/students/department/${encodeURIComponent(departmentName)}/pending-verification`);
-      const data = await response.json();
-      console.log('Loaded students:', data);
+      // The listing is paginated; follow nextCursor until every page is loaded
+      const allStudents = [];
+      let cursor = null;
+      let response;
+      let data;
+      do {
+        const params = new URLSearchParams({ limit: '200' });
+        if (cursor) params.set('cursor', cursor);
+        response = await fetch(`${API_BASE_URL}/api/students/department/${encodeURIComponent(departmentName)}/pending-verification?${params}`);
+        data = await response.json();
+        if (!response.ok || !data.success) break;
+        allStudents.push(...data.students);
+        cursor = data.pagination?.nextCursor;
+      } while (cursor);
+      console.log('Loaded students:', allStudents.length);
 
       if (response.ok && data.success) {
-        const studentsList = data.students.filter(student => 
+        const studentsList = allStudents.filter(student => 
           student.status === 'photo_uploaded' 
           && student.attendance === 'present'
         );
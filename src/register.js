@@ -583,8 +583,6 @@ export default function StudentRegistration() {
     setMessage('Processing registration and uploading documents...');
 
     try {
-      // Prepare documents data for backend
-      const documentsData = {};
       const documentFields = [
         'aadhaarUpload',
         'tenthMarksheetUpload', 
@@ -596,42 +594,34 @@ export default function StudentRegistration() {
         'photographUpload'
       ];
 
-      // Convert file data for documents that are uploaded
-      documentFields.forEach(fieldName => {
-        const fileInfo = formData[fieldName];
-        if (fileInfo && fileInfo.file_data) {
-          documentsData[fieldName] = {
-            file_data: Array.from(fileInfo.file_data), // Convert Uint8Array to regular array for JSON
-            filename: fileInfo.filename,
-            file_type: fileInfo.file_type,
-            file_size: fileInfo.file_size
-          };
-        }
-      });
-
-      // Prepare registration data
-      const registrationData = {
-        ...formData,
-        documents: documentsData // Include documents for batch upload
-      };
-
-      // Remove individual file objects from main data (they're now in documents)
-      documentFields.forEach(fieldName => {
-        if (registrationData[fieldName] && typeof registrationData[fieldName] === 'object') {
-          delete registrationData[fieldName];
+      // Send form fields and documents as multipart/form-data so files travel as binary parts
+      const registrationForm = new FormData();
+      let documentCount = 0;
+      Object.entries(formData).forEach(([fieldName, value]) => {
+        if (documentFields.includes(fieldName)) {
+          if (value && value.file_data) {
+            registrationForm.append(
+              fieldName,
+              new Blob([value.file_data], { type: value.file_type }),
+              value.filename
+            );
+            documentCount += 1;
+          }
+        } else if (value !== null && value !== undefined) {
+          registrationForm.append(fieldName, value);
         }
       });
 
       console.log('Sending registration data with documents:', {
-        studentName: registrationData.studentFullName,
-        juApplication: registrationData.juApplication,
-        documentCount: Object.keys(documentsData).length
+        studentName: formData.studentFullName,
+        juApplication: formData.juApplication,
+        documentCount
       });
 
-      const response = await fetch(`${API_BASE_URL}/api/students/register`, {
+      // The browser sets the multipart Content-Type header with its boundary
+      const response = await fetch(`${API_BASE_URL}/api/students/register/multipart`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(registrationData),
+        body: registrationForm,
       });
 
       const data = await response.json();